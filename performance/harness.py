@@ -0,0 +1,42 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from skepticoin.serialization import Serializable
+
+# Shared by the profile_*.py scripts; like those, import it with the repository root as the working directory.
+
+CHAIN_TESTDATA_PATH = Path(__file__).parent.parent.joinpath("tests/testdata/chain")
+
+
+def read_testdata_blocks() -> List[bytes]:
+    """The serialized blocks in tests/testdata, in order of height."""
+    return [open(file_path, 'rb').read() for file_path in sorted(CHAIN_TESTDATA_PATH.iterdir())]
+
+
+def best_of_by_deserializer(
+    n_runs: int,
+    deserializers: List[str],
+    workloads: List[Tuple[str, Callable[[], None]]],
+) -> Dict[Tuple[str, str], float]:
+    """Runs each workload with each of the deserializers (as Serializable.deserializer) n_runs times, the deserializers
+    taking turns, and returns the best duration in seconds by (deserializer, workload description)."""
+    best: Dict[Tuple[str, str], float] = {}
+
+    original_deserializer = Serializable.deserializer
+    try:
+        for _ in range(n_runs):
+            for deserializer in deserializers:
+                Serializable.deserializer = deserializer
+
+                for description, f in workloads:
+                    started = datetime.now()
+                    f()
+                    duration = (datetime.now() - started).total_seconds()
+
+                    key = (deserializer, description)
+                    best[key] = min(best.get(key, duration), duration)
+    finally:
+        Serializable.deserializer = original_deserializer
+
+    return best
@@ -0,0 +1,37 @@
+from datetime import datetime
+from itertools import islice
+
+from skepticoin.blockstore import DefaultBlockStore
+from skepticoin.coinstate import CoinState
+from skepticoin.scripts.utils import READ_CHAIN_BATCH_SIZE
+
+# Run with: python -m pytest performance/profile_add_blocks.py -s
+
+# Compares adding the blocks in chain.db one by one (add_block_no_validation) with adding them in batches
+# (add_blocks); blocks are read from disk up front, so that only the building of the CoinState is measured.
+
+
+def report(description: str, n: int, started: datetime) -> None:
+    duration = datetime.now() - started
+    bpm = n / (duration.total_seconds() / 60)
+    print(f"{description}: {n} blocks in {duration}: {bpm:.0f} blocks per minute")
+
+
+def test_add_blocks():
+    blocks = list(DefaultBlockStore.get().read_blocks_from_disk())
+
+    started = datetime.now()
+    coinstate = CoinState.empty()
+    for block in blocks:
+        coinstate = coinstate.add_block_no_validation(block)
+    report("add_block_no_validation", len(blocks), started)
+
+    started = datetime.now()
+    coinstate = CoinState.empty()
+    iterator = iter(blocks)
+    while True:
+        batch = list(islice(iterator, READ_CHAIN_BATCH_SIZE))
+        if not batch:
+            break
+        coinstate = coinstate.add_blocks(batch)
+    report(f"add_blocks (batches of {READ_CHAIN_BATCH_SIZE})", len(blocks), started)
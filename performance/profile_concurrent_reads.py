@@ -0,0 +1,62 @@
+import os
+import tempfile
+import threading
+from datetime import datetime
+from itertools import islice
+
+from skepticoin.blockstore import BlockStore, DefaultBlockStore
+
+# Run with: python -m pytest performance/profile_concurrent_reads.py -s
+
+# N reader threads repeatedly read (the first half of) a chain while a single writer writes the second half of it, once
+# with the default journal mode (all queries share the writer's connection) and once in WAL mode (queries run on a pool
+# of read-only connections). Blocks are taken from chain.db.
+
+N_BLOCKS = 20_000
+N_READERS = 4
+WRITE_BATCH = 100
+
+
+def run(blocks, wal: bool) -> None:
+    half = len(blocks) // 2
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = BlockStore(os.path.join(directory, "chain.db"), wal=wal)
+        db.write_blocks_to_disk(blocks[1:half])  # genesis is written on creation
+
+        writing = True
+        blocks_read = [0] * N_READERS
+
+        def read(i: int) -> None:
+            while writing:
+                for _ in db.read_blocks_from_disk(0, half):
+                    blocks_read[i] += 1
+
+        readers = [threading.Thread(target=read, args=(i,)) for i in range(N_READERS)]
+        for reader in readers:
+            reader.start()
+
+        started = datetime.now()
+        for i in range(half, len(blocks), WRITE_BATCH):
+            for block in blocks[i:i + WRITE_BATCH]:
+                db.add_block_to_buffer(block)
+            db.flush_blocks_to_disk(wait=True)
+        write_duration = datetime.now() - started
+
+        writing = False
+        for reader in readers:
+            reader.join()
+        read_duration = datetime.now() - started
+
+        db.close()
+
+    print(f"wal={wal}: wrote {len(blocks) - half} blocks in {write_duration}; {N_READERS} readers read "
+          f"{sum(blocks_read)} blocks in {read_duration} "
+          f"({sum(blocks_read) / read_duration.total_seconds():.0f} blocks/s)")
+
+
+def test_concurrent_reads():
+    blocks = list(islice(DefaultBlockStore.get().read_blocks_from_disk(), N_BLOCKS))
+
+    run(blocks, wal=False)
+    run(blocks, wal=True)
@@ -0,0 +1,62 @@
+from typing import Callable, List, Tuple, Type
+
+from skepticoin.datatypes import Block, Input, Output, OutputReference, Transaction
+from skepticoin.serialization import DESERIALIZE_STREAM, DESERIALIZE_VIEW, Serializable
+from skepticoin.signing import SECP256k1PublicKey, SECP256k1Signature
+from performance.harness import best_of_by_deserializer, read_testdata_blocks
+
+# Run with: python -m pytest performance/profile_deserialization.py -s
+
+# Compares the two decoding engines of Serializable.deserialize (a BytesIO stream, or a memoryview with an offset
+# cursor) on the blocks in tests/testdata, on their (coinbase) transactions by themselves, and on a transaction with
+# N_INPUTS_OUTPUTS signed inputs and outputs. The engines take turns, and the best of N_RUNS is reported.
+
+# Sample output (YMMV); the remaining time is mostly in constructing the objects (and in hashing), not in decoding.
+# This was recorded before the view engine's Block.deserialize started leaving the transactions to be decoded on first
+# access (see profile_lazy_blocks.py), i.e. with both engines decoding the transactions:
+#
+# stream, Block.deserialize: 25000 in 0.507s: 49306 blocks per second
+# view, Block.deserialize: 25000 in 0.432s: 57928 blocks per second
+# stream, Transaction.deserialize (coinbase): 25000 in 0.281s: 89092 transactions per second
+# view, Transaction.deserialize (coinbase): 25000 in 0.231s: 107994 transactions per second
+# stream, Transaction.deserialize (10 in, 10 out): 5000 in 0.309s: 16157 transactions per second
+# view, Transaction.deserialize (10 in, 10 out): 5000 in 0.258s: 19379 transactions per second
+
+N_COPIES = 5_000
+N_INPUTS_OUTPUTS = 10
+N_RUNS = 5
+
+
+def deserialize_all(clz: Type[Serializable], serialized: List[bytes]) -> Callable[[], None]:
+    def f() -> None:
+        for data in serialized:
+            clz.deserialize(data)
+    return f
+
+
+def test_deserialization():
+    serialized_blocks = read_testdata_blocks() * N_COPIES
+    serialized_coinbase_transactions = [
+        transaction.serialize() for data in serialized_blocks for transaction in Block.deserialize(data).transactions]
+
+    serialized_transactions = [Transaction(
+        inputs=[Input(OutputReference(bytes([i]) * 32, i), SECP256k1Signature(bytes([i]) * 64))
+                for i in range(N_INPUTS_OUTPUTS)],
+        outputs=[Output(i, SECP256k1PublicKey(bytes([i]) * 64)) for i in range(N_INPUTS_OUTPUTS)],
+    ).serialize()] * N_COPIES
+
+    workloads: List[Tuple[str, Type[Serializable], List[bytes], str]] = [
+        ("Block.deserialize", Block, serialized_blocks, "blocks"),
+        ("Transaction.deserialize (coinbase)", Transaction, serialized_coinbase_transactions, "transactions"),
+        ("Transaction.deserialize (%d in, %d out)" % (N_INPUTS_OUTPUTS, N_INPUTS_OUTPUTS), Transaction,
+         serialized_transactions, "transactions"),
+    ]
+
+    best = best_of_by_deserializer(N_RUNS, [DESERIALIZE_STREAM, DESERIALIZE_VIEW], [
+        (description, deserialize_all(clz, serialized)) for description, clz, serialized, _ in workloads])
+
+    for description, _, serialized, unit in workloads:
+        for deserializer in [DESERIALIZE_STREAM, DESERIALIZE_VIEW]:
+            duration = best[(deserializer, description)]
+            print(f"{deserializer}, {description}: {len(serialized)} in {duration:.3f}s: "
+                  f"{len(serialized) / duration:.0f} {unit} per second")
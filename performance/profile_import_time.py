@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+# Run with: python -m pytest performance/profile_import_time.py -s
+
+# Measures the cold-start time of importing the modules that the scripts import (in a fresh interpreter, in an empty
+# directory), and checks that importing them doesn't open (i.e. create) the block database.
+
+MODULES = [
+    "skepticoin.scripts.version",
+    "skepticoin.networking.disk_interface",
+    "skepticoin.networking.remote_peer",
+    "skepticoin.scripts.utils",
+    "skepticoin.mining",
+]
+
+N_RUNS = 5
+
+
+def test_import_time():
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=project_dir)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for module in MODULES:
+            durations = []
+            for _ in range(N_RUNS):
+                started = datetime.now()
+                subprocess.run([sys.executable, "-c", "import " + module], cwd=directory, env=env, check=True)
+                durations.append((datetime.now() - started).total_seconds())
+
+            assert os.listdir(directory) == [], "importing %s wrote to the current directory" % module
+            print(f"import {module}: {min(durations) * 1000:.0f} ms (best of {N_RUNS})")
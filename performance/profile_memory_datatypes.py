@@ -0,0 +1,49 @@
+import gc
+import tracemalloc
+from pathlib import Path
+
+from skepticoin.datatypes import Block, Output, OutputReference
+from skepticoin.hash import sha256d
+
+# Run with: python -m pytest performance/profile_memory_datatypes.py -s
+
+# Measures the memory held per block (as deserialized, i.e. including the bytes objects for hashes, keys and signatures)
+# and per UTXO (an OutputReference -> Output entry in a dict, as deserialized), using the blocks in tests/testdata.
+
+# Sample output (YMMV), before and after the datatypes got __slots__, after deserialized blocks and transactions
+# started keeping the bytes they were read from, and after blocks' transactions started being decoded on first access
+# (which this measurement doesn't do):
+#
+# 1975 bytes per block (10000 blocks); 498 bytes per UTXO (50000 UTXOs)
+# 1651 bytes per block (10000 blocks); 464 bytes per UTXO (50000 UTXOs)
+# 1818 bytes per block (10000 blocks); 468 bytes per UTXO (50000 UTXOs)
+#  765 bytes per block (10000 blocks); 468 bytes per UTXO (50000 UTXOs)
+
+N_COPIES = 2_000
+N_UTXOS = 50_000
+
+CHAIN_TESTDATA_PATH = Path(__file__).parent.parent.joinpath("tests/testdata/chain")
+
+
+def test_memory_datatypes():
+    serialized_blocks = [open(file_path, 'rb').read() for file_path in sorted(CHAIN_TESTDATA_PATH.iterdir())]
+
+    gc.collect()
+    tracemalloc.start()
+    blocks = [Block.deserialize(data) for _ in range(N_COPIES) for data in serialized_blocks]
+    block_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    serialized_output = blocks[0].transactions[0].outputs[0].serialize()
+    serialized_output_references = [
+        OutputReference(sha256d(i.to_bytes(4, 'big')), 0).serialize() for i in range(N_UTXOS)]
+
+    gc.collect()
+    tracemalloc.start()
+    utxos = {OutputReference.deserialize(data): Output.deserialize(serialized_output)
+             for data in serialized_output_references}
+    utxo_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{block_memory / len(blocks):.0f} bytes per block ({len(blocks)} blocks); "
+          f"{utxo_memory / len(utxos):.0f} bytes per UTXO ({len(utxos)} UTXOs)")
@@ -0,0 +1,32 @@
+import tracemalloc
+from datetime import datetime
+
+from skepticoin.blockstore import DefaultBlockStore
+from skepticoin.coinstate import CoinState
+from skepticoin.params import FINALITY_DEPTH
+
+# Run with: python -m pytest performance/profile_memory_finality.py -s
+
+# Compares the memory held by a CoinState that prunes per-block state below FINALITY_DEPTH with one that keeps the
+# per-block state of every block in chain.db (a finality depth larger than the chain never prunes anything).
+
+
+def measure(finality_depth: int) -> None:
+    tracemalloc.start()
+    started = datetime.now()
+
+    coinstate = CoinState.empty(finality_depth=finality_depth)
+    for block in DefaultBlockStore.get().read_blocks_from_disk():
+        coinstate = coinstate.add_block_no_validation(block)
+
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"finality_depth={finality_depth}: {len(coinstate.unspent_transaction_outs_by_hash)} UTXO maps for "
+          f"{len(coinstate.block_by_hash)} blocks; {current / 1024 / 1024:.1f} MiB held, {peak / 1024 / 1024:.1f} MiB "
+          f"peak, in {datetime.now() - started}")
+
+
+def test_memory_finality():
+    measure(FINALITY_DEPTH)
+    measure(10 ** 9)
@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import List
+from unittest.mock import patch
+
+from skepticoin.signing import VerifiedSignatureCache
+from skepticoin.verification import SignatureCheck
+from tests.test_verification import make_signature_checks
+
+# Run with: python -m pytest performance/profile_signature_cache.py -s
+
+# Validates N_SIGNATURES (distinct) signatures N_VALIDATIONS times each, as happens to a transaction's signatures when
+# it enters the transaction pool, when the pool is cleaned up, and when the transaction is included in a block; without
+# the verified signature cache (i.e. with a cache of size 0) and with it.
+
+# Sample output (YMMV):
+#
+# without cache: 1500 validations in 0:00:03.340490: 449 validations per second; 0 hits, 1500 misses
+# with cache: 1500 validations in 0:00:01.152815: 1301 validations per second; 1000 hits, 500 misses
+
+N_SIGNATURES = 500
+N_VALIDATIONS = 3
+
+
+def validate_all(description: str, cache_size: int, signatures: List[SignatureCheck]) -> None:
+    cache = VerifiedSignatureCache(cache_size)
+    with patch("skepticoin.signing.verified_signature_cache", cache):
+        started = datetime.now()
+        for _ in range(N_VALIDATIONS):
+            for signature, public_key, message, sighash in signatures:
+                assert public_key.validate(signature, message, sighash)
+        duration = datetime.now() - started
+
+    n = N_SIGNATURES * N_VALIDATIONS
+    print(f"{description}: {n} validations in {duration}: {n / duration.total_seconds():.0f} validations per second; "
+          f"{cache.hits} hits, {cache.misses} misses")
+
+
+def test_signature_cache():
+    signatures = make_signature_checks(N_SIGNATURES)
+    validate_all("without cache", 0, signatures)
+    validate_all("with cache", N_SIGNATURES, signatures)
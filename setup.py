@@ -42,6 +42,7 @@ setup(
             'skepticoin-repl=skepticoin.scripts.repl:main',
             'skepticoin-run=skepticoin.scripts.run:main',
             'skepticoin-balance=skepticoin.scripts.balance:main',
+            'skepticoin-bootstrap=skepticoin.scripts.bootstrap:main',
         ],
     },
 
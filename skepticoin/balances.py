@@ -1,5 +1,8 @@
-from collections import namedtuple
-from typing import Dict, Iterator, List, Optional
+from __future__ import annotations
+
+from collections import namedtuple, OrderedDict
+import threading
+from typing import Iterator, List, Optional
 import immutables
 
 from skepticoin.datatypes import Block, Output, OutputReference, Transaction
@@ -89,15 +92,31 @@ def pkb_apply_block(
     return public_key_balances
 
 
+# Balances are cached per block hash (immutables.Maps share their structure, so this is cheap) and the cache is shared
+# between all CoinState versions; a balance query then only has to apply the blocks since the nearest cached ancestor.
+PUBLIC_KEY_BALANCES_CACHE_SIZE = 1000
+
+# Along the way balances are also cached at every N-th height, so that after a reorg the nearest cached ancestor is
+# never far below the fork point.
+PUBLIC_KEY_BALANCES_CHECKPOINT_INTERVAL = 100
+
+# the cache is shared between threads (like the CoinStates that share it)
+_cache_lock = threading.Lock()
+
+
 class PublicKeyBalances():
 
     def __init__(
         self,
         block_by_hash: immutables.Map[bytes, Block],
+        unspent_transaction_outs_by_hash: immutables.Map[bytes, immutables.Map[OutputReference, Output]],
+        cache: Optional[OrderedDict[bytes, immutables.Map[PublicKey, PKBalance]]] = None,
     ) -> None:
 
         self.block_by_hash = block_by_hash
-        self.cache: Dict[bytes, immutables.Map[PublicKey, PKBalance]] = {}
+        self.unspent_transaction_outs_by_hash = unspent_transaction_outs_by_hash
+        self.cache: OrderedDict[bytes, immutables.Map[PublicKey, PKBalance]] = (
+            cache if cache is not None else OrderedDict())
 
     def chain_at_hash(self, hash: bytes) -> Iterator[Block]:
         block = self.block_by_hash[hash]
@@ -108,11 +127,9 @@ class PublicKeyBalances():
             reverse_chain.append(block)
         return reversed(reverse_chain)
 
-    def public_key_balances_by_hash(self, head: Optional[bytes]) -> immutables.Map[PublicKey, PKBalance]:
-
-        if head is None:
-            return immutables.Map()
-
+    def replay_public_key_balances(self, head: bytes) -> immutables.Map[PublicKey, PKBalance]:
+        """Calculate the balances from genesis, without relying on any cached state. Checkpoints are cached along the
+        way (as in public_key_balances_by_hash), so that a later reorg doesn't need another replay from genesis."""
         public_key_balances: immutables.Map[PublicKey, PKBalance] = immutables.Map()
         unspent_transaction_outs: immutables.Map[OutputReference, Output] = immutables.Map()
 
@@ -124,9 +141,55 @@ class PublicKeyBalances():
 
             unspent_transaction_outs = uto_apply_block(unspent_transaction_outs, block)
 
+            if block.height % PUBLIC_KEY_BALANCES_CHECKPOINT_INTERVAL == 0:
+                self._set_cache(block.hash(), public_key_balances)
+
+        return public_key_balances
+
+    def public_key_balances_by_hash(self, head: Optional[bytes]) -> immutables.Map[PublicKey, PKBalance]:
+
+        if head is None:
+            return immutables.Map()
+
+        # walk back to the nearest block for which the balances are known; rolling back on reorgs comes for free
+        reverse_path: List[Block] = []
+        block_hash = head
+        while block_hash not in self.cache and block_hash != b'\x00' * 32:
+            block = self.block_by_hash[block_hash]
+            reverse_path.append(block)
+            block_hash = block.previous_block_hash
+
+        public_key_balances = self.cache.get(block_hash, immutables.Map())
+
+        for block in reversed(reverse_path):
+            if block.previous_block_hash == b'\x00' * 32:
+                unspent_transaction_outs: immutables.Map[OutputReference, Output] = immutables.Map()
+            elif block.previous_block_hash in self.unspent_transaction_outs_by_hash:
+                unspent_transaction_outs = self.unspent_transaction_outs_by_hash[block.previous_block_hash]
+            else:
+                # no unspent_transaction_outs to look up spent outputs in (e.g. for a CoinState read from a snapshot)
+                return self.replay_public_key_balances(head)
+
+            public_key_balances = pkb_apply_block(unspent_transaction_outs, public_key_balances, block)
+
+            if block.height % PUBLIC_KEY_BALANCES_CHECKPOINT_INTERVAL == 0:
+                self._set_cache(block.hash(), public_key_balances)
+
         return public_key_balances
 
+    def _set_cache(self, key: bytes, value: immutables.Map[PublicKey, PKBalance]) -> None:
+        with _cache_lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            while len(self.cache) > PUBLIC_KEY_BALANCES_CACHE_SIZE:
+                self.cache.popitem(last=False)
+
     def __getitem__(self, key: bytes) -> immutables.Map[PublicKey, PKBalance]:
-        if key not in self.cache:
-            self.cache[key] = self.public_key_balances_by_hash(key)
-        return self.cache[key]
+        with _cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        result = self.public_key_balances_by_hash(key)
+        self._set_cache(key, result)
+        return result
@@ -0,0 +1,171 @@
+"""
+An append-only store of serialized blocks, in the style of Bitcoin's blk*.dat files.
+
+Blocks are appended to segment files (blk00000.dat, blk00001.dat, ...) which are read through mmap, so that reading a
+block's bytes is a zero-copy slice of the mapping, and block bodies need not be kept in the Python heap at all. Each
+record in a segment starts with a small header (magic, block hash, height, length); the index from hash and from height
+to (segment, offset, length) is kept in memory and rebuilt from these headers when the BlockFile is opened.
+
+The files are not trusted blindly: before a block's bytes are used (e.g. for PoW chain sampling, or to read the chain
+from), get_verified checks that the header in them hashes to the block hash they're stored under, and that the
+transactions in them match the header's merkle root.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import threading
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Set
+
+from .datatypes import BlockHeader, Transaction
+from .hash import sha256d
+from .merkletree import get_merkle_root
+from .serialization import view_deserialize_vlq
+
+BLOCKFILE_MAGIC = b'SKBF'
+BLOCKFILE_SEGMENT_SIZE = 128 * 1024 * 1024  # a new segment is started once a segment exceeds this size
+
+RECORD_HEADER = struct.Struct(">4s32sII")  # magic, block hash, height, length
+
+
+class BlockLocation(NamedTuple):
+    segment: int
+    offset: int  # of the block's bytes, i.e. after the record header
+    length: int
+
+
+class BlockFile:
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.location_by_hash: Dict[bytes, BlockLocation] = {}
+        self.hashes_by_height: Dict[int, List[bytes]] = {}
+
+        # the blocks whose bytes have passed the check in get_verified
+        self.verified_hashes: Set[bytes] = set()
+
+        # mappings are created lazily, and re-created when a read goes beyond the end of the (grown) segment
+        self.mmaps: Dict[int, mmap.mmap] = {}
+
+        os.makedirs(path, exist_ok=True)
+
+        self.segment = 0
+        while os.path.isfile(self.segment_path(self.segment + 1)):
+            self.segment += 1
+
+        for segment in range(self.segment + 1):
+            self.index_segment(segment)
+
+        self.f: BinaryIO = open(self.segment_path(self.segment), "ab")
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, "blk%05d.dat" % segment)
+
+    def index_segment(self, segment: int) -> None:
+        if not os.path.isfile(self.segment_path(segment)) or os.path.getsize(self.segment_path(segment)) == 0:
+            return
+
+        with open(self.segment_path(segment), "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offset = 0
+        size = len(data)
+        try:
+            while offset + RECORD_HEADER.size <= size:
+                magic, block_hash, height, length = RECORD_HEADER.unpack_from(data, offset)
+                if magic != BLOCKFILE_MAGIC or offset + RECORD_HEADER.size + length > size:
+                    break
+
+                self.add_to_index(block_hash, height, BlockLocation(segment, offset + RECORD_HEADER.size, length))
+                offset += RECORD_HEADER.size + length
+        finally:
+            data.close()
+
+        if offset < size:
+            # a partially written record (e.g. after a crash): drop it, it will be written again.
+            with open(self.segment_path(segment), "r+b") as f:
+                f.truncate(offset)
+
+    def add_to_index(self, block_hash: bytes, height: int, location: BlockLocation) -> None:
+        self.location_by_hash[block_hash] = location
+        self.hashes_by_height.setdefault(height, []).append(block_hash)
+
+    def __contains__(self, block_hash: bytes) -> bool:
+        return block_hash in self.location_by_hash
+
+    def __len__(self) -> int:
+        return len(self.location_by_hash)
+
+    def append(self, block_hash: bytes, height: int, data: bytes) -> None:
+        with self.lock:
+            if block_hash in self.location_by_hash:
+                return
+
+            if self.f.tell() > BLOCKFILE_SEGMENT_SIZE:
+                self.f.close()
+                self.segment += 1
+                self.f = open(self.segment_path(self.segment), "ab")
+
+            offset = self.f.tell()
+            self.f.write(RECORD_HEADER.pack(BLOCKFILE_MAGIC, block_hash, height, len(data)))
+            self.f.write(data)
+            self.f.flush()
+
+            self.add_to_index(block_hash, height, BlockLocation(self.segment, offset + RECORD_HEADER.size, len(data)))
+
+    def __getitem__(self, block_hash: bytes) -> memoryview:
+        """The block's serialized bytes, as a (zero-copy) view on the mapped segment file."""
+        location = self.location_by_hash[block_hash]
+        end = location.offset + location.length
+
+        with self.lock:
+            mapping = self.mmaps.get(location.segment)
+            if mapping is None or len(mapping) < end:
+                # the previous mapping (if any) is not closed explicitly: views on it may still be in use.
+                with open(self.segment_path(location.segment), "rb") as f:
+                    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.mmaps[location.segment] = mapping
+
+        return memoryview(mapping)[location.offset:end]
+
+    def get(self, block_hash: bytes) -> Optional[memoryview]:
+        return self[block_hash] if block_hash in self.location_by_hash else None
+
+    def get_verified(self, block_hash: bytes) -> Optional[memoryview]:
+        """Like get, but None unless the header in the bytes hashes to block_hash, and the transactions (which make up
+        the rest of the bytes) hash to the header's merkle root."""
+        data = self.get(block_hash)
+        if data is None or block_hash in self.verified_hashes:
+            return data
+
+        try:
+            header, header_size = BlockHeader.view_deserialize(data, 0)
+
+            transaction_hashes = []
+            transaction_count, offset = view_deserialize_vlq(data, header_size)
+            for _ in range(transaction_count):
+                end = Transaction.view_skip(data, offset)
+                transaction_hashes.append(sha256d(data[offset:end]))
+                offset = end
+        except Exception:
+            return None
+
+        if sha256d(data[:header_size]) != block_hash or offset != len(data) or not transaction_hashes:
+            return None
+
+        if get_merkle_root(transaction_hashes) != header.summary.merkle_root_hash:
+            return None
+
+        self.verified_hashes.add(block_hash)
+        return data
+
+    def get_block_hashes_at_height(self, height: int) -> List[bytes]:
+        return list(self.hashes_by_height.get(height, []))
+
+    def close(self) -> None:
+        with self.lock:
+            self.f.close()
+            self.mmaps = {}
@@ -1,13 +1,45 @@
-from itertools import groupby
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
 import os
+from pathlib import Path
+import queue
 import sqlite3
 import threading
-from typing import Dict, Iterator, List, Optional
+from time import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 from skepticoin.datatypes import Block, BlockHeader, BlockSummary, Input, Output, OutputReference, PowEvidence, Transaction  # noqa: E501
-from skepticoin.hash import sha256d
-from skepticoin.signing import PublicKey, Signature
+from skepticoin.signing import PublicKey, SECP256k1PublicKey, SECP256k1Signature, Signature, TYPE_SECP256k1
+from .blockfile import BlockFile
 from .genesis import genesis_block_data
+from .params import FINALITY_DEPTH
+
+# read_blocks_from_disk reads this many heights' worth of blocks at a time
+READ_BLOCKS_CHUNK_SIZE = 1000
+
+# the writer thread commits up to WRITE_BATCH_SIZE blocks at a time, waiting up to WRITE_BATCH_TIMEOUT seconds for more
+# blocks to be flushed before committing; at most WRITE_QUEUE_SIZE flushes can be waiting to be written.
+WRITE_BATCH_SIZE = 1000
+WRITE_BATCH_TIMEOUT = 0.5
+WRITE_QUEUE_SIZE = 100
+
+# in WAL mode, at most this many read-only connections are opened for queries
+READ_POOL_SIZE = 4
+
+# load_inputs and load_outputs fetch (and decode) rows in batches of this size
+FETCH_BATCH_SIZE = 10_000
+
+# the writer thread brings the utxos table along by at most UTXO_UPDATE_MAX_BLOCKS blocks at a time; a utxos table that
+# is further behind (e.g. at startup, or after a bootstrap import) is brought up to date by catch_up_utxo_set, which
+# commits every UTXO_CATCH_UP_CHUNK_SIZE blocks.
+UTXO_UPDATE_MAX_BLOCKS = 2000
+UTXO_CATCH_UP_CHUNK_SIZE = 1000
+
+# get_block and get_transaction keep (at most) this many of the most recently used decoded objects
+OBJECT_CACHE_SIZE = 1000
+
+logger = logging.getLogger(__name__)
 
 
 def nullify_zeros(value: bytes) -> Optional[bytes]:
@@ -18,6 +50,27 @@ def zeroify_nulls(value: Optional[bytes]) -> bytes:
     return value if value else b'\00' * 32
 
 
+def decode_signature(data: bytes) -> Signature:
+    # SECP256k1 signatures (by far the most common kind) are fixed-width: no need for a BytesIO to deserialize those
+    if len(data) == 65 and data[:1] == TYPE_SECP256k1:
+        return SECP256k1Signature(data[1:])
+    signature: Signature = Signature.deserialize(data)
+    return signature
+
+
+def decode_public_key(data: bytes, interned: Optional[Dict[bytes, PublicKey]] = None) -> PublicKey:
+    """Like PublicKey.deserialize, but w/o BytesIO; with interned, repeated public keys are decoded only once."""
+    if interned is not None and data in interned:
+        return interned[data]
+
+    public_key = (
+        SECP256k1PublicKey(data[1:]) if len(data) == 65 and data[:1] == TYPE_SECP256k1 else PublicKey.deserialize(data))
+
+    if interned is not None:
+        interned[data] = public_key
+    return public_key
+
+
 class TransactionBuilder:
 
     def __init__(self, block_hash: bytes) -> None:
@@ -26,22 +79,62 @@ class TransactionBuilder:
         self.outputs: Dict[int, Output] = {}
 
 
+class AddressOutput(NamedTuple):
+    output_reference: OutputReference
+    value: int
+    height: int
+    spent_in: Optional[bytes]  # the hash of the spending transaction, if spent
+
+
 class BlockStore:
 
-    def __init__(self, path: str) -> None:
+    def __init__(
+        self,
+        path: str,
+        block_file_path: Optional[str] = None,
+        wal: bool = False,
+        prune_depth: Optional[int] = None,
+        read_only: bool = False,
+    ) -> None:
 
         self.lock = threading.Lock()
 
+        # in pruned mode, the relational transaction tables are emptied for blocks more than prune_depth below the
+        # highest block; those blocks remain available as serialized bytes (from the BlockFile).
+        if prune_depth is not None and block_file_path is None:
+            raise ValueError("A pruned BlockStore needs a BlockFile to keep the blocks' bytes in")
+        self.prune_depth = prune_depth
+
+        # besides the relational tables, keep each block's serialized bytes in an append-only BlockFile, which makes
+        # reading cheap and offers zero-copy access. A read-only store doesn't open the BlockFile: opening it may repair
+        # (i.e. write to) it.
+        self.block_file: Optional[BlockFile] = (
+            None if block_file_path is None or read_only else BlockFile(block_file_path))
+
+        # a read-only store never creates or changes the database (it must exist already); blocks can't be added to it
+        self.read_only = read_only
+
         is_memory: bool = path == ":memory:"
         self.is_new: bool = is_memory or not os.path.isfile(path)
 
-        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # in WAL mode, queries run on a pool of read-only connections, concurrently with writes on self.connection.
+        self.wal = wal and not is_memory and not read_only
+        self.read_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self.n_read_connections = 0
+
+        if read_only:
+            self.connection = sqlite3.connect(
+                Path(path).resolve().as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
         self.sql = self.connection.execute
 
-        self.sql("PRAGMA foreign_keys = ON")
-        self.sql("PRAGMA journal_mode = MEMORY")
-        self.sql("PRAGMA synchronous = OFF")
-        self.sql("PRAGMA page_size = 65536")
+        # (in pruned mode, inputs may refer to outputs that have been pruned)
+        self.sql("PRAGMA foreign_keys = OFF" if prune_depth is not None else "PRAGMA foreign_keys = ON")
+        if not read_only:
+            self.sql("PRAGMA journal_mode = WAL" if self.wal else "PRAGMA journal_mode = MEMORY")
+            self.sql("PRAGMA synchronous = OFF")
+            self.sql("PRAGMA page_size = 65536")
         self.sql("PRAGMA cache_size = 10000")
 
         if self.is_new and not is_memory:
@@ -49,6 +142,87 @@ class BlockStore:
         elif not is_memory:
             print("Reading blocks from " + path)
 
+        if not read_only:
+            self.create_tables()
+
+        self.path = path
+        self.write_buffer: List[Block] = []
+
+        # flushed blocks are written by a background thread (started on first use), in group commits. The queue is
+        # bounded: if the disk can't keep up, flushing blocks (i.e. the caller) is slowed down accordingly. None on the
+        # queue stops the writer thread.
+        self.write_queue: "queue.Queue[Optional[List[Block]]]" = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.writer_thread: Optional[threading.Thread] = None
+
+        # the exception that made the writer thread fail, if it did; nothing is written after it, and it's raised again
+        # from flush_blocks_to_disk and close.
+        self.write_error: Optional[Exception] = None
+
+        # decoded blocks and transactions by hash, in LRU order
+        self.object_cache: OrderedDict[bytes, Union[Block, Transaction]] = OrderedDict()
+
+        # the block to which the writer thread should bring the utxos table, once that block has been written
+        self.pending_utxo_head: Optional[bytes] = None
+
+        # the error from the writer thread's last attempt to bring the utxos table (and the address index) along, if it
+        # failed; the table is then stale, i.e. left at its previous head, until a later attempt succeeds. Unlike
+        # write_error, this doesn't stop blocks from being written.
+        self.utxo_set_error: Optional[Exception] = None
+
+        # [start_height, end_height) ranges of blocks that were found missing from the BlockFile when reading; the
+        # writer thread adds them to it (only the writer thread appends to the BlockFile).
+        self.pending_backfills: List[Tuple[int, int]] = []
+
+        # the connection is shared between the writer thread and readers on other threads (reentrant: the writer
+        # thread reads blocks while updating the utxos table)
+        self.connection_lock = threading.RLock()
+
+    def create_tables(self) -> None:
+        # the UTXO set as of the block in utxo_head, plus (for rolling back on reorgs) the outputs spent by each block
+        # that was applied to it; undo records below the finality depth are pruned. These tables are added to existing
+        # databases too, and filled on the first call to set_utxo_head.
+        self.sql('''CREATE TABLE IF NOT EXISTS utxos (
+            transaction_hash blob,
+            seq int,
+            value int,
+            public_key blob,
+            height int,
+            PRIMARY KEY(transaction_hash, seq)
+        )''')
+        self.sql('''CREATE TABLE IF NOT EXISTS utxo_undo (
+            block_hash blob,
+            block_height int,
+            transaction_hash blob,
+            seq int,
+            value int,
+            public_key blob,
+            height int
+        )''')
+        self.sql('CREATE INDEX IF NOT EXISTS utxo_undo_block_hash ON utxo_undo(block_hash)')
+        self.sql('CREATE INDEX IF NOT EXISTS utxo_undo_block_height ON utxo_undo(block_height)')
+        self.sql('CREATE TABLE IF NOT EXISTS utxo_head (block_hash blob)')
+
+        # the address index: all outputs in the chain up to utxo_head, by public key; maintained along with utxos.
+        self.sql('''CREATE TABLE IF NOT EXISTS address_index (
+            public_key blob,
+            transaction_hash blob,
+            seq int,
+            value int,
+            height int,
+            spent_in blob,
+            PRIMARY KEY(transaction_hash, seq)
+        )''')
+        self.sql('CREATE INDEX IF NOT EXISTS address_index_public_key ON address_index(public_key, spent_in)')
+
+        # the height below which the relational transaction tables have been emptied (in pruned mode)
+        self.sql('CREATE TABLE IF NOT EXISTS pruned_height (height int)')
+
+        # a random identifier of this database, by which e.g. CoinState snapshots refer to the BlockStore they came from
+        self.sql('CREATE TABLE IF NOT EXISTS store_id (id blob)')
+        if self.sql("select count(*) from store_id").fetchone()[0] == 0:
+            self.sql("insert into store_id values (?)", (os.urandom(16),))
+            self.connection.commit()
+
         if self.is_new:
 
             self.sql('''CREATE TABLE chain (
@@ -91,16 +265,31 @@ class BlockStore:
 
             self.write_blocks_to_disk([Block.deserialize(genesis_block_data)])
 
-        self.path = path
-        self.write_buffer: List[Block] = []
-
     def add_block_to_buffer(self, block: Block) -> None:
+        if self.read_only:
+            raise Exception("Can't add blocks to a read-only BlockStore")
+
         with self.lock:
             self.write_buffer.append(block)
 
     def close(self) -> None:
-        self.connection.close()
-        self.connection = None  # type: ignore
+        try:
+            self.flush_blocks_to_disk(wait=True)
+        finally:
+            with self.lock:
+                writer_thread = self.writer_thread
+                self.writer_thread = None
+
+            if writer_thread is not None:
+                self.write_queue.put(None)
+                writer_thread.join()
+
+            if self.block_file is not None:
+                self.block_file.close()
+            while not self.read_pool.empty():
+                self.read_pool.get().close()
+            self.connection.close()
+            self.connection = None  # type: ignore
 
     def write_blocks_to_disk(self, blocks: List[Block]) -> None:
 
@@ -111,9 +300,11 @@ class BlockStore:
 
         for block in blocks:
             block_hash = block.hash()
+            if self.block_file is not None:
+                self.block_file.append(block_hash, block.height, block.serialize())
+
             for transaction in block.transactions:
-                transaction_bytes = transaction.serialize()
-                transaction_hash = sha256d(transaction_bytes)
+                transaction_hash = transaction.hash()
                 transactions_param.append((
                     transaction_hash,
                     block_hash
@@ -156,57 +347,613 @@ class BlockStore:
         cur.execute('COMMIT')
         cur.close()
 
-    def flush_blocks_to_disk(self) -> None:
+    def flush_blocks_to_disk(self, wait: bool = True) -> None:
+        """Hand the buffered blocks to the writer thread; with wait=True, return only once they've been written."""
+        self.raise_write_error()
+
+        with self.lock:
+            blocks = list(self.write_buffer)
+            self.write_buffer.clear()
+
+            if blocks:
+                self.start_writer_thread()
+
+        if blocks:
+            self.write_queue.put(blocks)  # blocks while the queue is full
+
+        if wait:
+            self.write_queue.join()
+            self.raise_write_error()
+
+    def raise_write_error(self) -> None:
+        if self.write_error is not None:
+            raise self.write_error
+
+    def start_writer_thread(self) -> None:
+        # (called with self.lock held)
+        if self.writer_thread is None:
+            self.writer_thread = threading.Thread(target=self.write_loop, name="BlockStore writer", daemon=True)
+            self.writer_thread.start()
+
+    def write_loop(self) -> None:
+        while True:
+            blocks = self.write_queue.get()
+            if blocks is None:
+                self.write_queue.task_done()
+                return
+
+            n_batches = 1
+            stopping = False
+
+            # group commit: collect whatever else is flushed in the next little while, up to a maximum size
+            deadline = time() + WRITE_BATCH_TIMEOUT
+            while len(blocks) < WRITE_BATCH_SIZE and time() < deadline:
+                try:
+                    more_blocks = self.write_queue.get(timeout=max(0.0, deadline - time()))
+                except queue.Empty:
+                    break
+
+                n_batches += 1
+                if more_blocks is None:
+                    stopping = True
+                    break
+                blocks += more_blocks
+
+            try:
+                if self.write_error is None:
+                    self.write_batch(blocks)
+            except Exception as e:
+                self.write_error = e
+            finally:
+                for _ in range(n_batches):
+                    self.write_queue.task_done()
+
+            if stopping:
+                return
+
+    def write_batch(self, blocks: List[Block]) -> None:
+        with self.connection_lock:
+            # the blocks are committed first, by themselves; the maintenance that follows runs in transactions of its
+            # own, and if it fails that is logged (and rolled back), but the blocks keep being written.
+            if blocks:
+                self.write_blocks_to_disk(blocks)
+
+            try:
+                self.update_utxo_set({block.hash(): block for block in blocks})
+            except Exception:
+                logger.exception("Could not bring the UTXO set along; it is left at its previous head")
+
+            if blocks and self.prune_depth is not None:
+                try:
+                    self.prune_transactions(self.prune_depth)
+                except Exception:
+                    logger.exception("Could not prune the transaction tables")
+
+            with self.lock:
+                backfills, self.pending_backfills = self.pending_backfills, []
+            for start_height, end_height in backfills:
+                try:
+                    self.store_serialized_blocks(start_height, end_height)
+                except Exception:
+                    logger.exception("Could not add the blocks at heights [%d, %d) to the BlockFile",
+                                     start_height, end_height)
+
+    def get_pruned_height(self) -> int:
+        rows = self.query("select height from pruned_height")
+        return rows[0][0] if rows else 0
+
+    def prune_transactions(self, prune_depth: int) -> None:
+        """Empty the relational transaction tables for the blocks more than prune_depth below the highest block."""
+        pruned_height = self.get_pruned_height()
+        [(max_height,)] = self.connection.execute("select max(height) from chain").fetchall()
+        end_height = max_height - prune_depth
+
+        for start_height in range(pruned_height, end_height, READ_BLOCKS_CHUNK_SIZE):
+            chunk_end_height = min(start_height + READ_BLOCKS_CHUNK_SIZE, end_height)
+
+            # blocks that were stored before pruning was turned on may exist in the relational tables only
+            self.store_serialized_blocks(start_height, chunk_end_height)
+
+            parameters = (start_height, chunk_end_height)
+            cur = self.connection.cursor()
+            cur.execute('BEGIN TRANSACTION')
+            try:
+                for table in ["transaction_inputs", "transaction_outputs"]:
+                    cur.execute("""delete from %s where transaction_hash in (
+                                       select t.transaction_hash from transaction_locator t
+                                       join chain c on t.block_hash = c.block_hash
+                                       where c.height >= ? and c.height < ?)""" % table, parameters)
+                cur.execute("""delete from transaction_locator where block_hash in (
+                                   select block_hash from chain where height >= ? and height < ?)""", parameters)
+                cur.execute("delete from pruned_height")
+                cur.execute("insert into pruned_height values (?)", (chunk_end_height,))
+                cur.execute('COMMIT')
+            except Exception:
+                cur.execute('ROLLBACK')
+                raise
+            finally:
+                cur.close()
+
+    def store_serialized_blocks(self, start_height: int, end_height: int) -> None:
+        """Make sure that the blocks at heights [start_height, end_height) are in the BlockFile."""
+        assert self.block_file is not None
+        block_file = self.block_file
+
+        block_hashes = [block_hash for (block_hash,) in self.query(
+            "select block_hash from chain where height >= ? and height < ?", (start_height, end_height))]
+        if all(block_hash in block_file for block_hash in block_hashes):
+            return
+
+        for block in self.read_relational_block_range(start_height, end_height):
+            block_file.append(block.hash(), block.height, block.serialize())
+
+    def set_utxo_head(self, block_hash: bytes) -> None:
+        """Have the writer thread bring the utxos table to the given block (as soon as that block has been written)."""
+        if self.read_only:
+            return
+
+        with self.lock:
+            self.pending_utxo_head = block_hash
+
+            self.start_writer_thread()
+
+        self.write_queue.put([])  # wakes up the writer thread
+
+    def request_backfill(self, start_height: int, end_height: int) -> None:
+        """Have the writer thread add the blocks at heights [start_height, end_height) to the BlockFile."""
+        with self.lock:
+            self.pending_backfills.append((start_height, end_height))
+            self.start_writer_thread()
+
+        try:
+            self.write_queue.put_nowait([])  # wakes up the writer thread
+        except queue.Full:
+            pass  # the writer thread is busy, and will get to the backfill after its current batch
+
+    def get_utxo_head(self) -> Optional[bytes]:
+        rows = self.query("select block_hash from utxo_head")
+        return rows[0][0] if rows else None
+
+    def get_unspent_output(self, output_reference: OutputReference) -> Optional[Output]:
+        """The output, if it is unspent as of the utxo head; None if it was spent (or never existed)."""
+        rows = self.query("select value, public_key from utxos where transaction_hash = ? and seq = ?",
+                          (output_reference.hash, output_reference.index))
+        return Output(rows[0][0], decode_public_key(rows[0][1])) if rows else None
+
+    def is_unspent(self, output_reference: OutputReference) -> bool:
+        return self.get_unspent_output(output_reference) is not None
+
+    def get_address_history(self, public_key: PublicKey) -> List[AddressOutput]:
+        """All outputs to public_key in the chain up to the utxo head, spent or not, in order of height."""
+        return [
+            AddressOutput(OutputReference(transaction_hash, seq), value, height, spent_in)
+            for (transaction_hash, seq, value, height, spent_in) in self.query(
+                """select transaction_hash, seq, value, height, spent_in from address_index
+                   where public_key = ? order by height, rowid""", (public_key.serialize(),))
+        ]
+
+    def get_address_unspent_outputs(self, public_key: PublicKey) -> List[AddressOutput]:
+        return [output for output in self.get_address_history(public_key) if output.spent_in is None]
+
+    def get_address_balances(self, public_keys: Iterable[PublicKey]) -> Dict[PublicKey, int]:
+        """The balance of each of the public_keys as of the utxo head, using one indexed query per 500 keys."""
+        with self.read_transaction() as connection:
+            return self._get_address_balances(connection, public_keys)
+
+    def get_address_balances_at(
+            self, public_keys: Iterable[PublicKey], block_hash: bytes) -> Optional[Dict[PublicKey, int]]:
+        """Like get_address_balances, but None unless the utxo head is block_hash; the utxo head and the balances are
+        read in a single read transaction, so the writer thread can't move the head in between."""
+        with self.read_transaction() as connection:
+            rows = connection.execute("select block_hash from utxo_head").fetchall()
+            if not rows or rows[0][0] != block_hash:
+                return None
+            return self._get_address_balances(connection, public_keys)
+
+    def _get_address_balances(
+            self, connection: sqlite3.Connection, public_keys: Iterable[PublicKey]) -> Dict[PublicKey, int]:
+        balances = {public_key: 0 for public_key in public_keys}
+        by_serialized = {public_key.serialize(): public_key for public_key in balances}
+        keys = list(by_serialized)
+
+        for i in range(0, len(keys), 500):  # stay below SQLite's limit on the number of parameters
+            chunk = tuple(keys[i:i + 500])
+            for (public_key, balance) in connection.execute(
+                    """select public_key, sum(value) from address_index
+                       where public_key in (%s) and spent_in is null
+                       group by public_key""" % ",".join("?" * len(chunk)), chunk):
+                balances[by_serialized[public_key]] = balance
+
+        return balances
+
+    def get_address_balance(self, public_key: PublicKey) -> int:
+        return self.get_address_balances([public_key])[public_key]
+
+    def get_store_id(self) -> Optional[bytes]:
+        """None for a (read-only opened) database from before store ids existed."""
+        try:
+            rows = self.query("select id from store_id")
+        except sqlite3.OperationalError:
+            return None
+        return rows[0][0] if rows else None
+
+    def has_block(self, block_hash: bytes) -> bool:
+        return len(self.query("select 1 from chain where block_hash = ?", (block_hash,))) > 0
+
+    def get_height_and_previous_block_hash(self, block_hash: bytes) -> Tuple[int, Optional[bytes]]:
+        """Raises ValueError if the block hasn't been written."""
+        [(height, previous_block_hash)] = self.connection.execute(
+            "select height, previous_block_hash from chain where block_hash = ?", (block_hash,)).fetchall()
+        return height, previous_block_hash
+
+    def get_current_utxo_head(self) -> Optional[bytes]:
+        # like get_utxo_head, but on self.connection, i.e. including the writer thread's uncommitted changes
+        rows = self.connection.execute("select block_hash from utxo_head").fetchall()
+        return rows[0][0] if rows else None
+
+    def find_utxo_path(
+            self, block_hash: bytes, max_blocks: Optional[int] = None) -> Optional[Tuple[List[bytes], List[bytes]]]:
+        """
+        The blocks to disconnect from the utxos table (in that order), and those to connect to it (idem), to bring it
+        from its current head to block_hash; None if block_hash (or one of its ancestors) hasn't been written (yet), or
+        if that's more than max_blocks blocks.
+        """
+        current = self.get_current_utxo_head()
+        target: Optional[bytes] = block_hash
+
+        def lookup(h: Optional[bytes]) -> Tuple[int, Optional[bytes]]:
+            return (-1, None) if h is None else self.get_height_and_previous_block_hash(h)
+
+        to_disconnect: List[bytes] = []
+        to_connect: List[bytes] = []
+
+        try:
+            current_height, current_previous = lookup(current)
+            target_height, target_previous = lookup(target)
+
+            while current != target:
+                if max_blocks is not None and len(to_connect) + len(to_disconnect) >= max_blocks:
+                    return None
+
+                if target_height >= current_height:
+                    to_connect.append(target)  # type: ignore
+                    target = target_previous
+                    target_height, target_previous = lookup(target)
+                else:
+                    to_disconnect.append(current)  # type: ignore
+                    current = current_previous
+                    current_height, current_previous = lookup(current)
+
+        except ValueError:
+            return None
+
+        return to_disconnect, list(reversed(to_connect))
+
+    def load_block(self, block_hash: bytes, known_blocks: Dict[bytes, Block]) -> Block:
+        block = known_blocks.get(block_hash) or self.get_block(block_hash)
+        assert block is not None  # it was found in the chain table
+        return block
+
+    def update_utxo_set(self, known_blocks: Dict[bytes, Block]) -> None:
+        """Bring the utxos table to pending_utxo_head, if that block has been written. Called on the writer thread."""
         with self.lock:
-            if (len(self.write_buffer)):
-                self.write_blocks_to_disk(self.write_buffer)
-                self.write_buffer.clear()
+            target = self.pending_utxo_head
+
+        if target is None:
+            return
+
+        path = self.find_utxo_path(target, max_blocks=UTXO_UPDATE_MAX_BLOCKS)
+        if path is None:
+            # not written yet (tried again after the next write), or too far off: that's for catch_up_utxo_set
+            return
+
+        to_disconnect, to_connect = path
+        try:
+            self.move_utxo_head(
+                [self.load_block(block_hash, known_blocks) for block_hash in to_disconnect],
+                [self.load_block(block_hash, known_blocks) for block_hash in to_connect],
+                target)
+            error: Optional[Exception] = None
+        except Exception as e:
+            # e.g. a block that spends an output that's not in the UTXO set (blocks aren't all validated in-coinstate)
+            error = e
+
+        with self.lock:
+            # (after a failure, this target is not tried again: that's up to the next call to set_utxo_head)
+            if self.pending_utxo_head == target:
+                self.pending_utxo_head = None
+            self.utxo_set_error = error
+
+        if error is not None:
+            raise error
+
+    def catch_up_utxo_set(self, block_hash: bytes, verbose: bool = False) -> None:
+        """
+        Bring the utxos table forward to block_hash, UTXO_CATCH_UP_CHUNK_SIZE blocks (and one transaction) at a time.
+        This is for when it's far behind, e.g. empty, which is too much for the writer thread; it's a no-op unless
+        block_hash descends from the current utxo head.
+        """
+        if self.read_only:
+            return
+
+        with self.connection_lock:
+            head = self.get_current_utxo_head()
+            head_height = -1 if head is None else self.get_height_and_previous_block_hash(head)[0]
+
+            # the chain from (just above) the utxo head to block_hash, in a single query
+            path = self.connection.execute(
+                """with recursive path(block_hash, previous_block_hash, height) as (
+                       select block_hash, previous_block_hash, height from chain where block_hash = ?
+                       union all
+                       select c.block_hash, c.previous_block_hash, c.height
+                       from chain c join path p on c.block_hash = p.previous_block_hash
+                       where c.height > ?)
+                   select block_hash, previous_block_hash, height from path order by height""",
+                (block_hash, head_height)).fetchall()
+
+        if not path or path[0][1] != head:
+            return
+
+        verbose = verbose and len(path) > UTXO_CATCH_UP_CHUNK_SIZE  # i.e. when it takes a while
+
+        for i in range(0, len(path), UTXO_CATCH_UP_CHUNK_SIZE):
+            chunk = path[i:i + UTXO_CATCH_UP_CHUNK_SIZE]
+            chunk_hashes = {chunk_block_hash for (chunk_block_hash, _, _) in chunk}
+            start_height, end_height = chunk[0][2], chunk[-1][2] + 1
+
+            # (read_block_range also yields the blocks at these heights that aren't on the path)
+            blocks = [block for block in self.read_block_range(start_height, end_height)
+                      if block.hash() in chunk_hashes]
+
+            with self.connection_lock:
+                if self.get_current_utxo_head() != chunk[0][1]:
+                    return  # moved by the writer thread in the meantime
+
+                self.move_utxo_head([], blocks, chunk[-1][0])
+
+            if verbose:
+                print("UTXO set brought up to height %d of %d" % (end_height - 1, path[-1][2]))
+
+    def move_utxo_head(self, to_disconnect: List[Block], to_connect: List[Block], target: bytes) -> None:
+        """Disconnect and connect the blocks (in that order), making target the utxo head, in a single transaction."""
+        cur = self.connection.cursor()
+        cur.execute('BEGIN TRANSACTION')
+        try:
+            for block in to_disconnect:
+                self.disconnect_block(cur, block)
+
+            for block in to_connect:
+                self.connect_block(cur, block)
+
+            cur.execute("delete from utxo_head")
+            cur.execute("insert into utxo_head values (?)", (target,))
+
+            target_height, _ = self.get_height_and_previous_block_hash(target)
+            cur.execute("delete from utxo_undo where block_height < ?", (target_height - FINALITY_DEPTH,))
+            cur.execute('COMMIT')
+        except Exception:
+            cur.execute('ROLLBACK')
+            raise
+        finally:
+            cur.close()
+
+    def connect_block(self, cur: sqlite3.Cursor, block: Block) -> None:
+        block_hash = block.hash()
+
+        for i, transaction in enumerate(block.transactions):
+            if i > 0:  # the coinbase transaction spends nothing
+                for input in transaction.inputs:
+                    key = (input.output_reference.hash, input.output_reference.index)
+                    rows = cur.execute(
+                        "select value, public_key, height from utxos where transaction_hash = ? and seq = ?",
+                        key).fetchall()
+                    if not rows:
+                        raise Exception("Output spent in block %s is not in the UTXO set" % block_hash.hex())
+
+                    cur.execute("insert into utxo_undo values (?,?,?,?,?,?,?)",
+                                (block_hash, block.height) + key + rows[0])
+                    cur.execute("delete from utxos where transaction_hash = ? and seq = ?", key)
+                    cur.execute("update address_index set spent_in = ? where transaction_hash = ? and seq = ?",
+                                (transaction.hash(),) + key)
+
+            transaction_hash = transaction.hash()
+            outputs_param = [
+                (transaction_hash, seq, output.value, output.public_key.serialize(), block.height)
+                for seq, output in enumerate(transaction.outputs)
+            ]
+            cur.executemany("insert into utxos values (?,?,?,?,?)", outputs_param)
+            cur.executemany("""insert into address_index (transaction_hash, seq, value, public_key, height)
+                               values (?,?,?,?,?)""", outputs_param)
+
+    def disconnect_block(self, cur: sqlite3.Cursor, block: Block) -> None:
+        block_hash = block.hash()
+
+        # the spent outputs are restored first: outputs that were both created and spent in this block are then removed
+        # along with the rest of the block's outputs.
+        cur.execute("""insert into utxos select transaction_hash, seq, value, public_key, height
+                       from utxo_undo where block_hash = ?""", (block_hash,))
+        cur.execute("""update address_index set spent_in = null where (transaction_hash, seq) in
+                       (select transaction_hash, seq from utxo_undo where block_hash = ?)""", (block_hash,))
+        cur.execute("delete from utxo_undo where block_hash = ?", (block_hash,))
+
+        transaction_hashes = [(transaction.hash(),) for transaction in block.transactions]
+        cur.executemany("delete from utxos where transaction_hash = ?", transaction_hashes)
+        cur.executemany("delete from address_index where transaction_hash = ?", transaction_hashes)
+
+    @contextmanager
+    def read_connection(self) -> Iterator[sqlite3.Connection]:
+        if not self.wal:
+            with self.connection_lock:
+                yield self.connection
+            return
+
+        try:
+            connection = self.read_pool.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_open = self.n_read_connections < READ_POOL_SIZE
+                if can_open:
+                    self.n_read_connections += 1
+
+            if can_open:
+                uri = Path(self.path).resolve().as_uri() + "?mode=ro"
+                connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            else:
+                connection = self.read_pool.get()
+
+        try:
+            yield connection
+        finally:
+            self.read_pool.put(connection)
+
+    @contextmanager
+    def read_transaction(self) -> Iterator[sqlite3.Connection]:
+        """A read connection on which all queries see the same snapshot of the database."""
+        with self.read_connection() as connection:
+            if not self.wal:
+                # (the connection lock is held throughout, so nothing is written in the meantime)
+                yield connection
+                return
+
+            connection.execute("BEGIN")
+            try:
+                yield connection
+            finally:
+                connection.execute("COMMIT")
 
-    def load_transaction_builders(self) -> Dict[bytes, TransactionBuilder]:
+    def query(self, sql: str, parameters: Tuple[Any, ...] = ()) -> List[Any]:
+        """Run a (read-only) query; in WAL mode, this doesn't have to wait for writes to finish."""
+        with self.read_connection() as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+    def query_batches(self, sql: str, parameters: Tuple[Any, ...] = ()) -> Iterator[List[Any]]:
+        """Like query, but yields the rows in batches of FETCH_BATCH_SIZE."""
+        with self.read_connection() as connection:
+            cursor = connection.execute(sql, parameters)
+            while True:
+                rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not rows:
+                    break
+                yield rows
+
+    def load_transaction_builders(self, start_height: int, end_height: int) -> Dict[bytes, TransactionBuilder]:
+        # ordered by rowid, i.e. in the order in which the transactions were written (which is their order in the block)
         return {
-            row[0]: TransactionBuilder(row[1]) for row in self.sql(
-                "select transaction_hash, block_hash from transaction_locator"
+            row[0]: TransactionBuilder(row[1]) for row in self.query(
+                """select t.transaction_hash, t.block_hash
+                   from transaction_locator t join chain c on t.block_hash = c.block_hash
+                   where c.height >= ? and c.height < ?
+                   order by t.rowid""", (start_height, end_height)
             )
         }
 
-    def load_inputs(self, transaction_builders: Dict[bytes, TransactionBuilder]) -> None:
-        for row in self.sql("""
-                    select output_reference_hash, output_reference_index, signature, transaction_hash, seq
-                    from transaction_inputs"""):
-            (output_reference_hash, output_reference_index, signature, transaction_hash, seq) = row
-            transaction_builders[transaction_hash].inputs[seq] = Input(
-                    OutputReference(zeroify_nulls(output_reference_hash), output_reference_index),
-                    Signature.deserialize(signature) if signature else None
-            )
+    def load_inputs(
+            self, transaction_builders: Dict[bytes, TransactionBuilder], start_height: int, end_height: int) -> None:
+        # rows are fetched in batches, and each batch is decoded column by column
+        for rows in self.query_batches("""
+                    select i.output_reference_hash, i.output_reference_index, i.signature, i.transaction_hash, i.seq
+                    from transaction_inputs i
+                    join transaction_locator t on i.transaction_hash = t.transaction_hash
+                    join chain c on t.block_hash = c.block_hash
+                    where c.height >= ? and c.height < ?""", (start_height, end_height)):
+            (output_reference_hashes, output_reference_indexes, signatures, transaction_hashes, seqs) = zip(*rows)
 
-    def load_outputs(self, transaction_builders: Dict[bytes, TransactionBuilder]) -> None:
-        for row in self.sql("select value, public_key, transaction_hash, seq from transaction_outputs"):
-            (value, public_key, transaction_hash, seq) = row
-            transaction_builders[transaction_hash].outputs[seq] = Output(value, PublicKey.deserialize(public_key))
+            output_references = [OutputReference(zeroify_nulls(hash), index)
+                                 for (hash, index) in zip(output_reference_hashes, output_reference_indexes)]
+            decoded_signatures = [decode_signature(signature) if signature else None for signature in signatures]
 
-    def read_blocks_from_disk(self) -> Iterator[Block]:
+            for transaction_hash, seq, output_reference, signature in zip(
+                    transaction_hashes, seqs, output_references, decoded_signatures):
+                transaction_builders[transaction_hash].inputs[seq] = Input(output_reference, signature)
 
-        transaction_builders = self.load_transaction_builders()
+    def load_outputs(
+            self, transaction_builders: Dict[bytes, TransactionBuilder], start_height: int, end_height: int) -> None:
+        interned: Dict[bytes, PublicKey] = {}
 
-        self.load_inputs(transaction_builders)
+        for rows in self.query_batches("""
+                    select o.value, o.public_key, o.transaction_hash, o.seq
+                    from transaction_outputs o
+                    join transaction_locator t on o.transaction_hash = t.transaction_hash
+                    join chain c on t.block_hash = c.block_hash
+                    where c.height >= ? and c.height < ?""", (start_height, end_height)):
+            (values, public_keys, transaction_hashes, seqs) = zip(*rows)
 
-        self.load_outputs(transaction_builders)
+            decoded_public_keys = [decode_public_key(public_key, interned) for public_key in public_keys]
 
-        block_builders = {
-            block_hash: list(builder_tuples)
-            for block_hash, builder_tuples
-            in groupby(transaction_builders.items(), lambda item: item[1].block_hash)
-        }
+            for transaction_hash, seq, value, public_key in zip(transaction_hashes, seqs, values, decoded_public_keys):
+                transaction_builders[transaction_hash].outputs[seq] = Output(value, public_key)
+
+    def read_blocks_from_disk(self, start_height: int = 0, end_height: Optional[int] = None) -> Iterator[Block]:
+        """
+        Yields the blocks at heights [start_height, end_height) (default: up to and including the highest block), in
+        order of height. Blocks are read in chunks of READ_BLOCKS_CHUNK_SIZE heights, so memory use does not depend on
+        the size of the chain.
+        """
+        if end_height is None:
+            [(max_height,)] = self.query("select max(height) from chain")
+            end_height = -1 if max_height is None else max_height + 1
+
+        for chunk_start_height in range(start_height, end_height, READ_BLOCKS_CHUNK_SIZE):
+            yield from self.read_block_range(chunk_start_height, min(chunk_start_height + READ_BLOCKS_CHUNK_SIZE,
+                                                                     end_height))
+
+    def read_block_range(self, start_height: int, end_height: int) -> List[Block]:
+        if self.block_file is None:
+            return self.read_relational_block_range(start_height, end_height)
+
+        block_file = self.block_file
+        block_hashes = [block_hash for (block_hash,) in self.query(
+            "select block_hash from chain where height >= ? and height < ? order by height",
+            (start_height, end_height))]
+        serialized_blocks: Dict[bytes, memoryview] = {}
+        for block_hash in block_hashes:
+            serialized_block = block_file.get_verified(block_hash)
+            if serialized_block is not None:
+                serialized_blocks[block_hash] = serialized_block
+
+        if len(serialized_blocks) == len(block_hashes):
+            return [Block.deserialize(serialized_blocks[block_hash]) for block_hash in block_hashes]
+
+        # these blocks were stored before the BlockFile was in use: have them added to it, so they can be read from it
+        # next time.
+        self.request_backfill(start_height, end_height)
+
+        blocks = self.read_relational_block_range(start_height, end_height)
 
-        for row in self.sql(
+        if len(blocks) < len(block_hashes):
+            # in a pruned store, the blocks whose transactions were pruned may only be in the BlockFile
+            by_hash = {block.hash(): block for block in blocks}
+            blocks = [by_hash[block_hash] if block_hash in by_hash else Block.deserialize(serialized_blocks[block_hash])
+                      for block_hash in block_hashes if block_hash in by_hash or block_hash in serialized_blocks]
+
+        return blocks
+
+    def read_relational_block_range(self, start_height: int, end_height: int) -> List[Block]:
+
+        transaction_builders = self.load_transaction_builders(start_height, end_height)
+
+        self.load_inputs(transaction_builders, start_height, end_height)
+
+        self.load_outputs(transaction_builders, start_height, end_height)
+
+        transactions_by_block_hash: Dict[bytes, List[Transaction]] = {}
+        for transaction_hash, builder in transaction_builders.items():
+            transactions_by_block_hash.setdefault(builder.block_hash, []).append(Transaction(
+                [v for k, v in sorted(builder.inputs.items(), key=lambda i: i[0])],
+                [v for k, v in sorted(builder.outputs.items(), key=lambda i: i[0])],
+                transaction_hash
+            ))
+
+        blocks = []
+        for row in self.query(
                 """select height, previous_block_hash, merkle_root_hash, timestamp, target, nonce,
                    pow_summary_hash, pow_chain_sample, pow_block_hash, block_hash
-                   from chain order by height"""):
+                   from chain where height >= ? and height < ? order by height""", (start_height, end_height)):
             (height, previous_block_hash, merkle_root_hash, timestamp, target, nonce,
              pow_summary_hash, pow_chain_sample, pow_block_hash, block_hash) = row
 
-            if block_hash in block_builders:
-                yield Block(
+            if block_hash in transactions_by_block_hash:
+                blocks.append(Block(
                         BlockHeader(
                             BlockSummary(
                                 height=height,
@@ -222,14 +969,136 @@ class BlockStore:
                                 block_hash=pow_block_hash
                             )
                         ),
-                        [Transaction(
-                            [v for k, v in sorted(builder.inputs.items(), key=lambda i: i[0])],
-                            [v for k, v in sorted(builder.outputs.items(), key=lambda i: i[0])],
-                            transaction_hash
-                        ) for transaction_hash, builder in block_builders[block_hash]],
+                        transactions_by_block_hash[block_hash],
                         hash=block_hash
-                )
+                ))
+
+        return blocks
+
+    def get_raw_block(self, block_hash: bytes) -> Optional[memoryview]:
+        """The block's serialized bytes, exactly as they were stored, if they are in the BlockFile (and check out)."""
+        return self.block_file.get_verified(block_hash) if self.block_file is not None else None
+
+    def get_cached_object(self, hash: bytes) -> Optional[Union[Block, Transaction]]:
+        with self.lock:
+            obj = self.object_cache.get(hash)
+            if obj is not None:
+                self.object_cache.move_to_end(hash)
+            return obj
+
+    def cache_object(self, hash: bytes, obj: Union[Block, Transaction]) -> None:
+        with self.lock:
+            self.object_cache[hash] = obj
+            while len(self.object_cache) > OBJECT_CACHE_SIZE:
+                self.object_cache.popitem(last=False)
+
+    def get_block(self, block_hash: bytes) -> Optional[Block]:
+        cached = self.get_cached_object(block_hash)
+        if isinstance(cached, Block):
+            return cached
+
+        block: Block
+        raw_block = self.get_raw_block(block_hash)
+        if raw_block is not None:
+            block = Block.deserialize(raw_block)
+        else:
+            rows = self.query("select height from chain where block_hash = ?", (block_hash,))
+            if not rows:
+                return None
+
+            [(height,)] = rows
+            block = next(b for b in self.read_relational_block_range(height, height + 1) if b.hash() == block_hash)
+
+        self.cache_object(block_hash, block)
+        return block
+
+    def get_block_at_height(self, height: int) -> Optional[Block]:
+        """The block at the given height; if there are several (forks), one that has been built on is preferred."""
+        rows = self.query(
+            """select c.block_hash from chain c where c.height = ?
+               order by exists(select 1 from chain n where n.previous_block_hash = c.block_hash) desc, c.rowid
+               limit 1""", (height,))
+        return self.get_block(rows[0][0]) if rows else None
+
+    def get_transaction_block_hash(self, transaction_hash: bytes) -> Optional[bytes]:
+        """The hash of the block that contains the transaction, if it has been stored."""
+        rows = self.query("select block_hash from transaction_locator where transaction_hash = ?", (transaction_hash,))
+        return rows[0][0] if rows else None
+
+    def get_transaction(self, transaction_hash: bytes) -> Optional[Transaction]:
+        cached = self.get_cached_object(transaction_hash)
+        if isinstance(cached, Transaction):
+            return cached
+
+        if self.get_transaction_block_hash(transaction_hash) is None:
+            return None
+
+        inputs = [
+            Input(
+                OutputReference(zeroify_nulls(output_reference_hash), output_reference_index),
+                decode_signature(signature) if signature else None
+            )
+            for (output_reference_hash, output_reference_index, signature) in self.query(
+                """select output_reference_hash, output_reference_index, signature
+                   from transaction_inputs where transaction_hash = ? order by seq""", (transaction_hash,))
+        ]
+        outputs = [
+            Output(value, decode_public_key(public_key)) for (value, public_key) in self.query(
+                "select value, public_key from transaction_outputs where transaction_hash = ? order by seq",
+                (transaction_hash,))
+        ]
+
+        transaction = Transaction(inputs, outputs, transaction_hash)
+        self.cache_object(transaction_hash, transaction)
+        return transaction
 
 
 class DefaultBlockStore:
-    instance = BlockStore('chain.db')
+    """
+    The BlockStore used by the node and the scripts. It is opened on first use, with the settings passed to configure(),
+    rather than when this module is imported (which would create chain.db in the current directory as a side effect).
+    """
+
+    path = 'chain.db'  # or ':memory:'
+    block_file_path: Optional[str] = 'blocks'
+    read_only = False
+    prune_depth: Optional[int] = None
+
+    _instance: Optional[BlockStore] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(
+        cls,
+        path: str = 'chain.db',
+        block_file_path: Optional[str] = 'blocks',
+        read_only: bool = False,
+        prune_depth: Optional[int] = None,
+    ) -> None:
+        with cls._lock:
+            if cls._instance is not None:
+                raise Exception("DefaultBlockStore is already open")
+
+            cls.path = path
+            cls.block_file_path = None if path == ':memory:' else block_file_path
+            cls.read_only = read_only
+            cls.prune_depth = prune_depth
+
+    @classmethod
+    def get(cls) -> BlockStore:
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = BlockStore(cls.path, block_file_path=cls.block_file_path, wal=True,
+                                           prune_depth=cls.prune_depth, read_only=cls.read_only)
+            return cls._instance
+
+    @classmethod
+    def is_open(cls) -> bool:
+        return cls._instance is not None
+
+    @classmethod
+    def close(cls) -> None:
+        with cls._lock:
+            if cls._instance is not None:
+                cls._instance.close()
+                cls._instance = None
@@ -0,0 +1,232 @@
+"""
+Bootstrap files: the main chain as a single sequential file of serialized blocks, from which a fresh node can be
+provisioned at disk speed rather than by downloading (and validating) the chain from its peers.
+
+Layout (all integers big-endian):
+
+* header: magic, format version, number of blocks
+* the blocks, in order of height, each prefixed with its length
+* the index: for each block (i.e. height), the offset of its length prefix in the file
+* footer: the offset of the index, and the sha256 of everything that precedes the checksum itself
+"""
+from __future__ import annotations
+
+import hashlib
+import struct
+from time import time
+from typing import BinaryIO, Iterator, List, Optional
+
+from .blockstore import BlockStore
+from .cheating import KNOWN_HASHES, MAX_KNOWN_HASH_HEIGHT
+from .coinstate import CoinState
+from .consensus import validate_block_by_itself, validate_block_in_coinstate
+from .datatypes import Block
+from .humans import computer, human
+
+BOOTSTRAP_MAGIC = b'SKBS'
+BOOTSTRAP_VERSION = 1
+
+HEADER = struct.Struct(">4sBI")  # magic, version, number of blocks
+LENGTH = struct.Struct(">I")
+OFFSET = struct.Struct(">Q")
+FOOTER = struct.Struct(">Q32s")  # offset of the index, sha256
+
+# blocks are added to the CoinState (and handed to the BlockStore) in batches of this many
+IMPORT_BATCH_SIZE = 10_000
+
+
+class BootstrapError(Exception):
+    pass
+
+
+class HashingWriter:
+    """Writes to f, keeping track of the sha256 of (and the number of bytes) written."""
+
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+
+    def write(self, data: bytes) -> None:
+        self.f.write(data)
+        self.sha256.update(data)
+        self.offset += len(data)
+
+
+def export_bootstrap(coinstate: CoinState, f: BinaryIO) -> int:
+    """Writes the chain up to coinstate's head to f; returns the number of blocks written."""
+    n_blocks = coinstate.head().height + 1
+    by_height = coinstate.by_height_at_head()
+
+    writer = HashingWriter(f)
+    writer.write(HEADER.pack(BOOTSTRAP_MAGIC, BOOTSTRAP_VERSION, n_blocks))
+
+    offsets = []
+    for height in range(n_blocks):
+        serialized_block = bytes(coinstate.serialized_block(by_height[height]))
+        offsets.append(writer.offset)
+        writer.write(LENGTH.pack(len(serialized_block)))
+        writer.write(serialized_block)
+
+    index_offset = writer.offset
+    for offset in offsets:
+        writer.write(OFFSET.pack(offset))
+
+    f.write(FOOTER.pack(index_offset, writer.sha256.digest()))
+    return n_blocks
+
+
+class HashingReader:
+    """Reads from f, keeping track of the sha256 of (and the number of bytes) read."""
+
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+
+    def read(self, n: int) -> bytes:
+        data = self.f.read(n)
+        if len(data) < n:
+            raise BootstrapError("Bootstrap file is truncated")
+        self.sha256.update(data)
+        self.offset += len(data)
+        return data
+
+
+def read_header(f: BinaryIO) -> int:
+    """Checks the file's header and its footer (but not its checksum); returns the number of blocks."""
+    f.seek(0, 2)
+    size = f.tell()
+    if size < HEADER.size + FOOTER.size:
+        raise BootstrapError("Not a bootstrap file: too short")
+
+    f.seek(0)
+    n_blocks: int
+    magic, version, n_blocks = HEADER.unpack(f.read(HEADER.size))
+    if magic != BOOTSTRAP_MAGIC:
+        raise BootstrapError("Not a bootstrap file")
+    if version != BOOTSTRAP_VERSION:
+        raise BootstrapError("Unsupported bootstrap file version: %d" % version)
+
+    f.seek(-FOOTER.size, 2)
+    index_offset, _ = FOOTER.unpack(f.read(FOOTER.size))
+    if index_offset + n_blocks * OFFSET.size != size - FOOTER.size:
+        raise BootstrapError("Bootstrap file index is inconsistent with its number of blocks")
+
+    return n_blocks
+
+
+def read_blocks(reader: HashingReader, n_blocks: int) -> Iterator[Block]:
+    """Reads the blocks (reader being at the start of the file)."""
+    reader.read(HEADER.size)
+    for _ in range(n_blocks):
+        (length,) = LENGTH.unpack(reader.read(LENGTH.size))
+        try:
+            block = Block.deserialize(reader.read(length))
+        except (ValueError, struct.error) as e:
+            raise BootstrapError("Bootstrap file contains an unreadable block: %s" % e)
+        yield block
+
+
+def check_checksum(reader: HashingReader, n_blocks: int) -> None:
+    """Reads the rest of the file (reader being past the blocks), and checks its checksum."""
+    reader.read(n_blocks * OFFSET.size)
+    index_offset, checksum = FOOTER.unpack(reader.f.read(FOOTER.size))
+    if checksum != reader.sha256.digest() or index_offset != reader.offset - n_blocks * OFFSET.size:
+        raise BootstrapError("Bootstrap file checksum mismatch")
+
+
+def read_block_at_height(f: BinaryIO, height: int) -> Block:
+    """Reads a single block, using the index (the file's checksum is not checked)."""
+    f.seek(-FOOTER.size, 2)
+    index_offset, _ = FOOTER.unpack(f.read(FOOTER.size))
+
+    f.seek(index_offset + height * OFFSET.size)
+    (offset,) = OFFSET.unpack(f.read(OFFSET.size))
+
+    f.seek(offset)
+    (length,) = LENGTH.unpack(f.read(LENGTH.size))
+    block: Block = Block.deserialize(f.read(length))
+    return block
+
+
+def import_bootstrap(
+    f: BinaryIO,
+    coinstate: CoinState,
+    block_store: Optional[BlockStore] = None,
+    verbose: bool = False,
+) -> CoinState:
+    """
+    Adds the blocks from the bootstrap file f to coinstate (and block_store); returns the resulting CoinState.
+
+    Every block is validated by itself, and must extend the previous one. Up to MAX_KNOWN_HASH_HEIGHT, this chain of
+    hashes is verified against the checkpoints in KNOWN_HASHES (just like blocks received from peers, these blocks are
+    not validated in-coinstate); blocks beyond that are validated in full.
+
+    Blocks are only handed to block_store once they're known to be good: those below a checkpoint once that checkpoint
+    has been verified, the rest once the file's checksum has been. On an error, the blocks that are not known to be
+    good are not stored.
+    """
+    n_blocks = read_header(f)
+    f.seek(0)
+    reader = HashingReader(f)
+
+    current_timestamp = int(time())
+    previous_block_hash: Optional[bytes] = None
+    batch: List[Block] = []  # not added to coinstate yet
+    unstored: List[Block] = []  # not handed to block_store yet
+
+    def add_batch(coinstate: CoinState) -> CoinState:
+        if batch:
+            coinstate = coinstate.add_blocks(batch)
+            batch.clear()
+        return coinstate
+
+    def store_blocks(wait: bool) -> None:
+        if block_store is not None:
+            for block in unstored:
+                block_store.add_block_to_buffer(block)
+            block_store.flush_blocks_to_disk(wait=wait)
+        unstored.clear()
+
+    for height, block in enumerate(read_blocks(reader, n_blocks)):
+        block_hash = block.hash()
+
+        if block.height != height:
+            raise BootstrapError("Block %s at position %d has height %d" % (human(block_hash), height, block.height))
+
+        if height > 0 and block.previous_block_hash != previous_block_hash:
+            raise BootstrapError("Block %s at height %d doesn't extend the previous block" % (
+                human(block_hash), block.height))
+        previous_block_hash = block_hash
+
+        if block.height in KNOWN_HASHES:
+            if block_hash != computer(KNOWN_HASHES[block.height]):
+                raise BootstrapError("Block %s doesn't match the checkpoint at height %d" % (
+                    human(block_hash), block.height))
+            if verbose:
+                print("Checkpoint at height %d verified" % block.height)
+
+            # the blocks below it are the ones that the checkpoint's hash commits to
+            store_blocks(wait=False)
+
+        if block_hash in coinstate.block_by_hash:
+            continue  # e.g. the genesis block
+
+        validate_block_by_itself(block, current_timestamp)
+
+        if block.height > MAX_KNOWN_HASH_HEIGHT:
+            coinstate = add_batch(coinstate)
+            validate_block_in_coinstate(block, coinstate)
+
+        batch.append(block)
+        unstored.append(block)
+        if len(batch) >= IMPORT_BATCH_SIZE or block.height > MAX_KNOWN_HASH_HEIGHT:
+            coinstate = add_batch(coinstate)
+
+    coinstate = add_batch(coinstate)
+
+    check_checksum(reader, n_blocks)
+    store_blocks(wait=True)
+
+    return coinstate
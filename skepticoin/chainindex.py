@@ -0,0 +1,135 @@
+"""
+Indexes over the tree of blocks that make up the chain (and its forks).
+
+A HeightIndex answers "which block is at height h on the chain that ends in block b?". CoinState needs one such answer
+for every block it knows about (so that any block can be built upon), but copying a height->block map for each block is
+expensive. Instead, all HeightIndex views on a single chain share one append-only list of blocks: each view simply knows
+how many blocks of that list it covers. Appending to the view that covers the whole list extends the list in place;
+appending to any other view (i.e. forking) creates an overlay that holds only the fork's own blocks plus a pointer to
+the view it forked from.
+
+Skip pointers (as in Bitcoin's CBlockIndex::pskip) let us find any block's ancestor at a given height in O(log n) steps,
+also for blocks for which no HeightIndex is kept (any longer).
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import immutables
+
+from .datatypes import Block
+
+# Lookups below a fork point are delegated to the view that was forked from; after a number of reorgs such delegation
+# could become arbitrarily deep, so beyond this depth a fork is started on a fresh (flat) copy of the chain instead.
+MAX_OVERLAY_DEPTH = 8
+
+# The shared lists are mutated in place (appended to); this lock guards the check-and-append.
+_append_lock = threading.Lock()
+
+
+class HeightIndex:
+
+    def __init__(self, base: Optional[HeightIndex], fork_height: int, blocks: List[Block], length: int):
+        # heights [0, fork_height) are looked up in base, heights [fork_height, length) in blocks
+        self.base = base
+        self.fork_height = fork_height
+        self.blocks = blocks
+        self.length = length
+        self.depth: int = 0 if base is None else base.depth + 1
+
+    @classmethod
+    def empty(cls) -> HeightIndex:
+        return cls(None, 0, [], 0)
+
+    @classmethod
+    def from_blocks(cls, blocks: List[Block]) -> HeightIndex:
+        return cls(None, 0, list(blocks), len(blocks))
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __contains__(self, height: object) -> bool:
+        return isinstance(height, int) and 0 <= height < self.length
+
+    def __getitem__(self, height: int) -> Block:
+        if not 0 <= height < self.length:
+            raise KeyError(height)
+
+        view = self
+        while height < view.fork_height:
+            view = view.base  # type: ignore
+
+        return view.blocks[height - view.fork_height]
+
+    def append(self, block: Block, undo_log: Optional[List[Tuple[List[Block], int]]] = None) -> HeightIndex:
+        """
+        Returns a view that extends this one with block (at height len(self)); this view itself is unaffected. If the
+        shared list is extended in place, this is recorded in undo_log (if given), for undo_appends.
+        """
+        assert block.height == self.length
+
+        with _append_lock:
+            if self.fork_height + len(self.blocks) == self.length:
+                # we are the tip of the shared list: extend it in place
+                self.blocks.append(block)
+                if undo_log is not None:
+                    undo_log.append((self.blocks, len(self.blocks)))
+                return HeightIndex(self.base, self.fork_height, self.blocks, self.length + 1)
+
+        if self.depth >= MAX_OVERLAY_DEPTH:
+            return HeightIndex.from_blocks([self[height] for height in range(self.length)] + [block])
+
+        return HeightIndex(self, self.length, [block], self.length + 1)
+
+    @staticmethod
+    def undo_appends(undo_log: List[Tuple[List[Block], int]]) -> None:
+        """Undo the in-place appends recorded in undo_log, i.e. those of a batch of blocks that was not added after all.
+        A list that has been appended to since (from elsewhere) is left alone: its extra blocks are harmless anyway."""
+        with _append_lock:
+            for blocks, length in reversed(undo_log):
+                if len(blocks) == length:
+                    blocks.pop()
+
+
+def _invert_lowest_one(n: int) -> int:
+    return n & (n - 1)
+
+
+def get_skip_height(height: int) -> int:
+    """The height of the block that a block at the given height has a skip pointer to."""
+    if height < 2:
+        return 0
+
+    # Any number strictly lower than height is acceptable, but the following expression seems to perform well in
+    # simulations (max 110 steps to go back up to 2**18 blocks); taken as-is from Bitcoin's GetSkipHeight.
+    if height & 1:
+        return _invert_lowest_one(_invert_lowest_one(height - 1)) + 1
+    return _invert_lowest_one(height)
+
+
+def get_ancestor(
+    block_by_hash: immutables.Map[bytes, Block],
+    skip_by_hash: Dict[bytes, Block],
+    block: Block,
+    height: int,
+) -> Block:
+    """Returns block's ancestor at the given height (block itself if height == block.height)."""
+    assert 0 <= height <= block.height
+
+    while block.height > height:
+        skip_height = get_skip_height(block.height)
+        skip_height_previous = get_skip_height(block.height - 1)
+
+        # only follow the skip pointer if it doesn't overshoot, and if the skip pointer of the previous block isn't a
+        # better choice (i.e. it would bring us closer to height without overshooting)
+        block_hash = block.hash()
+        if block_hash in skip_by_hash and (
+                skip_height == height or
+                (skip_height > height and not (skip_height_previous < skip_height - 2 and
+                                               skip_height_previous >= height))):
+            block = skip_by_hash[block_hash]
+        else:
+            block = block_by_hash[block.previous_block_hash]
+
+    return block
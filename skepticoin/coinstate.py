@@ -1,15 +1,32 @@
 from __future__ import annotations
 
-from typing import Any, List, Optional, Tuple, Callable
+from collections import OrderedDict
+from io import BytesIO
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
 
 import immutables
 
 from skepticoin.balances import PKBalance, PublicKeyBalances, uto_apply_block
 
+from .blockfile import BlockFile
+from .chainindex import HeightIndex, get_ancestor, get_skip_height
 from .signing import PublicKey
 from .datatypes import OutputReference, Block, Output, BlockSummary
+from .hash import sha256d
 from .humans import human
 from .genesis import genesis_block_data
+from .params import FINALITY_DEPTH
+from .serialization import (
+    DeserializationError,
+    safe_read,
+    stream_deserialize_list,
+    stream_deserialize_vlq,
+    stream_serialize_list,
+    stream_serialize_vlq,
+)
+
+SNAPSHOT_MAGIC = b'SKSN'
+SNAPSHOT_VERSION = b'\x01'
 
 
 class CoinState:
@@ -19,9 +36,14 @@ class CoinState:
         unspent_transaction_outs_by_hash: immutables.Map[
             bytes, immutables.Map[OutputReference, Output]
         ],
-        block_by_height_by_hash: immutables.Map[bytes, immutables.Map[int, Block]],
+        block_by_height_by_hash: immutables.Map[bytes, HeightIndex],
         heads: immutables.Map[bytes, Block],
         current_chain_hash: Optional[bytes],
+        public_key_balances_cache: Optional[OrderedDict[bytes, immutables.Map[PublicKey, PKBalance]]] = None,
+        finality_depth: int = FINALITY_DEPTH,
+        skip_by_hash: Optional[Dict[bytes, Block]] = None,
+        block_file: Optional[BlockFile] = None,
+        pruned_below: int = 0,
     ):
 
         self.block_by_hash = block_by_hash
@@ -29,22 +51,115 @@ class CoinState:
         # block_hash -> (OutputReference -> Output)
         self.unspent_transaction_outs_by_hash = unspent_transaction_outs_by_hash
 
-        # given a hash to a current head, return a dictionary in which you can look up by height.
+        # given a block's hash, return a HeightIndex in which you can look up (up to that block) by height.
         self.block_by_height_by_hash = block_by_height_by_hash
 
+        # block_hash -> the block's ancestor at get_skip_height(block.height). A skip pointer never changes once it's
+        # known, so this (append-only) dict is shared with the CoinState we came from.
+        self.skip_by_hash: Dict[bytes, Block] = {} if skip_by_hash is None else skip_by_hash
+
         self.heads = heads  # hash=>block ... but restricted to blocks w/o children.
         self.current_chain_hash = current_chain_hash
 
-        # block_hash -> (public_key -> (value, [OutputReference]))
-        self.public_key_balances_by_hash = PublicKeyBalances(self.block_by_hash)
+        # per-block state (unspent_transaction_outs_by_hash, block_by_height_by_hash) is pruned for blocks that are more
+        # than finality_depth below the head; such blocks can no longer be built upon. On the main chain, this has been
+        # done for the blocks below pruned_below.
+        self.finality_depth = finality_depth
+        self.pruned_below = pruned_below
+
+        # where available, blocks' serialized bytes are read from here rather than re-serialized (PoW chain sampling)
+        self.block_file = block_file
+
+        # block_hash -> (public_key -> (value, [OutputReference])); the cache is shared with the CoinState we came from
+        self.public_key_balances_by_hash = PublicKeyBalances(
+            self.block_by_hash, self.unspent_transaction_outs_by_hash, public_key_balances_cache)
+
+    def dump(self, f: BinaryIO, block_hash: Optional[bytes] = None, store_id: Optional[bytes] = None) -> None:
+        """
+        Dump a snapshot of the chain as of block_hash (default: the current head) so that it can be loaded by the load()
+        method later. Only the chain that leads up to block_hash and the unspent transaction outputs at that block are
+        saved: forks are not part of the snapshot. The payload is followed by its sha256d as a checksum.
+
+        store_id identifies the BlockStore that the chain was read from (see BlockStore.get_store_id), so that the
+        snapshot isn't combined with the blocks from another one when it is loaded.
+        """
+        if block_hash is None:
+            block_hash = self.current_chain_hash
+        assert block_hash
+
+        block_by_height = self.block_by_height_by_hash[block_hash]
+        unspent_transaction_outs = self.unspent_transaction_outs_by_hash[block_hash]
+
+        payload = BytesIO()
+        stream_serialize_vlq(payload, len(store_id or b''))
+        payload.write(store_id or b'')
+        payload.write(block_hash)
+
+        stream_serialize_list(payload, [block_by_height[height] for height in range(len(block_by_height))])
 
-    def dump(self, dumper: Callable[[Any], None]) -> None:
+        stream_serialize_vlq(payload, len(unspent_transaction_outs))
+        for output_reference, output in unspent_transaction_outs.items():
+            output_reference.stream_serialize(payload)
+            output.stream_serialize(payload)
+
+        f.write(SNAPSHOT_MAGIC)
+        f.write(SNAPSHOT_VERSION)
+        data = payload.getvalue()
+        f.write(data)
+        f.write(sha256d(data))
+
+    @classmethod
+    def load(
+        cls, f: BinaryIO, block_file: Optional[BlockFile] = None, store_id: Optional[bytes] = None,
+    ) -> CoinState:
         """
-        Dump the chain so that it can be loaded by the load() method later. Currently we only save the blocks.
-        It would be better to save the other stuff too, but that's not convenient right now.
-        DUMPER function must be passed as a parameter, to allow the calling code to control the actual file format.
+        Load a snapshot that was written by dump(); the snapshot's block becomes the (only) head. If store_id is given,
+        the snapshot must have been dumped with the same store_id.
         """
-        dumper(self.block_by_hash)
+        if safe_read(f, len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise DeserializationError("Not a CoinState snapshot")
+
+        if safe_read(f, 1) != SNAPSHOT_VERSION:
+            raise DeserializationError("Non-supported CoinState snapshot version")
+
+        data = f.read()
+        payload, checksum = data[:-32], data[-32:]
+        if sha256d(payload) != checksum:
+            raise DeserializationError("CoinState snapshot checksum mismatch")
+
+        payload_f = BytesIO(payload)
+        snapshot_store_id = safe_read(payload_f, stream_deserialize_vlq(payload_f))
+        head_hash = safe_read(payload_f, 32)
+
+        if store_id is not None and snapshot_store_id != store_id:
+            raise DeserializationError("CoinState snapshot was taken from a different block store")
+
+        blocks: List[Block] = stream_deserialize_list(payload_f, Block)
+
+        unspent_transaction_outs = {}
+        for _ in range(stream_deserialize_vlq(payload_f)):
+            output_reference = OutputReference.stream_deserialize(payload_f)
+            unspent_transaction_outs[output_reference] = Output.stream_deserialize(payload_f)
+
+        if len(blocks) == 0:
+            return cls.empty(block_file=block_file)
+
+        head = blocks[-1]
+        if head.hash() != head_hash:
+            raise DeserializationError("CoinState snapshot's blocks don't lead up to its head")
+
+        skip_by_hash = {block.hash(): blocks[get_skip_height(block.height)] for block in blocks[1:]}
+
+        return cls(
+            block_by_hash=immutables.Map({block.hash(): block for block in blocks}),
+            unspent_transaction_outs_by_hash=immutables.Map({head_hash: immutables.Map(unspent_transaction_outs)}),
+            block_by_height_by_hash=immutables.Map({head_hash: HeightIndex.from_blocks(blocks)}),
+            heads=immutables.Map({head_hash: head}),
+            current_chain_hash=head_hash,
+            skip_by_hash=skip_by_hash,
+            block_file=block_file,
+            pruned_below=head.height,  # there is no per-block state below the head to begin with
+        )
 
     def __repr__(self) -> str:
         if self.current_chain_hash is None:
@@ -53,13 +168,15 @@ class CoinState:
             human(self.current_chain_hash), self.head().height, len(self.heads))
 
     @classmethod
-    def empty(cls) -> CoinState:
+    def empty(cls, finality_depth: int = FINALITY_DEPTH, block_file: Optional[BlockFile] = None) -> CoinState:
         return cls(
             block_by_hash=immutables.Map(),
             unspent_transaction_outs_by_hash=immutables.Map(),
             block_by_height_by_hash=immutables.Map(),
             heads=immutables.Map(),
             current_chain_hash=None,
+            finality_depth=finality_depth,
+            block_file=block_file,
         )
 
     @classmethod
@@ -75,63 +192,156 @@ class CoinState:
         return self.add_block_no_validation(block)
 
     def add_block_no_validation(self, block: Block) -> CoinState:
-        if block.previous_block_hash == b'\00' * 32:
-            unspent_transaction_outs: immutables.Map[OutputReference, Output] = immutables.Map()
-        else:
-            unspent_transaction_outs = self.unspent_transaction_outs_by_hash[block.previous_block_hash]
+        return self.add_blocks([block])
+
+    def add_blocks(self, blocks: Iterable[Block]) -> CoinState:
+        """
+        Add blocks (without validation), in order, and return the resulting CoinState. Equivalent to calling
+        add_block_no_validation() for each block in turn, but cheaper for a batch of blocks (as when reading the chain
+        from disk or during IBD): all blocks are added inside a single mutate() per data structure, and only the final
+        CoinState is materialized.
 
-        unspent_transaction_outs = uto_apply_block(unspent_transaction_outs, block)
+        The state shared with other CoinStates (skip_by_hash, the HeightIndex lists) is only changed for good once the
+        whole batch has been added: if adding it fails halfway, it is left as it was.
+        """
+        new_skip_by_hash: Dict[bytes, Block] = {}
+        height_index_undo_log: List[Tuple[List[Block], int]] = []
+
+        try:
+            coinstate = self._add_blocks(blocks, new_skip_by_hash, height_index_undo_log)
+        except BaseException:
+            HeightIndex.undo_appends(height_index_undo_log)
+            raise
+
+        self.skip_by_hash.update(new_skip_by_hash)
+        return coinstate
+
+    def _add_blocks(
+        self,
+        blocks: Iterable[Block],
+        new_skip_by_hash: Dict[bytes, Block],
+        height_index_undo_log: List[Tuple[List[Block], int]],
+    ) -> CoinState:
+        with self.block_by_hash.mutate() as mutable_block_by_hash, \
+                self.unspent_transaction_outs_by_hash.mutate() as mutable_unspent_transaction_outs_by_hash, \
+                self.block_by_height_by_hash.mutate() as mutable_block_by_height_by_hash:
 
-        block_hash = block.hash()
+            # heads is small (one entry per fork), and we need to iterate over it, which a MapMutation doesn't support
+            heads = dict(self.heads)
+            current_chain_hash = self.current_chain_hash
+            pruned_below = self.pruned_below
 
-        block_by_hash: immutables.Map[bytes, Block] = self.block_by_hash.set(block_hash, block)
+            for block in blocks:
+                if block.previous_block_hash == b'\00' * 32:
+                    unspent_transaction_outs: immutables.Map[OutputReference, Output] = immutables.Map()
+                    block_by_height = HeightIndex.empty()
+                else:
+                    unspent_transaction_outs = mutable_unspent_transaction_outs_by_hash[block.previous_block_hash]
+                    block_by_height = mutable_block_by_height_by_hash[block.previous_block_hash]
 
-        # TODO pruning of unspent_transaction_outs_by_hash on e.g. max delta-height; because it is used as part of
-        # validation, such an approach implies a limit (to be implemented in validation) on how old a fork may be w.r.t.
-        # the current height if it is to be considered at all.
-        unspent_transaction_outs_by_hash = self.unspent_transaction_outs_by_hash.set(
-            block_hash, unspent_transaction_outs)
+                unspent_transaction_outs = uto_apply_block(unspent_transaction_outs, block)
+                block_by_height = block_by_height.append(block, height_index_undo_log)
 
-        if block.previous_block_hash == b'\00' * 32:
-            block_by_height_by_hash: immutables.Map[bytes, immutables.Map[int, Block]]
-            block_by_height_by_hash = immutables.Map({block_hash: immutables.Map({0: block})})
-        else:
-            block_by_height = self.block_by_height_by_hash[block.previous_block_hash]
-            block_by_height = block_by_height.set(block.height, block)
-            block_by_height_by_hash = self.block_by_height_by_hash.set(block_hash, block_by_height)
+                block_hash = block.hash()
 
-        with self.heads.mutate() as mutable_heads:
-            if block.previous_block_hash in mutable_heads:
-                del mutable_heads[block.header.summary.previous_block_hash]
+                mutable_block_by_hash[block_hash] = block
+                mutable_unspent_transaction_outs_by_hash[block_hash] = unspent_transaction_outs
+                mutable_block_by_height_by_hash[block_hash] = block_by_height
 
-            mutable_heads[block_hash] = block
+                if block.height > 0:
+                    new_skip_by_hash[block_hash] = block_by_height[get_skip_height(block.height)]
 
-            heads = mutable_heads.finish()
+                if block.previous_block_hash in heads:
+                    del heads[block.previous_block_hash]
 
-        if self.current_chain_hash is None or self.current_chain_hash == block.previous_block_hash:
-            # base case / simple moving ahead
-            current_chain_hash = block_hash
+                heads[block_hash] = block
 
-        # what should be the current_chain_hash in the case of forks?
-        # we compare total work, using striclty greater: this means that when there is a fork in the chain, ties are
-        # broken based on first-come-first serve. I'm sure someone wrote a paper on how this is optimal.
-        elif block.get_total_work() > self.block_by_hash[self.current_chain_hash].get_total_work():
-            current_chain_hash = block_hash
-        else:
-            current_chain_hash = self.current_chain_hash  # a fork, but the most recently added block is non-current
+                if current_chain_hash is None or current_chain_hash == block.previous_block_hash:
+                    # base case / simple moving ahead
+                    current_chain_hash = block_hash
+
+                # what should be the current_chain_hash in the case of forks?
+                # we compare total work, using striclty greater: this means that when there is a fork in the chain, ties
+                # are broken based on first-come-first serve. I'm sure someone wrote a paper on how this is optimal.
+                elif block.get_total_work() > mutable_block_by_hash[current_chain_hash].get_total_work():
+                    current_chain_hash = block_hash
+
+                # else: a fork, but the most recently added block is non-current
+
+                pruned_below = self._prune(mutable_block_by_hash, mutable_unspent_transaction_outs_by_hash,
+                                           mutable_block_by_height_by_hash, heads, current_chain_hash, pruned_below)
+
+            block_by_hash = mutable_block_by_hash.finish()
+            unspent_transaction_outs_by_hash = mutable_unspent_transaction_outs_by_hash.finish()
+            block_by_height_by_hash = mutable_block_by_height_by_hash.finish()
 
         return CoinState(
             block_by_hash=block_by_hash,
             unspent_transaction_outs_by_hash=unspent_transaction_outs_by_hash,
             block_by_height_by_hash=block_by_height_by_hash,
-            heads=heads,
+            heads=immutables.Map(heads),
             current_chain_hash=current_chain_hash,
+            public_key_balances_cache=self.public_key_balances_by_hash.cache,
+            finality_depth=self.finality_depth,
+            skip_by_hash=self.skip_by_hash,
+            block_file=self.block_file,
+            pruned_below=pruned_below,
         )
 
+    def _prune(
+        self,
+        mutable_block_by_hash: immutables.MapMutation[bytes, Block],
+        mutable_unspent_transaction_outs_by_hash: immutables.MapMutation[
+            bytes, immutables.Map[OutputReference, Output]],
+        mutable_block_by_height_by_hash: immutables.MapMutation[bytes, HeightIndex],
+        heads: Dict[bytes, Block],
+        current_chain_hash: bytes,
+        pruned_below: int,
+    ) -> int:
+        """Drop (in place) the per-block state of blocks that are more than finality_depth below the head. On the main
+        chain, that's the blocks from pruned_below (the height up to which this was done before) up; returns the height
+        up to which it's done now."""
+
+        prune_below: int = mutable_block_by_hash[current_chain_hash].height - self.finality_depth
+
+        if prune_below <= 0:
+            return pruned_below
+
+        # typically the head has moved up a single block, but after a reorg (to a heavier fork) it may have moved more
+        block_by_height = mutable_block_by_height_by_hash[current_chain_hash]
+        prunable_hashes = [block_by_height[height].hash() for height in range(pruned_below, prune_below)]
+
+        # forks that have fallen behind are pruned as a whole (up to the point where they join the main chain)
+        for head in heads.values():
+            block = head
+            while block.height < prune_below and block.hash() in mutable_unspent_transaction_outs_by_hash:
+                prunable_hashes.append(block.hash())
+                block = mutable_block_by_hash[block.previous_block_hash]
+
+        for block_hash in prunable_hashes:
+            if block_hash in mutable_unspent_transaction_outs_by_hash:
+                del mutable_unspent_transaction_outs_by_hash[block_hash]
+            if block_hash in mutable_block_by_height_by_hash:
+                del mutable_block_by_height_by_hash[block_hash]
+
+        return max(pruned_below, prune_below)
+
+    def is_extendable(self, block_hash: bytes) -> bool:
+        """Can a block with the given previous_block_hash be added? Not if its per-block state was pruned (or if the
+        block is unknown altogether)."""
+        return block_hash in self.unspent_transaction_outs_by_hash
+
+    def serialized_block(self, block: Block) -> Union[bytes, memoryview]:
+        if self.block_file is not None:
+            serialized = self.block_file.get_verified(block.hash())
+            if serialized is not None:
+                return serialized
+        return block.serialize()
+
     def head(self) -> BlockSummary:
         return self.block_by_hash[self.current_chain_hash]  # type: ignore
 
-    def by_height_at_head(self) -> immutables.Map[int, Block]:
+    def by_height_at_head(self) -> HeightIndex:
         # TODO just use 'at_head'
         assert self.current_chain_hash
         return self.block_by_height_by_hash[self.current_chain_hash]
@@ -147,7 +357,7 @@ class CoinState:
                 return self.unspent_transaction_outs_by_hash[self.current_chain_hash]
 
             @property
-            def block_by_height(inner_self) -> immutables.Map[int, Block]:
+            def block_by_height(inner_self) -> HeightIndex:
                 assert self.current_chain_hash
                 return self.block_by_height_by_hash[self.current_chain_hash]
 
@@ -158,15 +368,28 @@ class CoinState:
 
         return AtHead()
 
-    def forks(self) -> List[Tuple[Block, Block]]:
-        def _find_lca_with_main(block: Block) -> Block:
-            # while block.hash() not in block_by_hash_by_hash  ... we have no such datastructure yet, so instead:
+    def get_ancestor(self, block_hash: bytes, height: int) -> Block:
+        return get_ancestor(self.block_by_hash, self.skip_by_hash, self.block_by_hash[block_hash], height)
+
+    def lowest_common_ancestor(self, block_hash_a: bytes, block_hash_b: bytes) -> Block:
+        height = min(self.block_by_hash[block_hash_a].height, self.block_by_hash[block_hash_b].height)
+        if self.get_ancestor(block_hash_a, height).hash() == self.get_ancestor(block_hash_b, height).hash():
+            return self.get_ancestor(block_hash_a, height)
 
-            while (block.height not in self.by_height_at_head() or
-                    self.by_height_at_head()[block.height].hash() != block.hash()):
+        # binary search for the highest common height; all chains share the genesis block (at height 0)
+        lo, hi = 0, height
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.get_ancestor(block_hash_a, mid).hash() == self.get_ancestor(block_hash_b, mid).hash():
+                lo = mid
+            else:
+                hi = mid
 
-                block = self.block_by_hash[block.previous_block_hash]
+        return self.get_ancestor(block_hash_a, lo)
 
-            return block
+    def forks(self) -> List[Tuple[Block, Block]]:
+        if self.current_chain_hash is None:
+            return []
 
-        return [(head, _find_lca_with_main(head)) for head in self.heads.values()]
+        current_chain_hash = self.current_chain_hash
+        return [(head, self.lowest_common_ancestor(head.hash(), current_chain_hash)) for head in self.heads.values()]
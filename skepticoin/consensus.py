@@ -1,4 +1,4 @@
-from typing import List, Mapping, Tuple, Union
+from typing import List, Mapping, Optional, Tuple, Union
 
 import immutables
 
@@ -10,6 +10,7 @@ from .params import (
 )
 from .serialization import serialize_list
 from .signing import CoinbaseData, SECP256k1PublicKey
+from .verification import SignatureCheck, signature_verifier
 from .merkletree import get_merkle_root
 from .datatypes import OutputReference, Input, Output, Transaction, BlockSummary, PowEvidence, BlockHeader, Block
 from .hash import scrypt, blake2
@@ -172,11 +173,13 @@ def construct_pow_evidence_after_scrypt(
         chain_sample = b'\00' * CHAIN_SAMPLE_TOTAL_SIZE
     else:
 
-        def get_block_by_height(h: int) -> Block:
-            return coinstate.block_by_height_by_hash[summary.previous_block_hash][h]
+        block_by_height = coinstate.block_by_height_by_hash[summary.previous_block_hash]
+
+        def get_serialized_block_by_height(h: int) -> Union[bytes, memoryview]:
+            return coinstate.serialized_block(block_by_height[h])
 
         chain_sample = select_n_k_length_slices_from_chain(
-            summary_hash, current_height, get_block_by_height, CHAIN_SAMPLE_COUNT, CHAIN_SAMPLE_SIZE)
+            summary_hash, current_height, get_serialized_block_by_height, CHAIN_SAMPLE_COUNT, CHAIN_SAMPLE_SIZE)
 
     serialized_transactions = serialize_list(transactions)
 
@@ -335,12 +338,9 @@ def validate_non_coinbase_transaction_by_itself(transaction: Transaction) -> Non
             raise ValidateTransactionError("Non-signature Signature class used where a real one is expected.")
 
 
-def validate_signature_for_spend(
-    input: Input, previous_output: Output, transaction: Transaction
-) -> None:
-    message = transaction.signable_equivalent().serialize()
-    assert input.signature
-    if not input.signature.validate(previous_output.public_key, message):
+def validate_signatures(signature_checks: List[SignatureCheck]) -> None:
+    """Checks the signatures of many spends at once (potentially in parallel)."""
+    if not signature_verifier.verify(signature_checks):
         raise ValidateTransactionError("Wrong signature for claimed output")
 
 
@@ -445,8 +445,11 @@ def validate_coinbase_transaction_in_coinstate(
 
 
 def validate_non_coinbase_transaction_in_coinstate(
-    transaction: Transaction, at_hash: bytes, coinstate: CoinState
+    transaction: Transaction, at_hash: bytes, coinstate: CoinState,
+    signature_checks: Optional[List[SignatureCheck]] = None,
 ) -> None:
+    """If signature_checks is passed, the transaction's signatures are not verified here, but appended to it (for the
+    caller to verify along with those of other transactions using validate_signatures)."""
     # Note that unspent_transaction_outs is fetched only once here, reflecting the state at the beginning of the block;
     # the implication is that spending money from another transaction in the same block is illegal. Though I'm sure
     # there are theoretical advantages in allowing it, the extra complexity isn't worth it. This also means we have to
@@ -454,6 +457,7 @@ def validate_non_coinbase_transaction_in_coinstate(
     # transaction output.
     unspent_transaction_outs = coinstate.unspent_transaction_outs_by_hash[at_hash]
 
+    own_signature_checks: List[SignatureCheck] = []
     total_input_value = 0
 
     for input in transaction.inputs:
@@ -466,10 +470,17 @@ def validate_non_coinbase_transaction_in_coinstate(
         # responsibility to the clients. Reasoning: is spending of newly minted coins really that different from
         # spending newly acquired coins?
 
-        validate_signature_for_spend(input, previous_output, transaction)
+        assert input.signature
+        own_signature_checks.append(
+            (input.signature, previous_output.public_key, transaction.signable_message(), transaction.sighash()))
 
         total_input_value += previous_output.value
 
+    if signature_checks is None:
+        validate_signatures(own_signature_checks)
+    else:
+        signature_checks.extend(own_signature_checks)
+
     if sum(output.value for output in transaction.outputs) > total_input_value:
         raise ValidateTransactionError('Transaction overspending')
 
@@ -492,6 +503,9 @@ def validate_block_summary_in_coinstate(
     if block_summary.previous_block_hash not in coinstate.block_by_hash:
         raise ValidateBlockHeaderError("previous_block_hash unknown: %s" % human(block_summary.previous_block_hash))
 
+    if not coinstate.is_extendable(block_summary.previous_block_hash):
+        raise ValidateBlockHeaderError("Fork below finality depth: %s" % human(block_summary.previous_block_hash))
+
     previous_block = coinstate.block_by_hash[block_summary.previous_block_hash]
 
     if block_summary.timestamp <= previous_block.timestamp:
@@ -527,5 +541,10 @@ def validate_block_in_coinstate(block: Block, coinstate: CoinState) -> None:
     coinbase_transaction = block.transactions[0]
     validate_coinbase_transaction_in_coinstate(coinbase_transaction, block, coinstate)
 
+    # the signatures are verified for all transactions at once, which allows for spreading them over multiple processes
+    signature_checks: List[SignatureCheck] = []
     for transaction in block.transactions[1:]:
-        validate_non_coinbase_transaction_in_coinstate(transaction, block.previous_block_hash, coinstate)
+        validate_non_coinbase_transaction_in_coinstate(
+            transaction, block.previous_block_hash, coinstate, signature_checks)
+
+    validate_signatures(signature_checks)
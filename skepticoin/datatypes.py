@@ -1,25 +1,47 @@
 from __future__ import annotations
 
 import struct
-from typing import Any, BinaryIO, List, Optional
+from typing import Any, BinaryIO, List, Optional, Tuple
 
 from .humans import human
 from .serialization import (
+    DeserializationError,
     safe_read,
     Serializable,
+    SerializationTruncationError,
     stream_deserialize_list,
     stream_deserialize_vlq,
     stream_serialize_list,
     stream_serialize_vlq,
+    TYPE_INDICATOR,
+    UINT8,
+    UINT64,
+    view_bytes,
+    view_deserialize_list,
+    view_deserialize_vlq,
+)
+from .signing import (
+    PublicKey,
+    Signature,
+    SignableEquivalent,
+    TYPE_COINBASE_DATA,
+    TYPE_SECP256k1,
+    TYPE_SIGNABLE_EQUIVALENT,
 )
-from .signing import Signature, PublicKey, SignableEquivalent
 from .hash import sha256d
 from .params import CHAIN_SAMPLE_TOTAL_SIZE
 
+# precompiled layouts of fixed-size runs of fields, for view_deserialize
+OUTPUT_REFERENCE_FIELDS = struct.Struct(b">32sI")  # hash, index
+POW_EVIDENCE_FIELDS = struct.Struct(b">32s%ds32s" % CHAIN_SAMPLE_TOTAL_SIZE)  # summary_hash, chain_sample, block_hash
+BLOCK_SUMMARY_FIELDS = struct.Struct(b">32s32sI32sI")  # all but the (VLQ-encoded) height
+
 
 class OutputReference(Serializable):
     """Refer an output by its transaction hash and index into its list of outputs."""
 
+    __slots__ = ('hash', 'index', 'hash_value')
+
     def __init__(self, hash: bytes, index: int):
         if not len(hash) == 32:
             raise ValueError('OutputReference hash must be 32 bytes.')
@@ -30,6 +52,9 @@ class OutputReference(Serializable):
         self.hash = hash
         self.index = index
 
+        # OutputReferences are mostly used as keys in the UTXO maps: hash them once (hashing bytes is cached by Python)
+        self.hash_value = hash.__hash__() ^ index
+
     def __repr__(self) -> str:
         return "OutputReference(%s, %s)" % (human(self.hash), self.index)
 
@@ -40,7 +65,7 @@ class OutputReference(Serializable):
         return self.hash == other.hash and self.index == other.index
 
     def __hash__(self) -> int:
-        return hash((self.hash, self.index))
+        return self.hash_value
 
     @classmethod
     def stream_deserialize(cls, f: BinaryIO) -> OutputReference:
@@ -48,6 +73,11 @@ class OutputReference(Serializable):
         (index,) = struct.unpack(b">I", safe_read(f, 4))
         return cls(hash, index)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[OutputReference, int]:
+        hash, index = OUTPUT_REFERENCE_FIELDS.unpack_from(view, offset)
+        return cls(hash, index), offset + OUTPUT_REFERENCE_FIELDS.size
+
     def stream_serialize(self, f: BinaryIO) -> None:
         f.write(self.hash)
         f.write(struct.pack(b">I", self.index))
@@ -59,6 +89,8 @@ class OutputReference(Serializable):
 class Input(Serializable):
     """Input of a transaction"""
 
+    __slots__ = ('output_reference', 'signature')
+
     def __init__(
         self, output_reference: OutputReference, signature: Optional[Signature]
     ):
@@ -84,6 +116,12 @@ class Input(Serializable):
         signature = Signature.stream_deserialize(f)
         return cls(output_reference, signature)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[Input, int]:
+        hash, index = OUTPUT_REFERENCE_FIELDS.unpack_from(view, offset)
+        signature, offset = Signature.view_deserialize(view, offset + OUTPUT_REFERENCE_FIELDS.size)
+        return cls(OutputReference(hash, index), signature), offset
+
     def stream_serialize(self, f: BinaryIO) -> None:
         self.output_reference.stream_serialize(f)
         assert self.signature
@@ -100,6 +138,8 @@ class Input(Serializable):
 class Output(Serializable):
     """Output of a transaction."""
 
+    __slots__ = ('value', 'public_key')
+
     def __init__(self, value: int, public_key: PublicKey):
         self.value = value
         self.public_key = public_key
@@ -119,6 +159,12 @@ class Output(Serializable):
         public_key = PublicKey.stream_deserialize(f)
         return cls(value, public_key)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[Output, int]:
+        (value,) = UINT64.unpack_from(view, offset)
+        public_key, offset = PublicKey.view_deserialize(view, offset + UINT64.size)
+        return cls(value, public_key), offset
+
     def stream_serialize(self, f: BinaryIO) -> None:
         f.write(struct.pack(b">Q", self.value))
         self.public_key.stream_serialize(f)
@@ -126,12 +172,30 @@ class Output(Serializable):
 
 class Transaction(Serializable):
 
-    def __init__(self, inputs: List[Input], outputs: List[Output], cached_hash: Optional[bytes] = None):
+    __slots__ = (
+        'version', 'inputs', 'outputs', 'cached_hash', 'cached_serialized', 'cached_signable_message', 'cached_sighash')
+
+    def __init__(
+        self,
+        inputs: List[Input],
+        outputs: List[Output],
+        cached_hash: Optional[bytes] = None,
+        cached_serialized: Optional[bytes] = None,
+        cached_signable_message: Optional[bytes] = None,
+    ):
         self.version = 0  # reserved for future use; the class does not take this as a param.
         self.inputs = inputs
         self.outputs = outputs
         self.cached_hash = cached_hash
 
+        # the bytes this transaction was deserialized from (if any); like cached_hash, this assumes that deserialized
+        # transactions are not mutated afterwards.
+        self.cached_serialized = cached_serialized
+
+        # see signable_message() and sighash()
+        self.cached_signable_message = cached_signable_message
+        self.cached_sighash: Optional[bytes] = None
+
     def __repr__(self) -> str:
         return "Transaction #%s" % human(self.hash())
 
@@ -152,15 +216,69 @@ class Transaction(Serializable):
         inputs = stream_deserialize_list(f, Input)
         outputs = stream_deserialize_list(f, Output)
 
-        # speed optimization: self.serialize() is very expensive, so when loading from disk,
-        # calculate the hash directly from the original bytes before discarding them.
+        # speed optimization: self.serialize() is very expensive, so when loading from disk, calculate the hash directly
+        # from the original bytes, and keep those around for later serialization.
         end_position = f.tell()
         f.seek(start_position)
-        cached_hash = sha256d(f.read(end_position - start_position))
+        serialized = f.read(end_position - start_position)
 
-        return cls(inputs, outputs, cached_hash)
+        return cls(inputs, outputs, sha256d(serialized), serialized)
+
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[Transaction, int]:
+        start_position = offset
+
+        if view[offset] != 0:
+            raise ValueError("Current version supports only version 0 transactions")
+
+        inputs, offset = view_deserialize_list(view, offset + 1, Input)
+        outputs, offset = view_deserialize_list(view, offset, Output)
+
+        cached_hash = sha256d(view[start_position:offset])
+        return cls(inputs, outputs, cached_hash, view_bytes(view, start_position, offset)), offset
+
+    @classmethod
+    def view_skip(cls, view: memoryview, offset: int) -> int:
+        """Returns the offset right after the transaction at offset. The transaction's layout is checked just like
+        view_deserialize does, but no objects are constructed (and nothing is hashed)."""
+        if view[offset] != 0:
+            raise ValueError("Current version supports only version 0 transactions")
+
+        input_count, offset = view_deserialize_vlq(view, offset + 1)
+        for _ in range(input_count):
+            offset += OUTPUT_REFERENCE_FIELDS.size
+            (type_indicator,) = TYPE_INDICATOR.unpack_from(view, offset)
+            offset += 1
+
+            if type_indicator == TYPE_SECP256k1:
+                offset += 64
+            elif type_indicator == TYPE_COINBASE_DATA:
+                (length,) = UINT8.unpack_from(view, offset + 4)
+                offset += 5 + length
+            elif type_indicator != TYPE_SIGNABLE_EQUIVALENT:
+                raise DeserializationError("Non-supported signature type.")
+
+        output_count, offset = view_deserialize_vlq(view, offset)
+        for _ in range(output_count):
+            (type_indicator,) = TYPE_INDICATOR.unpack_from(view, offset + UINT64.size)
+            if type_indicator != TYPE_SECP256k1:
+                raise DeserializationError("Non-supported public key type.")
+
+            offset += UINT64.size + 1 + 64
+
+        if offset > len(view):
+            raise SerializationTruncationError('Requested %i bytes but got %i' % (offset, len(view)))
+
+        return offset
+
+    def serialize(self) -> bytes:
+        return self.cached_serialized or super().serialize()
 
     def stream_serialize(self, f: BinaryIO) -> None:
+        if self.cached_serialized is not None:
+            f.write(self.cached_serialized)
+            return
+
         f.write(struct.pack(b"B", self.version))
         stream_serialize_list(f, self.inputs)
         stream_serialize_list(f, self.outputs)
@@ -179,9 +297,27 @@ class Transaction(Serializable):
             outputs=self.outputs,
         )
 
+    def signable_message(self) -> bytes:
+        """The message that is signed by each of the inputs' signatures, i.e. the serialized signable_equivalent. It is
+        the same for all inputs, so it is computed once (and kept, for repeated validation of the transaction)."""
+        if self.cached_signable_message is None:
+            self.cached_signable_message = self.signable_equivalent().serialize()
+
+        return self.cached_signable_message
+
+    def sighash(self) -> bytes:
+        """sha256d of the signable_message(), computed once; it stands in for the message in the verified signature
+        cache."""
+        if self.cached_sighash is None:
+            self.cached_sighash = sha256d(self.signable_message())
+
+        return self.cached_sighash
+
 
 class PowEvidence(Serializable):
 
+    __slots__ = ('summary_hash', 'chain_sample', 'block_hash')
+
     def __init__(self, summary_hash: bytes, chain_sample: bytes, block_hash: bytes):
         self.summary_hash = summary_hash
         self.chain_sample = chain_sample
@@ -210,6 +346,11 @@ class PowEvidence(Serializable):
 
         return cls(summary_hash, chain_sample, block_hash)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[PowEvidence, int]:
+        summary_hash, chain_sample, block_hash = POW_EVIDENCE_FIELDS.unpack_from(view, offset)
+        return cls(summary_hash, chain_sample, block_hash), offset + POW_EVIDENCE_FIELDS.size
+
     def stream_serialize(self, f: BinaryIO) -> None:
         f.write(self.summary_hash)
         f.write(self.chain_sample)
@@ -219,6 +360,8 @@ class PowEvidence(Serializable):
 class BlockSummary(Serializable):
     # akin to Bitcoin's BlockHeader. Our BlockHeader contains an PowEvidence also though, so we need an extra layer
 
+    __slots__ = ('height', 'previous_block_hash', 'merkle_root_hash', 'timestamp', 'target', 'nonce')
+
     def __init__(
         self,
         height: int,
@@ -265,6 +408,14 @@ class BlockSummary(Serializable):
 
         return cls(height, previous_block_hash, merkle_root_hash, timestamp, target, nonce)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[BlockSummary, int]:
+        height, offset = view_deserialize_vlq(view, offset)
+        previous_block_hash, merkle_root_hash, timestamp, target, nonce = BLOCK_SUMMARY_FIELDS.unpack_from(view, offset)
+
+        return (cls(height, previous_block_hash, merkle_root_hash, timestamp, target, nonce),
+                offset + BLOCK_SUMMARY_FIELDS.size)
+
     def stream_serialize(self, f: BinaryIO) -> None:
         stream_serialize_vlq(f, self.height)
         f.write(self.previous_block_hash)
@@ -279,6 +430,8 @@ class BlockSummary(Serializable):
 
 class BlockHeader(Serializable):
 
+    __slots__ = ('version', 'summary', 'pow_evidence')
+
     def __init__(self, summary: BlockSummary, pow_evidence: PowEvidence):
         self.version = 0
         self.summary = summary
@@ -304,6 +457,16 @@ class BlockHeader(Serializable):
 
         return cls(summary, pow_evidence)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[BlockHeader, int]:
+        if view[offset] != 0:
+            raise ValueError("Current version only supports version 0 blocks")
+
+        summary, offset = BlockSummary.view_deserialize(view, offset + 1)
+        pow_evidence, offset = PowEvidence.view_deserialize(view, offset)
+
+        return cls(summary, pow_evidence), offset
+
     def stream_serialize(self, f: BinaryIO) -> None:
         f.write(struct.pack(b"B", self.version))
 
@@ -315,11 +478,55 @@ class BlockHeader(Serializable):
 
 
 class Block(Serializable):
-    def __init__(self, header: BlockHeader, transactions: List[Transaction], hash: Optional[bytes] = None):
-        self.header = header
-        self.transactions = transactions
+
+    __slots__ = ('_header', '_transactions', 'transactions_offset', 'cached_hash', 'cached_serialized')
+
+    def __init__(
+        self,
+        header: BlockHeader,
+        transactions: Optional[List[Transaction]],
+        hash: Optional[bytes] = None,
+        serialized: Optional[bytes] = None,
+        transactions_offset: int = 0,
+    ):
+        """transactions may be None if serialized is given, in which case they are decoded from serialized (starting at
+        transactions_offset) on first access. Many uses of a block need only its header."""
+        self._header = header
+        self._transactions = transactions
+        self.transactions_offset = transactions_offset
         self.cached_hash = hash
 
+        # the bytes this block was deserialized from (if any), reused for validation, serving peers and storage.
+        self.cached_serialized = serialized
+
+    @property
+    def header(self) -> BlockHeader:
+        return self._header
+
+    @header.setter
+    def header(self, header: BlockHeader) -> None:
+        # the cached hash and serialized bytes (if any) are those of the previous header
+        transactions = self.transactions
+        self._header = header
+        self.transactions = transactions
+        self.cached_hash = None
+
+    @property
+    def transactions(self) -> List[Transaction]:
+        if self._transactions is None:
+            assert self.cached_serialized is not None
+            self._transactions, _ = view_deserialize_list(
+                memoryview(self.cached_serialized), self.transactions_offset, Transaction)
+
+        return self._transactions
+
+    @transactions.setter
+    def transactions(self, transactions: List[Transaction]) -> None:
+        # the serialized bytes (if any) are those of the previous transactions
+        self._transactions = transactions
+        self.cached_serialized = None
+        self.transactions_offset = 0
+
     def hash(self) -> bytes:
         return self.cached_hash or self.header.hash()
 
@@ -350,13 +557,37 @@ class Block(Serializable):
     def stream_deserialize(cls, f: BinaryIO) -> Block:
         start_position = f.tell()
         header = BlockHeader.stream_deserialize(f)
+        header_size = f.tell() - start_position
+        transactions = stream_deserialize_list(f, Transaction)
         end_position = f.tell()
+
         f.seek(start_position)
-        hash = sha256d(f.read(end_position - start_position))
-        transactions = stream_deserialize_list(f, Transaction)
-        return cls(header, transactions, hash)
+        serialized = f.read(end_position - start_position)
+        hash = sha256d(memoryview(serialized)[:header_size])
+        return cls(header, transactions, hash, serialized)
+
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[Block, int]:
+        # the header is decoded right away; the transactions are only skipped over, and decoded on first access.
+        start_position = offset
+        header, offset = BlockHeader.view_deserialize(view, offset)
+        hash = sha256d(view[start_position:offset])
+        transactions_offset = offset - start_position
+
+        transaction_count, offset = view_deserialize_vlq(view, offset)
+        for _ in range(transaction_count):
+            offset = Transaction.view_skip(view, offset)
+
+        return cls(header, None, hash, view_bytes(view, start_position, offset), transactions_offset), offset
+
+    def serialize(self) -> bytes:
+        return self.cached_serialized or super().serialize()
 
     def stream_serialize(self, f: BinaryIO) -> None:
+        if self.cached_serialized is not None:
+            f.write(self.cached_serialized)
+            return
+
         self.header.stream_serialize(f)
         stream_serialize_list(f, self.transactions)
 
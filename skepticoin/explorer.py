@@ -9,6 +9,7 @@ import immutables
 from collections import namedtuple
 from pathlib import Path
 
+from skepticoin.balances import uto_apply_block
 from skepticoin.coinstate import CoinState
 from skepticoin.signing import PublicKey
 from skepticoin.datatypes import Block, Output, OutputReference, Transaction
@@ -88,30 +89,16 @@ def pkb2_apply_block(
     return public_key_balances
 
 
-def get_unspent_transaction_outs_before_block(
-    coinstate: CoinState, block: Block
-) -> immutables.Map[OutputReference, Output]:
-    if block.previous_block_hash == b"\00" * 32:
-        return immutables.Map()
-    return coinstate.unspent_transaction_outs_by_hash[block.previous_block_hash]
-
-
-def build_pkb2_block(
-    coinstate: CoinState,
-    block: Block,
-    public_key_balances_2: immutables.Map[PublicKey, PKBalance2],
-) -> immutables.Map[PublicKey, PKBalance2]:
-    # TODO factor this away.
-    unspent_transaction_outs = get_unspent_transaction_outs_before_block(coinstate, block)
-    return pkb2_apply_block(unspent_transaction_outs, public_key_balances_2, block)
-
-
 def build_pkb2(coinstate: CoinState) -> immutables.Map[PublicKey, PKBalance2]:
     public_key_balances_2: immutables.Map[PublicKey, PKBalance2] = immutables.Map()
 
+    # we keep track of unspent_transaction_outs ourselves, because coinstate only has them for the most recent blocks
+    unspent_transaction_outs: immutables.Map[OutputReference, Output] = immutables.Map()
+
     for height in range(coinstate.head().height + 1):
         block = coinstate.at_head.block_by_height[height]
-        public_key_balances_2 = build_pkb2_block(coinstate, block, public_key_balances_2)
+        public_key_balances_2 = pkb2_apply_block(unspent_transaction_outs, public_key_balances_2, block)
+        unspent_transaction_outs = uto_apply_block(unspent_transaction_outs, block)
 
     return public_key_balances_2
 
@@ -119,6 +106,7 @@ def build_pkb2(coinstate: CoinState) -> immutables.Map[PublicKey, PKBalance2]:
 def build_explorer(coinstate: CoinState) -> None:
     explorer_dir = Path(os.environ["EXPLORER_DIR"])
     public_key_balances_2: immutables.Map[PublicKey, PKBalance2] = immutables.Map()
+    unspent_transaction_outs: immutables.Map[OutputReference, Output] = immutables.Map()
 
     for height in range(coinstate.head().height + 1):
         print("Block", height)
@@ -130,8 +118,8 @@ def build_explorer(coinstate: CoinState) -> None:
         else:
             msg = ""
 
-        unspent_transaction_outs = get_unspent_transaction_outs_before_block(coinstate, block)
-        public_key_balances_2 = build_pkb2_block(coinstate, block, public_key_balances_2)
+        # unspent_transaction_outs is the state _before_ the block, which is what's needed to show the inputs below
+        public_key_balances_2 = pkb2_apply_block(unspent_transaction_outs, public_key_balances_2, block)
 
         with open(explorer_dir / (human(block.hash()) + '.md'), 'w') as block_f:
 
@@ -198,6 +186,8 @@ Value | Address
 
                         transaction_f.write(f"""{v} | [{a}]({a}.md)\n""")
 
+        unspent_transaction_outs = uto_apply_block(unspent_transaction_outs, block)
+
     for pk, pkb2 in public_key_balances_2.items():
         v = show_coin(pkb2.value)
         address = "SKE" + human(pk.public_key) + "PTI"
@@ -1,8 +1,10 @@
 import hashlib
+from typing import Union
+
 from scrypt import hash as scrypt_hash
 
 
-def sha256d(b: bytes) -> bytes:
+def sha256d(b: Union[bytes, memoryview]) -> bytes:
     return hashlib.sha256(hashlib.sha256(b).digest()).digest()
 
 
@@ -25,6 +25,7 @@ from skepticoin.scripts.utils import (
     open_or_init_wallet,
     start_networking_peer_in_background,
     wait_for_fresh_chain,
+    configure_block_store_from_args,
     configure_logging_from_args,
     DefaultArgumentParser,
 )
@@ -104,6 +105,7 @@ class MinerWatcher:
 
     def __call__(self) -> None:
         configure_logging_from_args(self.args)
+        configure_block_store_from_args(self.args)
 
         check_chain_dir()
         self.coinstate = read_chain_from_disk()
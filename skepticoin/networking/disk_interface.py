@@ -1,7 +1,8 @@
 import datetime
 import os
-from skepticoin.blockstore import DefaultBlockStore
-from typing import Dict, List, Set, Tuple
+from skepticoin.blockstore import BlockStore, DefaultBlockStore
+from typing import Dict, List, Optional, Set, Tuple, Union
+from skepticoin.coinstate import CoinState
 from skepticoin.datatypes import Block, Transaction
 from skepticoin.networking.remote_peer import (
     DisconnectedRemotePeer, RemotePeer, load_peers_from_list
@@ -14,12 +15,24 @@ PEERS_JSON_FILE = "peers.json"
 
 PEERS_JSON_MAX_LEN = 100
 
+# The snapshot of a block database is kept next to it, e.g. in chain.db.snapshot for chain.db
+SNAPSHOT_SUFFIX = ".snapshot"
+
+# The snapshot is taken this many blocks below the head; those most recent blocks are replayed from chain.db on startup,
+# which means that forks near the head can still be followed after a restart.
+SNAPSHOT_DEPTH = 100
+
 PEER_URLS: List[str] = [
     "https://pastebin.com/raw/CcfPX9mS",
     "https://skepticoin.s3.amazonaws.com/peers.json",
 ]
 
 
+def get_snapshot_path(block_store: BlockStore) -> Optional[str]:
+    """None for an in-memory block database, which doesn't outlive the process anyway."""
+    return None if block_store.path == ":memory:" else block_store.path + SNAPSHOT_SUFFIX
+
+
 def load_peers_from_network() -> List[Tuple[str, int, str]]:
 
     all_peers: Set[Tuple[str, int, str]] = set()
@@ -88,10 +101,33 @@ class DiskInterface:
         os.replace(PEERS_JSON_FILE + ".new", PEERS_JSON_FILE)
 
     def save_block(self, block: Block) -> None:
-        DefaultBlockStore.instance.add_block_to_buffer(block)
+        DefaultBlockStore.get().add_block_to_buffer(block)
+
+    def flush_blocks(self, wait: bool = False) -> None:
+        DefaultBlockStore.get().flush_blocks_to_disk(wait=wait)
+
+    def save_utxo_head(self, block_hash: bytes) -> None:
+        DefaultBlockStore.get().set_utxo_head(block_hash)
+
+    def load_raw_block(self, block_hash: bytes) -> Optional[Union[bytes, memoryview]]:
+        return DefaultBlockStore.get().get_raw_block(block_hash)
+
+    def save_snapshot(self, coinstate: CoinState) -> None:
+        if coinstate.current_chain_hash is None:
+            return
+
+        block_store = DefaultBlockStore.get()
+        snapshot_path = get_snapshot_path(block_store)
+        if snapshot_path is None or block_store.read_only:
+            return
+
+        height = max(coinstate.head().height - SNAPSHOT_DEPTH, 0)
+        block_hash = coinstate.by_height_at_head()[height].hash()
+
+        with open(snapshot_path + ".new", "wb") as f:
+            coinstate.dump(f, block_hash, store_id=block_store.get_store_id())
 
-    def flush_blocks(self) -> None:
-        DefaultBlockStore.instance.flush_blocks_to_disk()
+        os.replace(snapshot_path + ".new", snapshot_path)
 
     def save_transaction_for_debugging(self, transaction: Transaction) -> None:
         with open("/tmp/%s.transaction" % human(transaction.hash()), 'wb') as f:
@@ -14,6 +14,8 @@ from typing import Optional
 from skepticoin.humans import human
 from skepticoin.networking.params import PORT
 from skepticoin.params import DESIRED_BLOCK_TIMESPAN
+from skepticoin.signing import verified_signature_cache
+from skepticoin.verification import signature_verifier
 from skepticoin.networking.manager import ChainManager, NetworkManager
 from skepticoin.utils import calc_work
 from time import time
@@ -181,6 +183,10 @@ class LocalPeer:
                 current_time = int(time())
                 self.step_managers(current_time)
                 self.handle_selector_events()
+
+            # clean shutdown: make sure the next startup doesn't have to replay the blocks we've seen since the last one
+            self.chain_manager.save_snapshot(wait=True)
+            self.disk_interface.flush_blocks(wait=True)
         except Exception:
             self.logger.error("Uncaught exception in LocalPeer.run()")
             self.logger.error(traceback.format_exc())
@@ -192,6 +198,7 @@ class LocalPeer:
     def stop(self) -> None:
         self.logger.info("%15s LocalPeer.stop()" % "")
         self.running = False
+        signature_verifier.shutdown()
 
     def show_stats(self) -> None:
         coinstate = self.chain_manager.coinstate
@@ -261,3 +268,4 @@ class LocalPeer:
         print("Current work:   ", calc_work(coinstate.head().target))
         print("Timespan factor:", get_block_timespan_factor(100))
         print("Hash rate:      ", get_network_hash_rate(100))
+        print("Signature cache: %d hits, %d misses" % (verified_signature_cache.hits, verified_signature_cache.misses))
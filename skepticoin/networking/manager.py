@@ -1,8 +1,8 @@
 from __future__ import annotations
 from skepticoin.networking.local_peer import DiskInterface
 import traceback
-from threading import Lock
-from typing import Dict, List, Optional, Set, Tuple
+from threading import Lock, Thread
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from skepticoin.coinstate import CoinState
 import random
@@ -19,6 +19,8 @@ from .params import (
     IBD_PEER_TIMEOUT,
     SWITCH_TO_ACTIVE_MODE_TIMEOUT,
     EMPTY_INVENTORY_BACKOFF,
+    SNAPSHOT_INTERVAL,
+    IBD_BUFFER_SIZE,
 )
 from skepticoin.datatypes import Block, Transaction
 from skepticoin.networking.remote_peer import ConnectedRemotePeer, DisconnectedRemotePeer, OUTGOING
@@ -151,8 +153,22 @@ class ChainManager(Manager):
         self.started_at = current_time
         self.transaction_pool: List[Transaction] = []
         self.last_known_valid_coinstate: Optional[CoinState] = None
+        self.last_snapshot_height: Optional[int] = None
+
+        # snapshots are written on a thread of their own: serializing the whole chain takes a while
+        self.snapshot_thread: Optional[Thread] = None
+
+        # during IBD, unvalidated blocks are collected here and added to the coinstate in a single batch
+        self.buffered_blocks: List[Block] = []
+
+        # blocks that have been added to the coinstate, but not validated (yet); they are only saved to disk once a
+        # validated coinstate builds on them, and they are dropped if it turns out that they're not valid.
+        self.unsaved_blocks: List[Block] = []
 
     def step(self, current_time: int) -> None:
+        self.flush_buffered_blocks()
+        self.save_snapshot_periodically()
+
         if not self.should_actively_fetch_blocks(current_time):
             return  # no manual action required, blocks expected to be sent to us instead.
 
@@ -186,6 +202,79 @@ class ChainManager(Manager):
         # timeout is only implemented half-baked: it currently only limits when an new GetBlocksMessage will be sent;
         # but doesn't take the timed-out peer out of the loop that it's already in. This is not necessarily a bad thing.
 
+    def save_snapshot_periodically(self) -> None:
+        if self.last_snapshot_height is None:
+            # i.e. the state we started with, which needs no new snapshot
+            self.last_snapshot_height = self.coinstate.head().height
+
+        elif (self.last_known_valid_coinstate is not None and
+              self.last_known_valid_coinstate.head().height >= self.last_snapshot_height + SNAPSHOT_INTERVAL):
+            self.save_snapshot()
+
+    def save_snapshot(self, wait: bool = False) -> None:
+        # only validated states are snapshotted, since the snapshot is trusted as-is when it is read back.
+        coinstate = self.last_known_valid_coinstate
+        if coinstate is None:
+            return
+
+        if self.snapshot_thread is not None and self.snapshot_thread.is_alive():
+            if not wait:
+                return  # still busy with the previous one
+            self.snapshot_thread.join()
+
+        self.local_peer.logger.info("%15s ChainManager.save_snapshot(%s)" % ("", coinstate))
+        self.last_snapshot_height = coinstate.head().height
+
+        # a CoinState is immutable, so it can be serialized on another thread while we move on
+        self.snapshot_thread = Thread(
+            target=self.local_peer.disk_interface.save_snapshot, args=(coinstate,), name="Snapshot writer", daemon=True)
+        self.snapshot_thread.start()
+
+        if wait:
+            self.snapshot_thread.join()
+
+    def can_buffer_block(self, block: Block) -> bool:
+        """Can block be buffered, i.e. does it directly extend the (buffered) chain?"""
+        if self.buffered_blocks:
+            return bool(block.previous_block_hash == self.buffered_blocks[-1].hash())
+
+        return block.hash() not in self.coinstate.block_by_hash and self.coinstate.is_extendable(
+            block.previous_block_hash)
+
+    def buffer_block(self, block: Block) -> None:
+        self.buffered_blocks.append(block)
+
+        if len(self.buffered_blocks) >= IBD_BUFFER_SIZE:
+            self.flush_buffered_blocks()
+
+    def flush_buffered_blocks(self) -> None:
+        if not self.buffered_blocks:
+            return
+
+        blocks, self.buffered_blocks = self.buffered_blocks, []
+
+        try:
+            coinstate = self.coinstate.add_blocks(blocks)
+        except Exception:
+            # e.g. a block that spends an output that doesn't exist (buffered blocks aren't validated in-coinstate):
+            # the chain that we're downloading is no good, at least not beyond the last validated block.
+            self.local_peer.logger.info("%15s INVALID buffered blocks: %s" % ("", traceback.format_exc()))
+            self.fall_back_to_last_known_valid_coinstate()
+            return
+
+        self.set_coinstate(coinstate, validated=False, added_blocks=blocks)
+
+    def fall_back_to_last_known_valid_coinstate(self) -> None:
+        """Forget the blocks that were added since the last validated coinstate, e.g. because one of them turned out to
+        be invalid; none of those has been saved to disk."""
+        with self.lock:
+            self.buffered_blocks = []
+            self.unsaved_blocks = []
+            coinstate = self.last_known_valid_coinstate
+
+        if coinstate is not None:
+            self.set_coinstate(coinstate)
+
     def should_actively_fetch_blocks(self, current_time: int) -> bool:
 
         return (
@@ -194,13 +283,36 @@ class ChainManager(Manager):
             or (current_time % 60 == 0)  # on average, every 1 minutes, do a network resync explicitly
         )
 
-    def set_coinstate(self, coinstate: CoinState, validated: bool = True) -> None:
+    def set_coinstate(self, coinstate: CoinState, validated: bool = True, added_blocks: Iterable[Block] = ()) -> None:
+        """added_blocks are the blocks that were added to the current coinstate to get coinstate; they're saved to disk
+        once they've been validated, i.e. right away if validated is True."""
         with self.lock:
             self.local_peer.logger.info("%15s ChainManager.set_coinstate(%s)" % ("", coinstate))
             self.coinstate = coinstate
             self._cleanup_transaction_pool_for_coinstate(coinstate)
+            self.unsaved_blocks.extend(added_blocks)
             if validated:
                 self.last_known_valid_coinstate = coinstate
+                self._save_validated_blocks(coinstate)
+                if coinstate.current_chain_hash is not None:
+                    self.local_peer.disk_interface.save_utxo_head(coinstate.current_chain_hash)
+
+    def _save_validated_blocks(self, coinstate: CoinState) -> None:
+        # (called with self.lock held) a valid head implies that all its ancestors are valid too. Blocks on other forks
+        # remain unsaved, unless they can't be built upon anymore, in which case they're dropped.
+        if coinstate.current_chain_hash is None:
+            return
+
+        by_height = coinstate.by_height_at_head()
+        still_unsaved = []
+
+        for block in self.unsaved_blocks:
+            if block.height in by_height and by_height[block.height].hash() == block.hash():
+                self.local_peer.disk_interface.save_block(block)
+            elif coinstate.is_extendable(block.hash()):
+                still_unsaved.append(block)
+
+        self.unsaved_blocks = still_unsaved
 
     def add_transaction_to_pool(self, transaction: Transaction) -> bool:
         with self.lock:
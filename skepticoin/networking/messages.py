@@ -3,7 +3,7 @@ from __future__ import annotations
 import datetime
 import struct
 from ipaddress import IPv6Address
-from typing import Dict, List, Type, BinaryIO
+from typing import Dict, List, Optional, Tuple, Type, BinaryIO, Union
 
 from skepticoin.datatypes import Block, BlockHeader, Transaction
 from skepticoin.serialization import (
@@ -14,6 +14,7 @@ from skepticoin.serialization import (
     stream_deserialize_vlq,
     stream_serialize_list,
     stream_serialize_vlq,
+    view_read,
 )
 
 
@@ -30,6 +31,9 @@ DATA_HEADER = b'\x00\x01'
 DATA_TRANSACTION = b'\x00\x02'
 
 
+# version, timestamp, id, in_response_to, context, reserved space
+MESSAGE_HEADER_FIELDS = struct.Struct(b">BIIIQ32x")
+
 DATATYPES: Dict[bytes, Type[Serializable]] = {
     DATA_BLOCK: Block,
     DATA_HEADER: BlockHeader,
@@ -61,6 +65,11 @@ class MessageHeader(Serializable):
 
         return cls(timestamp, id, in_response_to, context)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[MessageHeader, int]:
+        version, timestamp, id, in_response_to, context = MESSAGE_HEADER_FIELDS.unpack_from(view, offset)
+        return cls(timestamp, id, in_response_to, context), offset + MESSAGE_HEADER_FIELDS.size
+
     def stream_serialize(self, f: BinaryIO) -> None:
         f.write(struct.pack(b"B", self.version))
 
@@ -106,6 +115,15 @@ class Message(Serializable):
 
         raise DeserializationError("Non-supported message type")
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[Message, int]:
+        # DataMessages (i.e. blocks and transactions) are read from the view itself; the other messages are small, and
+        # are read by way of stream_deserialize.
+        if cls is Message and view[offset:offset + 2] == MSG_DATA:
+            return DataMessage.view_deserialize(view, offset + 2)
+
+        return super().view_deserialize(view, offset)
+
 
 class SupportedVersion(Serializable):
     def __init__(self, version: int):
@@ -290,12 +308,16 @@ class GetDataMessage(Message):
 
 
 class DataMessage(Message):
-    def __init__(self, data_type: bytes, data: Serializable):
+    def __init__(
+            self, data_type: bytes, data: Serializable, serialized_data: Optional[Union[bytes, memoryview]] = None):
         self.version = 0
 
         self.data_type = data_type
         self.data = data
 
+        # when known (e.g. read from disk), data's serialized form; used as-is when sending the message
+        self.serialized_data = serialized_data
+
     @classmethod
     def stream_deserialize(cls, f: BinaryIO) -> DataMessage:
         # type_indicator has been read already by the superclass at this point.
@@ -309,12 +331,28 @@ class DataMessage(Message):
 
         return cls(data_type, data)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[DataMessage, int]:
+        # type_indicator has been read already by the superclass at this point.
+        if view[offset] != 0:
+            raise ValueError("Current version supports only version 0 DataMessage")
+
+        data_type, offset = view_read(view, offset + 1, 2)
+
+        clz = DATATYPES[data_type]
+        data, offset = clz.view_deserialize(view, offset)
+
+        return cls(data_type, data), offset
+
     def stream_serialize(self, f: BinaryIO) -> None:
         f.write(MSG_DATA)
         f.write(struct.pack(b"B", self.version))
 
         f.write(self.data_type)
-        self.data.stream_serialize(f)
+        if self.serialized_data is not None:
+            f.write(self.serialized_data)
+        else:
+            self.data.stream_serialize(f)
 
 
 class GetPeersMessage(Message):
@@ -14,8 +14,11 @@ MAX_MESSAGE_SIZE = 32 * 1024 * 1024
 MAX_IBD_PEERS = 1
 IBD_PEER_TIMEOUT = 60
 IBD_VALIDATION_SKIP = 10000
+IBD_BUFFER_SIZE = 1000  # unvalidated IBD blocks are added to the coinstate in batches of (at most) this size
 
 GET_BLOCKS_INVENTORY_SIZE = 500
 
 SWITCH_TO_ACTIVE_MODE_TIMEOUT = 5 * 60  # if your chain is 5 minutes old, start querying for blocks actively
 EMPTY_INVENTORY_BACKOFF = 60  # wait this long before asking a node about inventory again on an empty response
+
+SNAPSHOT_INTERVAL = 10_000  # write a CoinState snapshot to disk every this many blocks (and on clean shutdown)
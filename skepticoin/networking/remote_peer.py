@@ -5,13 +5,11 @@ import traceback
 from ipaddress import IPv6Address
 from typing import Dict, TYPE_CHECKING, Tuple
 
-from skepticoin.blockstore import DefaultBlockStore
-
 if TYPE_CHECKING:
     from skepticoin.networking.local_peer import LocalPeer
 
 from time import time
-from typing import List, Optional
+from typing import List, Optional, Union
 
 import struct
 import socket
@@ -27,6 +25,7 @@ from .params import (
     MAX_TIME_BETWEEN_CONNECTION_ATTEMPTS,
 )
 from skepticoin.datatypes import Block, Transaction
+from skepticoin.serialization import deserialize_view, DESERIALIZE_VIEW, Serializable
 from skepticoin.networking.params import MAX_MESSAGE_SIZE
 from .messages import (
     DATATYPES,
@@ -117,9 +116,15 @@ class MessageReceiver:
             self.receive(b"")  # recurse to repeat (multiple messages could be received in a single socket read)
 
     def handle_message_data(self, message_data: bytes) -> None:
-        f = BytesIO(message_data)
-        header = MessageHeader.stream_deserialize(f)
-        message = Message.stream_deserialize(f)
+        if Serializable.deserializer == DESERIALIZE_VIEW:
+            view = memoryview(message_data)
+            header, offset = deserialize_view(MessageHeader, view, 0)
+            message, _ = deserialize_view(Message, view, offset)
+        else:
+            f = BytesIO(message_data)
+            header = MessageHeader.stream_deserialize(f)
+            message = Message.stream_deserialize(f)
+
         self.peer.handle_message_received(header, message)
 
 
@@ -429,7 +434,13 @@ class ConnectedRemotePeer(RemotePeer):
                 self.host, human(get_data_message.hash)))
             return
 
-        data_message = DataMessage(DATA_BLOCK, coinstate.block_by_hash[get_data_message.hash])
+        # the block's bytes as received (or else as stored on disk, if it has been written already) save us from
+        # serializing it again
+        block = coinstate.block_by_hash[get_data_message.hash]
+        serialized_block: Optional[Union[bytes, memoryview]] = block.cached_serialized
+        if serialized_block is None:
+            serialized_block = self.local_peer.disk_interface.load_raw_block(get_data_message.hash)
+        data_message = DataMessage(DATA_BLOCK, block, serialized_block)
 
         self.local_peer.logger.debug("%15s ConnectedRemotePeer.handle_data_message_received for hash %s h. %s" % (
             self.host, human(get_data_message.hash), coinstate.block_by_hash[get_data_message.hash].height))
@@ -454,11 +465,30 @@ class ConnectedRemotePeer(RemotePeer):
 
         block: Block = message.data  # type: ignore
 
-        coinstate_prior = self.local_peer.chain_manager.coinstate
+        chain_manager = self.local_peer.chain_manager
 
         block_hash = block.hash()
         self.remove_from_inventory(block_hash)
 
+        if header.in_response_to != 0 and block.height % IBD_VALIDATION_SKIP != 0 and \
+                chain_manager.can_buffer_block(block):
+            # The common case during IBD: a block that won't be validated in-coinstate (see below) and that extends the
+            # chain we're downloading. Rather than creating a new coinstate per block, such blocks are added in batches.
+            try:
+                validate_block_by_itself(block, int(time()))
+            except Exception as e:
+                self.local_peer.logger.info(
+                    "%15s at height=%d, block received is invalid: %s, error = %s" % (
+                        self.host, block.height, human(block_hash), str(e)))
+                return
+
+            chain_manager.buffer_block(block)
+            return
+
+        # anything else is handled against the coinstate that includes all blocks received so far
+        chain_manager.flush_buffered_blocks()
+        coinstate_prior = chain_manager.coinstate
+
         if block_hash not in coinstate_prior.block_by_hash:
 
             if block.header.summary.previous_block_hash not in coinstate_prior.block_by_hash:
@@ -468,6 +498,11 @@ class ConnectedRemotePeer(RemotePeer):
                                                human(block_hash)))
                 return
 
+            if not coinstate_prior.is_extendable(block.header.summary.previous_block_hash):
+                self.local_peer.logger.info("%15s at height=%d, block received forks off below finality depth: %s"
+                                            % (self.host, coinstate_prior.head().height, human(block_hash)))
+                return
+
             try:
                 validate_block_by_itself(block, int(time()))
             except Exception as e:
@@ -476,7 +511,6 @@ class ConnectedRemotePeer(RemotePeer):
                         self.host, coinstate_prior.head().height, human(block_hash), str(e)))
                 return
 
-            self.local_peer.disk_interface.save_block(block)
             coinstate_changed = coinstate_prior.add_block_no_validation(block)
 
             if header.in_response_to == 0 or block.height % IBD_VALIDATION_SKIP == 0:
@@ -491,16 +525,14 @@ class ConnectedRemotePeer(RemotePeer):
 
                 except Exception:
                     self.local_peer.logger.info("%15s INVALID block: %s" % (self.host, traceback.format_exc()))
-                    if self.local_peer.chain_manager.last_known_valid_coinstate:
-                        self.local_peer.chain_manager.set_coinstate(
-                            self.local_peer.chain_manager.last_known_valid_coinstate)
-                    DefaultBlockStore.instance.write_buffer.clear()  # don't save bad blocks
+                    # the blocks since the last validated one were never saved, so there's nothing to undo on disk
+                    self.local_peer.chain_manager.fall_back_to_last_known_valid_coinstate()
                     return
 
-                self.local_peer.chain_manager.set_coinstate(coinstate_changed, validated=True)
+                self.local_peer.chain_manager.set_coinstate(coinstate_changed, validated=True, added_blocks=[block])
                 self.local_peer.disk_interface.flush_blocks()
             else:
-                self.local_peer.chain_manager.set_coinstate(coinstate_changed, validated=False)
+                self.local_peer.chain_manager.set_coinstate(coinstate_changed, validated=False, added_blocks=[block])
 
             if block == coinstate_changed.head() and header.in_response_to == 0:
                 # "header.in_response_to == 0" is being used as a bit of a proxy for "not in IBD" here, but it would be
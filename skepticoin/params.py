@@ -40,6 +40,10 @@ INITIAL_TARGET = (1 << (8 * 31)).to_bytes(length=32, byteorder='big')
 # synchronize them "mostly correctly"? i.e. in the couple-of-seconds range? The constant below should be plenty.
 MAX_FUTURE_BLOCK_TIME = 30
 
+# Forks that branch off more than this many blocks below the head are not considered at all (Bitcoin has no such rule,
+# and keeps the state needed to consider them around forever). The checkpoints in cheating.py make the same point.
+FINALITY_DEPTH = 1000
+
 
 # POW Evidence
 CHAIN_SAMPLE_COUNT = 8
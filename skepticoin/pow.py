@@ -11,10 +11,9 @@ we can observe the trick. Here we deviate from that approach somewhat, for the f
   last.
 """
 
-from .datatypes import Block
 from .hash import sha256d
 
-from typing import Callable
+from typing import Callable, Union
 
 
 def select_block_height(input_hash: bytes, current_height: int) -> int:
@@ -27,7 +26,7 @@ def select_block_height(input_hash: bytes, current_height: int) -> int:
     return base % current_height
 
 
-def select_block_slice(hash: bytes, serialized_block: bytes, length: int) -> bytes:
+def select_block_slice(hash: bytes, serialized_block: Union[bytes, memoryview], length: int) -> bytes:
     # we interpret the next 4 bytes of the hash as a number, and then modulo block length. Support for up to 4GiB blocks
 
     base = int.from_bytes(hash[8:12], byteorder='big', signed=False)
@@ -44,20 +43,18 @@ def select_block_slice(hash: bytes, serialized_block: bytes, length: int) -> byt
 def select_slice_from_chain(
     input_hash: bytes,
     current_height: int,
-    get_block_by_height: Callable[[int], Block],
+    get_serialized_block_by_height: Callable[[int], Union[bytes, memoryview]],
     length: int,
 ) -> bytes:
     selected_block_height = select_block_height(input_hash, current_height)
 
-    selected_block = get_block_by_height(selected_block_height)
-
-    return select_block_slice(input_hash, selected_block.serialize(), length)
+    return select_block_slice(input_hash, get_serialized_block_by_height(selected_block_height), length)
 
 
 def select_n_k_length_slices_from_chain(
     starting_hash: bytes,
     current_height: int,
-    get_block_by_height: Callable[[int], Block],
+    get_serialized_block_by_height: Callable[[int], Union[bytes, memoryview]],
     n: int,
     k: int,
 ) -> bytes:
@@ -65,7 +62,7 @@ def select_n_k_length_slices_from_chain(
 
     current_hash = starting_hash
     for i in range(n):
-        b = select_slice_from_chain(current_hash, current_height, get_block_by_height, k)
+        b = select_slice_from_chain(current_hash, current_height, get_serialized_block_by_height, k)
         result.append(b)
 
         if i != n - 1:
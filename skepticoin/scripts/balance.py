@@ -5,6 +5,7 @@ from .utils import (
     open_or_init_wallet,
     check_chain_dir,
     read_chain_from_disk,
+    configure_block_store_from_args,
     configure_logging_from_args,
     start_networking_peer_in_background,
     wait_for_fresh_chain,
@@ -18,6 +19,7 @@ def main() -> None:
     parser = DefaultArgumentParser()
     args = parser.parse_args()
     configure_logging_from_args(args)
+    configure_block_store_from_args(args)
 
     check_chain_dir()
     coinstate = read_chain_from_disk()
@@ -31,12 +33,14 @@ def main() -> None:
     coinstate = thread.local_peer.chain_manager.coinstate
     print("Chain up to date")
 
+    # brings the address index up to date, so that the balance is a matter of a few indexed lookups
+    DefaultBlockStore.get().flush_blocks_to_disk()
+
     print(
-        wallet.get_balance(coinstate) / SASHIMI_PER_COIN, "SKEPTI at h. %s," % coinstate.head().height,
+        wallet.get_balance(coinstate, DefaultBlockStore.get()) / SASHIMI_PER_COIN,
+        "SKEPTI at h. %s," % coinstate.head().height,
         datetime.fromtimestamp(coinstate.head().timestamp).isoformat())
 
-    DefaultBlockStore.instance.flush_blocks_to_disk()
-
     print("Waiting for networking thread to exit.")
     thread.stop()
     thread.join()
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from skepticoin.blockstore import DefaultBlockStore
+from skepticoin.bootstrap import export_bootstrap, import_bootstrap
+from skepticoin.networking.disk_interface import DiskInterface
+
+from .utils import (
+    check_chain_dir,
+    read_chain_from_disk,
+    configure_block_store_from_args,
+    configure_logging_from_args,
+    DefaultArgumentParser,
+)
+
+
+def main() -> None:
+    parser = DefaultArgumentParser()
+    parser.add_argument("command", choices=["export", "import"],
+                        help="export: write your chain to a bootstrap file; import: add the chain from one")
+    parser.add_argument("bootstrap_file")
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+    configure_block_store_from_args(args)
+
+    check_chain_dir()
+    coinstate = read_chain_from_disk()
+
+    started = datetime.now()
+
+    if args.command == "export":
+        with open(args.bootstrap_file, "wb") as f:
+            n_blocks = export_bootstrap(coinstate, f)
+        print(f"Exported {n_blocks} blocks to {args.bootstrap_file} in {datetime.now() - started}")
+        return
+
+    with open(args.bootstrap_file, "rb") as f:
+        coinstate = import_bootstrap(f, coinstate, DefaultBlockStore.get(), verbose=True)
+
+    assert coinstate.current_chain_hash is not None
+    DefaultBlockStore.get().catch_up_utxo_set(coinstate.current_chain_hash, verbose=True)
+
+    # so that the next start doesn't have to replay all of the imported blocks
+    DiskInterface().save_snapshot(coinstate)
+
+    print(f"Imported the chain up to height {coinstate.head().height} in {datetime.now() - started}")
@@ -9,6 +9,7 @@ import skepticoin.signing
 import skepticoin.humans
 from skepticoin.params import SASHIMI_PER_COIN
 from skepticoin.scripts.utils import (
+    configure_block_store_from_args,
     configure_logging_from_args,
     check_chain_dir,
     read_chain_from_disk,
@@ -31,6 +32,7 @@ def main() -> None:
     parser.add_argument("--vi-mode", help="Vi mode", action="store_true")
     args = parser.parse_args()
     configure_logging_from_args(args)
+    configure_block_store_from_args(args)
 
     check_chain_dir()
     coinstate = read_chain_from_disk()
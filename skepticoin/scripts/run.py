@@ -5,6 +5,7 @@ from .utils import (
     read_chain_from_disk,
     open_or_init_wallet,
     start_networking_peer_in_background,
+    configure_block_store_from_args,
     configure_logging_from_args,
     DefaultArgumentParser,
 )
@@ -20,6 +21,7 @@ def main() -> None:
     parser.add_argument("script_file")
     args = parser.parse_args()
     configure_logging_from_args(args)
+    configure_block_store_from_args(args)
 
     check_chain_dir()
     coinstate = read_chain_from_disk()
@@ -15,6 +15,7 @@ from .utils import (
     open_or_init_wallet,
     start_networking_peer_in_background,
     wait_for_fresh_chain,
+    configure_block_store_from_args,
     configure_logging_from_args,
     DefaultArgumentParser,
 )
@@ -27,6 +28,7 @@ def main() -> None:
     parser.add_argument("address", help="The address to send to")
     args = parser.parse_args()
     configure_logging_from_args(args)
+    configure_block_store_from_args(args)
 
     value = args.amount * (SASHIMI_PER_COIN if args.denomination == 'skepticoin' else 1)
 
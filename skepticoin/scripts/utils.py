@@ -1,4 +1,4 @@
-from skepticoin.blockstore import DefaultBlockStore
+from skepticoin.blockstore import BlockStore, DefaultBlockStore
 import sys
 from pathlib import Path
 from time import sleep, time
@@ -7,12 +7,17 @@ import os
 import tempfile
 import logging
 import argparse
+from itertools import islice
 
 from skepticoin.coinstate import CoinState
+from skepticoin.networking.disk_interface import get_snapshot_path
 from skepticoin.networking.threading import NetworkingThread
+from skepticoin.verification import signature_verifier
 from skepticoin.wallet import Wallet, save_wallet
 from skepticoin.humans import human
 
+READ_CHAIN_BATCH_SIZE = 10_000
+
 
 class DefaultArgumentParser(argparse.ArgumentParser):
     def __init__(self, *args: Any, **kwargs: Any):
@@ -21,6 +26,14 @@ class DefaultArgumentParser(argparse.ArgumentParser):
         self.add_argument("--listening-port", help="Port to listen on", type=int, default=2412)
         self.add_argument("--log-to-file", help="Log to file", action="store_true")
         self.add_argument("--log-to-stdout", help="Log to stdout", action="store_true")
+        self.add_argument("--chain-db", help="Block database to use (':memory:' for an in-memory one)",
+                          default="chain.db")
+        self.add_argument("--prune-depth", help="Only keep full transaction data for the most recent blocks",
+                          type=int, default=None)
+        self.add_argument("--read-only", help="Don't write to the block database (which must exist already)",
+                          action="store_true")
+        self.add_argument("--verification-workers", help="Worker processes for verifying signatures (default: one "
+                          "less than the number of CPUs, at most 4; 0 to verify in-process)", type=int, default=None)
 
 
 def check_chain_dir() -> None:
@@ -39,14 +52,77 @@ def wait_for_fresh_chain(thread: NetworkingThread, freshness: int) -> None:
         sleep(10)
 
 
-def read_chain_from_disk() -> CoinState:
+def read_snapshot_from_disk(block_store: BlockStore) -> Optional[CoinState]:
+    snapshot_path = get_snapshot_path(block_store)
+    if snapshot_path is None or not os.path.isfile(snapshot_path):
+        return None
+
+    store_id = block_store.get_store_id()
+    if store_id is None:
+        print(f"Ignoring {snapshot_path}: {block_store.path} has no id to check it against")
+        return None
+
+    print("Reading snapshot from " + snapshot_path)
+    try:
+        with open(snapshot_path, "rb") as f:
+            coinstate = CoinState.load(f, block_file=block_store.block_file, store_id=store_id)
+    except Exception as e:
+        print(f"Ignoring unreadable {snapshot_path} (falling back to reading all blocks): {e}")
+        return None
+
+    if coinstate.current_chain_hash is not None and not block_store.has_block(coinstate.current_chain_hash):
+        print(f"Ignoring {snapshot_path}: its head is not in {block_store.path} (falling back to reading all blocks)")
+        return None
+
+    return coinstate
+
+
+def add_blocks_from_disk(coinstate: CoinState, block_store: BlockStore, start_height: int, strict: bool) -> CoinState:
+    """
+    Adds the blocks from block_store at start_height and up to coinstate. Blocks that can't be added are skipped, except
+    with strict=True, where that raises an exception unless the block is on a fork that coinstate can't extend anyway.
+    """
+    blocks = block_store.read_blocks_from_disk(start_height)
+    while True:
+        batch = list(islice(blocks, READ_CHAIN_BATCH_SIZE))
+        if not batch:
+            break
 
-    coinstate = CoinState.empty()
-    for block in DefaultBlockStore.instance.read_blocks_from_disk():
         try:
-            coinstate = coinstate.add_block_no_validation(block)
+            coinstate = coinstate.add_blocks(batch)
         except Exception:
-            print(f'Skipping block_hash={human(block.hash())} @ height={block.height}')
+            # add the batch block by block to find out which blocks are the problem
+            for block in batch:
+                try:
+                    coinstate = coinstate.add_block_no_validation(block)
+                except Exception:
+                    if strict and coinstate.is_extendable(block.previous_block_hash):
+                        raise
+                    print(f'Skipping block_hash={human(block.hash())} @ height={block.height}')
+
+    return coinstate
+
+
+def read_chain_from_disk() -> CoinState:
+    block_store = DefaultBlockStore.get()
+
+    snapshot = read_snapshot_from_disk(block_store)
+    coinstate: Optional[CoinState] = None
+
+    if snapshot is not None and snapshot.current_chain_hash is not None:
+        try:
+            # the snapshot is (typically) a little below the head; the blocks above it are replayed
+            coinstate = add_blocks_from_disk(snapshot, block_store, snapshot.head().height + 1, strict=True)
+        except Exception as e:
+            print(f"Replaying blocks on the snapshot failed (falling back to reading all blocks): {e}")
+
+    if coinstate is None:
+        coinstate = add_blocks_from_disk(
+            CoinState.empty(block_file=block_store.block_file), block_store, 0, strict=False)
+
+    if coinstate.current_chain_hash is not None:
+        # the writer thread only brings the UTXO set along by a few blocks at a time
+        block_store.catch_up_utxo_set(coinstate.current_chain_hash, verbose=True)
 
     # It is no longer possible to load old files, due to pickle issues not worth solving.
 
@@ -76,6 +152,7 @@ def start_networking_peer_in_background(
 ) -> NetworkingThread:
     print("Starting networking peer in background")
     port: Optional[int] = None if args.dont_listen else args.listening_port
+    signature_verifier.start(args.verification_workers)  # shut down along with the LocalPeer
     thread = NetworkingThread(coinstate, port)
     thread.start()
     return thread
@@ -93,6 +170,10 @@ def configure_logging_for_stdout() -> None:
     logging.basicConfig(format=FORMAT, stream=sys.stdout, level=logging.INFO)
 
 
+def configure_block_store_from_args(args: Any) -> None:
+    DefaultBlockStore.configure(path=args.chain_db, read_only=args.read_only, prune_depth=args.prune_depth)
+
+
 def configure_logging_from_args(args: Any) -> None:
     if args.log_to_file:
         configure_logging_for_file()
@@ -2,7 +2,17 @@ from __future__ import annotations
 
 import struct
 from io import BytesIO
-from typing import Any, BinaryIO, List, Sequence, Type
+from typing import Any, BinaryIO, List, Sequence, Tuple, Type, Union
+
+# The decoding engines for Serializable.deserialize: DESERIALIZE_STREAM reads each field from a BytesIO, by way of
+# stream_deserialize; DESERIALIZE_VIEW walks a memoryview with an offset cursor, by way of view_deserialize. Both
+# produce identical objects.
+DESERIALIZE_STREAM = "stream"
+DESERIALIZE_VIEW = "view"
+
+TYPE_INDICATOR = struct.Struct(b"c")
+UINT8 = struct.Struct(b"B")
+UINT64 = struct.Struct(b">Q")
 
 
 class DeserializationError(Exception):
@@ -18,17 +28,37 @@ class SerializationTruncationError(SerializationError):
 
 
 class Serializable:
+    __slots__ = ()
+
+    # the engine used by deserialize(), either DESERIALIZE_VIEW or DESERIALIZE_STREAM; set it on Serializable itself.
+    deserializer = DESERIALIZE_VIEW
+
     def serialize(self) -> bytes:
         f = BytesIO()
         self.stream_serialize(f)
         return f.getvalue()
 
     @classmethod
-    def deserialize(cls, bytes_: bytes) -> Any:
+    def deserialize(cls, bytes_: Union[bytes, memoryview]) -> Any:
+        if Serializable.deserializer == DESERIALIZE_VIEW:
+            result, _ = deserialize_view(cls, memoryview(bytes_), 0)
+            return result
+
         f = BytesIO(bytes_)
         f.seek(0)
         return cls.stream_deserialize(f)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[Any, int]:
+        """Deserializes an object from view, starting at offset; returns it and the offset right after it. Classes
+        without a view-based implementation fall back to their stream_deserialize.
+
+        For speed, implementations read fixed-size fields straight from the view (struct.unpack_from, indexing) and
+        let running out of bytes surface as struct.error or IndexError; call this by way of deserialize_view."""
+        f = BytesIO(view[offset:])
+        result = cls.stream_deserialize(f)
+        return result, offset + f.tell()
+
     def stream_serialize(self, f: BinaryIO) -> None:
         raise NotImplementedError
 
@@ -46,6 +76,32 @@ def safe_read(f: BinaryIO, n: int) -> bytes:
     return r
 
 
+def deserialize_view(clz: Type, view: memoryview, offset: int) -> Tuple[Any, int]:
+    """clz.view_deserialize(view, offset), with running out of bytes reported as SerializationTruncationError."""
+    try:
+        result: Tuple[Any, int] = clz.view_deserialize(view, offset)
+        return result
+    except (struct.error, IndexError) as e:
+        raise SerializationTruncationError(str(e))
+
+
+def view_read(view: memoryview, offset: int, n: int) -> Tuple[bytes, int]:
+    r = view[offset:offset + n].tobytes()
+
+    if len(r) < n:
+        raise SerializationTruncationError('Requested %i bytes but got %i' % (n, len(r)))
+
+    return r, offset + n
+
+
+def view_bytes(view: memoryview, start: int, end: int) -> bytes:
+    """view[start:end] as bytes; without copying if that is exactly the bytes object that view was made of."""
+    if start == 0 and end == len(view) and isinstance(view.obj, bytes) and len(view.obj) == end:
+        return view.obj
+
+    return view[start:end].tobytes()
+
+
 def stream_serialize_list(f: BinaryIO, lst: Sequence[Serializable]) -> None:
     stream_serialize_vlq(f, len(lst))
     for elem in lst:
@@ -60,6 +116,21 @@ def stream_deserialize_list(f: BinaryIO, clz: Type) -> List[Any]:
     return result
 
 
+def view_deserialize_list(view: memoryview, offset: int, clz: Type) -> Tuple[List[Any], int]:
+    result: List[Type] = []
+
+    length = view[offset]
+    if length < 64:
+        offset += 1  # the common case of a single-byte VLQ, inlined (stream_serialize_vlq uses 2 bytes from 64 on)
+    else:
+        length, offset = view_deserialize_vlq(view, offset)
+
+    for _ in range(length):
+        elem, offset = clz.view_deserialize(view, offset)
+        result.append(elem)
+    return result, offset
+
+
 def serialize_list(lst: Sequence[Serializable]) -> bytes:
     f = BytesIO()
     stream_serialize_list(f, lst)
@@ -90,15 +161,39 @@ def stream_serialize_vlq(f: BinaryIO, i: int) -> None:
 
 
 def stream_deserialize_vlq(f: BinaryIO) -> int:
-    """ """
+    """Only the encoding that stream_serialize_vlq produces is accepted: if other encodings of the same number were,
+    the same object could be serialized (and hence cached, e.g. in Block.cached_serialized) in more than one way."""
     result = 0
+    length = 0
 
     while True:
         (b,) = struct.unpack(b"B", safe_read(f, 1))
+        length += 1
 
         result += (b % 128)
 
         if b < 128:
+            if length != (result.bit_length() // 7) + 1:
+                raise DeserializationError("Non-canonical VLQ")
             return result
 
         result *= 128
+
+
+def view_deserialize_vlq(view: memoryview, offset: int) -> Tuple[int, int]:
+    # (like stream_deserialize_vlq, only canonical encodings are accepted)
+    result = 0
+    start_offset = offset
+
+    while True:
+        b = view[offset]
+        offset += 1
+
+        result += (b % 128)
+
+        if b < 128:
+            if offset - start_offset != (result.bit_length() // 7) + 1:
+                raise DeserializationError("Non-canonical VLQ")
+            return result, offset
+
+        result *= 128
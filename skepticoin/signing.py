@@ -9,21 +9,85 @@ One byte is reserved as a type_indicator if we ever want to offer more options (
 from __future__ import annotations
 
 import struct
-from typing import Any, BinaryIO
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Optional, Tuple
 
 import ecdsa  # NOTE "This library was not designed with security in mind."
 
+from .hash import sha256d
 from .humans import human
-from .serialization import Serializable, DeserializationError, safe_read
+from .serialization import Serializable, DeserializationError, safe_read, TYPE_INDICATOR, view_read
+
+# precompiled layouts of fixed-size runs of fields, for view_deserialize
+SECP256k1_PUBLIC_KEY_FIELDS = struct.Struct(b">c64s")  # type_indicator, public_key
+SECP256k1_SIGNATURE_FIELDS = struct.Struct(b">64s")
+COINBASE_DATA_FIELDS = struct.Struct(b">IB")  # height, length of the signature
 
 TYPE_SIGNABLE_EQUIVALENT = b'\x00'
 TYPE_COINBASE_DATA = b'\x01'
 TYPE_SECP256k1 = b'\x02'
 
+VERIFIED_SIGNATURE_CACHE_SIZE = 100_000
+
+
+class VerifiedSignatureCache:
+    """Bounded LRU set of successfully verified (public key, sha256d(message), signature) triples. A transaction's
+    signatures are verified when it enters the transaction pool, each time the pool is cleaned up, and when the
+    transaction is included in a block; with this cache only the first of these does the (expensive) ECDSA work. Failed
+    verifications are not remembered. The message is kept as its hash, so that the entries are small (and fixed-size)
+    however large the transaction."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: OrderedDict[Tuple[bytes, bytes, bytes], None] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: Tuple[bytes, bytes, bytes]) -> bool:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            return False
+
+    def add(self, key: Tuple[bytes, bytes, bytes]) -> None:
+        with self.lock:
+            self.entries[key] = None
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+verified_signature_cache = VerifiedSignatureCache(VERIFIED_SIGNATURE_CACHE_SIZE)
+
+
+def verify_secp256k1(public_key: bytes, message: bytes, signature: bytes) -> bool:
+    """The actual ECDSA verification, on raw bytes (i.e. without the verified_signature_cache)."""
+    vk = ecdsa.VerifyingKey.from_string(public_key, curve=ecdsa.SECP256k1)
+    try:
+        vk.verify(signature, message)
+    except ecdsa.keys.BadSignatureError:
+        return False
+    return True
+
 
 class PublicKey(Serializable):
+    __slots__ = ('public_key', 'hash_value')
+
     def __init__(self) -> None:
         self.public_key: bytes
+        self.hash_value: int
 
     @classmethod
     def stream_deserialize(cls, f: BinaryIO) -> SECP256k1PublicKey:
@@ -34,15 +98,28 @@ class PublicKey(Serializable):
 
         raise DeserializationError("Non-supported public key type.")
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[SECP256k1PublicKey, int]:
+        # there is only a single type of public key: read its type_indicator and the key itself in one go.
+        type_indicator, public_key = SECP256k1_PUBLIC_KEY_FIELDS.unpack_from(view, offset)
+
+        if type_indicator == TYPE_SECP256k1:
+            return SECP256k1PublicKey(public_key), offset + SECP256k1_PUBLIC_KEY_FIELDS.size
+
+        raise DeserializationError("Non-supported public key type.")
+
 
 class SECP256k1PublicKey(PublicKey):
     """We use the same curve as bitcoin because why not. Remember: the NIST curves were chosen by the lizard people!"""
 
+    __slots__ = ()
+
     def __init__(self, public_key: bytes):
         if not len(public_key) == 64:
             raise ValueError('SECP256k1 public key must be 64 bytes.')
 
         self.public_key = public_key
+        self.hash_value = hash(public_key)
 
     def __repr__(self) -> str:
         return "SECP256k1 Public Key %s" % human(self.public_key)
@@ -51,7 +128,7 @@ class SECP256k1PublicKey(PublicKey):
         return isinstance(other, SECP256k1PublicKey) and self.public_key == other.public_key
 
     def __hash__(self) -> int:
-        return hash(self.serialize())
+        return self.hash_value
 
     @classmethod
     def stream_deserialize(cls, f: BinaryIO) -> SECP256k1PublicKey:
@@ -59,23 +136,38 @@ class SECP256k1PublicKey(PublicKey):
         public_key: bytes = safe_read(f, 64)
         return cls(public_key)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[SECP256k1PublicKey, int]:
+        # type_indicator has been read already by the superclass at this point.
+        public_key, offset = view_read(view, offset, 64)
+        return cls(public_key), offset
+
     def stream_serialize(self, f: BinaryIO) -> None:
         f.write(TYPE_SECP256k1)
         f.write(self.public_key)
 
-    def validate(self, signature: Any, message: bytes) -> bool:
+    def validate(self, signature: Any, message: bytes, sighash: Optional[bytes] = None) -> bool:
+        """sighash, if given, must be sha256d(message); for transactions, that's their (cached) sighash(). That is an
+        internal invariant, not something that's checked (other than by the assert): the verified_signature_cache is
+        keyed on sighash, so a wrong sighash would make this return True for an unverified signature."""
+        assert sighash is None or sighash == sha256d(message)
+
         if not isinstance(signature, SECP256k1Signature):
             return False
 
-        vk = ecdsa.VerifyingKey.from_string(self.public_key, curve=ecdsa.SECP256k1)
-        try:
-            vk.verify(signature.signature, message)
+        key = (self.public_key, sha256d(message) if sighash is None else sighash, signature.signature)
+        if key in verified_signature_cache:
             return True
-        except ecdsa.keys.BadSignatureError:
+
+        if not verify_secp256k1(self.public_key, message, signature.signature):
             return False
 
+        verified_signature_cache.add(key)
+        return True
+
 
 class Signature(Serializable):
+    __slots__ = ()
 
     @classmethod
     def stream_deserialize(cls, f: BinaryIO) -> Signature:
@@ -92,18 +184,36 @@ class Signature(Serializable):
 
         raise DeserializationError("Non-supported signature type.")
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[Signature, int]:
+        (type_indicator,) = TYPE_INDICATOR.unpack_from(view, offset)
+        offset += 1
+
+        if type_indicator == TYPE_SECP256k1:
+            return SECP256k1Signature.view_deserialize(view, offset)
+
+        if type_indicator == TYPE_COINBASE_DATA:
+            return CoinbaseData.view_deserialize(view, offset)
+
+        if type_indicator == TYPE_SIGNABLE_EQUIVALENT:
+            return SignableEquivalent(), offset
+
+        raise DeserializationError("Non-supported signature type.")
+
     def is_not_signature(self) -> bool:
         """In various places where signatures are expected, special-meaning placeholders can occur instead. Signatures
         that may actually be used to verify public keys should return False here."""
         return True
 
-    def validate(self, public_key: Any, message: bytes) -> bool:
+    def validate(self, public_key: Any, message: bytes, sighash: Optional[bytes] = None) -> bool:
         raise NotImplementedError
 
 
 class SignableEquivalent(Signature):
     """SignableEquivalent: when signing transactions you can't sign your own signature."""
 
+    __slots__ = ()
+
     def __repr__(self) -> str:
         return "SignableEquivalent()"
 
@@ -123,6 +233,8 @@ class CoinbaseData(Signature):
     """In Coinbase transactions, some random data takes the place of the signature. This may be used by miners to
     introduce extra randomness if the nonce is not enough, or to include pseudo-polical messages."""
 
+    __slots__ = ('height', 'signature')
+
     def __init__(self, height: int, signature: bytes):
         if not (0 <= height <= 0xFFFFFFFF):
             raise ValueError("CoinbaseData height %d is out of range." % height)
@@ -151,6 +263,13 @@ class CoinbaseData(Signature):
         signature = safe_read(f, length)
         return cls(height, signature)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[CoinbaseData, int]:
+        # type_indicator has been read already by the superclass at this point.
+        height, length = COINBASE_DATA_FIELDS.unpack_from(view, offset)
+        signature, offset = view_read(view, offset + COINBASE_DATA_FIELDS.size, length)
+        return cls(height, signature), offset
+
     def stream_serialize(self, f: BinaryIO) -> None:
         f.write(TYPE_COINBASE_DATA)
         f.write(struct.pack(b">I", self.height))
@@ -159,6 +278,8 @@ class CoinbaseData(Signature):
 
 
 class SECP256k1Signature(Signature):
+    __slots__ = ('signature',)
+
     def __init__(self, signature: bytes):
         if not len(signature) == 64:
             raise ValueError('SECP256k1 signature must be 64 bytes.')
@@ -177,15 +298,21 @@ class SECP256k1Signature(Signature):
         signature = safe_read(f, 64)
         return cls(signature)
 
+    @classmethod
+    def view_deserialize(cls, view: memoryview, offset: int) -> Tuple[SECP256k1Signature, int]:
+        # type_indicator has been read already by the superclass at this point.
+        (signature,) = SECP256k1_SIGNATURE_FIELDS.unpack_from(view, offset)
+        return cls(signature), offset + SECP256k1_SIGNATURE_FIELDS.size
+
     def stream_serialize(self, f: BinaryIO) -> None:
         f.write(TYPE_SECP256k1)
         f.write(self.signature)
 
-    def validate(self, public_key: Any, message: bytes) -> bool:
+    def validate(self, public_key: Any, message: bytes, sighash: Optional[bytes] = None) -> bool:
         if not isinstance(public_key, SECP256k1PublicKey):
             return False
 
-        return public_key.validate(self, message)
+        return public_key.validate(self, message, sighash)
 
     def is_not_signature(self) -> bool:
         return False
@@ -0,0 +1,138 @@
+"""
+Signature verification in bulk: the (signature, public key, message, sighash) checks for e.g. all transactions in a
+block are collected first, and then verified together, spread over a pool of worker processes (the ecdsa library is
+pure Python, so threads would not help).
+
+The pool is created explicitly, by SignatureVerifier.start (at startup, see scripts/utils.py), and shut down with the
+LocalPeer. Until it has been started, below PARALLEL_VERIFICATION_THRESHOLD (not yet verified) signatures (where the
+pool's overhead isn't worth it), on machines with few CPUs, and on platforms where no process pool can be had (or when
+it breaks), the checks are done serially in the calling process instead.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, List, Optional, Tuple
+
+from .hash import sha256d
+from .signing import (
+    PublicKey, Signature, SECP256k1PublicKey, SECP256k1Signature, verified_signature_cache, verify_secp256k1)
+
+# (signature, public key, message, sha256d(message)); the latter is what the verified_signature_cache is keyed on.
+SignatureCheck = Tuple[Signature, PublicKey, bytes, bytes]
+
+PARALLEL_VERIFICATION_THRESHOLD = 32
+
+# the checks are handed to the workers in chunks, this many per worker (rather than 1 chunk per worker) to even out
+# differences in the workers' speeds.
+CHUNKS_PER_WORKER = 4
+
+# by default, the pool leaves a CPU for the rest of the process (e.g. the networking thread) and doesn't grow beyond
+# this many workers; pass max_workers for another number.
+DEFAULT_MAX_WORKERS = 4
+
+
+def default_max_workers() -> int:
+    return min(DEFAULT_MAX_WORKERS, (os.cpu_count() or 1) - 1)
+
+
+def verify_secp256k1_chunk(chunk: List[Tuple[bytes, bytes, bytes]]) -> List[bool]:
+    # runs in the worker processes
+    return [verify_secp256k1(public_key, message, signature) for (public_key, message, signature) in chunk]
+
+
+class SignatureVerifier:
+
+    def __init__(self, max_workers: Optional[int] = None):
+        # max_workers <= 1 means: always verify serially
+        self.max_workers = default_max_workers() if max_workers is None else max_workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.lock = threading.Lock()
+
+    def start(self, max_workers: Optional[int] = None) -> None:
+        """Creates the pool of max_workers (if given; self.max_workers otherwise) worker processes, if that's more than
+        1; until then, signatures are verified serially."""
+        with self.lock:
+            if max_workers is not None:
+                self.max_workers = max_workers
+
+            if self.executor is None and self.max_workers > 1:
+                try:
+                    # "spawn" rather than "fork": other threads (e.g. the BlockStore's writer thread) may be running,
+                    # and forking a multi-threaded process is asking for trouble.
+                    self.executor = ProcessPoolExecutor(
+                        self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                except (ImportError, NotImplementedError, OSError):
+                    # e.g. no working sem_open on this platform
+                    self.max_workers = 0
+
+    def get_executor(self) -> Optional[ProcessPoolExecutor]:
+        with self.lock:
+            return self.executor
+
+    def shutdown(self) -> None:
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+    def verify_in_pool(self, keys: List[Tuple[bytes, bytes, bytes]]) -> Optional[List[bool]]:
+        """Returns None if the pool is not available (i.e. not started, or shut down), or broke along the way."""
+        executor = self.get_executor()
+        if executor is None:
+            return None
+
+        chunk_size = -(-len(keys) // (self.max_workers * CHUNKS_PER_WORKER))
+        chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+
+        try:
+            return [result for chunk_results in executor.map(verify_secp256k1_chunk, chunks)
+                    for result in chunk_results]
+        except BrokenProcessPool:
+            self.shutdown()
+            return None
+        except RuntimeError:
+            # shut down (by another thread) after we got hold of it: "cannot schedule new futures after shutdown"
+            return None
+
+    def verify(self, signature_checks: List[SignatureCheck]) -> bool:
+        """True iff all signature_checks pass; successfully verified signatures are added to the
+        verified_signature_cache."""
+
+        # (public key, message, signature) to verify, and the corresponding cache keys
+        to_verify: List[Tuple[bytes, bytes, bytes]] = []
+        cache_keys: List[Tuple[bytes, bytes, bytes]] = []
+
+        for signature, public_key, message, sighash in signature_checks:
+            if not (isinstance(signature, SECP256k1Signature) and isinstance(public_key, SECP256k1PublicKey)):
+                # not something the workers can verify (nor something that's expensive to verify)
+                if not signature.validate(public_key, message, sighash):
+                    return False
+                continue
+
+            assert sighash == sha256d(message)  # see SECP256k1PublicKey.validate
+            cache_key = (public_key.public_key, sighash, signature.signature)
+            if cache_key not in verified_signature_cache:
+                to_verify.append((public_key.public_key, message, signature.signature))
+                cache_keys.append(cache_key)
+
+        results: Optional[Iterable[bool]] = None
+        if len(to_verify) >= PARALLEL_VERIFICATION_THRESHOLD:
+            results = self.verify_in_pool(to_verify)
+
+        if results is None:
+            # serially (and lazily, i.e. stopping at the first failure)
+            results = (verify_secp256k1(*args) for args in to_verify)
+
+        for cache_key, result in zip(cache_keys, results):
+            if not result:
+                return False
+            verified_signature_cache.add(cache_key)
+
+        return True
+
+
+signature_verifier = SignatureVerifier()
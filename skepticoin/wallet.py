@@ -2,11 +2,12 @@ from __future__ import annotations
 
 import os
 import random
-from typing import Dict, List, Mapping, Set, TextIO
+from typing import Dict, List, Mapping, Optional, Set, TextIO
 
 import ecdsa
 import json
 
+from .blockstore import BlockStore
 from .coinstate import CoinState, PKBalance
 from .humans import computer, human
 from .signing import SECP256k1PublicKey, SECP256k1Signature
@@ -90,7 +91,15 @@ class Wallet:
             public_key_annotations={computer(k): annotation for (k, annotation) in d["public_key_annotations"].items()},
         )
 
-    def get_balance(self, coinstate: CoinState) -> int:
+    def get_balance(self, coinstate: CoinState, block_store: Optional[BlockStore] = None) -> int:
+        if block_store is not None and coinstate.current_chain_hash is not None:
+            # if the block store's address index is up to date with coinstate, there's no need for coinstate's balances
+            balances = block_store.get_address_balances_at(
+                (SECP256k1PublicKey(pk) for pk in list(self.public_key_annotations.keys()) + self.unused_public_keys),
+                coinstate.current_chain_hash)
+            if balances is not None:
+                return sum(balances.values())
+
         return sum(
             coinstate.public_key_balances_by_hash[coinstate.current_chain_hash].get(  # type: ignore
                 SECP256k1PublicKey(pk), PKBalance(0, [])).value
@@ -103,10 +112,10 @@ def sign_transaction(
     unspent_transaction_outs: Mapping[OutputReference, Output],
     transaction: Transaction,
 ) -> Transaction:
-    message = transaction.signable_equivalent().serialize()
+    message = transaction.signable_message()
 
     signed_inputs = []
-    for input in transaction.signable_equivalent().inputs:
+    for input in transaction.inputs:
         if input.output_reference not in unspent_transaction_outs:
             raise Exception("Attempting to sign invalid transaction")
 
@@ -130,6 +139,7 @@ def sign_transaction(
     return Transaction(
         inputs=signed_inputs,
         outputs=transaction.outputs,
+        cached_signable_message=message,  # signing doesn't change what is signed
     )
 
 
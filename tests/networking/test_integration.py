@@ -25,6 +25,9 @@ class FakeDiskInterface:
     def save_block(self, block):
         pass
 
+    def flush_blocks(self, wait=False):
+        pass
+
     def write_peers(self, remote_peer: RemotePeer):
         pass
 
@@ -34,6 +37,15 @@ class FakeDiskInterface:
     def save_transaction_for_debugging(self, transaction):
         pass
 
+    def save_snapshot(self, coinstate):
+        pass
+
+    def load_raw_block(self, block_hash):
+        return None
+
+    def save_utxo_head(self, block_hash):
+        pass
+
 
 def _read_chain_from_disk(max_height):
     coinstate = CoinState.zero()
@@ -203,3 +215,99 @@ def test_broadcast_message_closed_connection_handling(caplog, mocker):
 
         thread_b.stop()
         thread_b.join()
+
+
+def test_save_snapshot():
+    class SnapshotRecordingDiskInterface(FakeDiskInterface):
+        def __init__(self):
+            self.snapshots = []
+
+        def save_snapshot(self, coinstate):
+            self.snapshots.append(coinstate)
+
+    disk_interface = SnapshotRecordingDiskInterface()
+    coinstate = _read_chain_from_disk(5)
+    chain_manager = NetworkingThread(coinstate, None, disk_interface).local_peer.chain_manager
+
+    # only validated states are snapshotted
+    chain_manager.set_coinstate(_read_chain_from_disk(3), validated=False)
+    chain_manager.last_known_valid_coinstate = None
+    chain_manager.save_snapshot(wait=True)
+    assert disk_interface.snapshots == []
+
+    chain_manager.set_coinstate(coinstate)
+    chain_manager.set_coinstate(_read_chain_from_disk(3), validated=False)
+    chain_manager.save_snapshot(wait=True)
+    assert disk_interface.snapshots == [coinstate]
+    assert chain_manager.last_snapshot_height == 5
+
+
+def test_flush_buffered_blocks():
+    class BlockRecordingDiskInterface(FakeDiskInterface):
+        def __init__(self):
+            self.saved_blocks = []
+
+        def save_block(self, block):
+            self.saved_blocks.append(block)
+
+    disk_interface = BlockRecordingDiskInterface()
+    coinstate = _read_chain_from_disk(3)
+    chain_manager = NetworkingThread(coinstate, None, disk_interface).local_peer.chain_manager
+
+    blocks = [Block.stream_deserialize(open(file_path, 'rb')) for file_path in sorted(CHAIN_TESTDATA_PATH.iterdir())]
+    block_4, block_5 = blocks[3:5]
+
+    # a block that spends an output that doesn't exist: it can't be added to the coinstate
+    bad_block_5 = Block(block_5.header, block_5.transactions + [Transaction(
+        inputs=[Input(OutputReference(b'x' * 32, 0), SignableEquivalent())],
+        outputs=[Output(10, SECP256k1PublicKey(b'x' * 64))],
+    )])
+
+    chain_manager.buffer_block(block_4)
+    chain_manager.buffer_block(bad_block_5)
+    chain_manager.flush_buffered_blocks()
+
+    # the batch is dropped as a whole, and nothing is saved
+    assert chain_manager.coinstate is coinstate
+    assert chain_manager.buffered_blocks == []
+    assert disk_interface.saved_blocks == []
+
+    chain_manager.buffer_block(block_4)
+    chain_manager.buffer_block(block_5)
+    assert disk_interface.saved_blocks == []  # not before they're added to the coinstate
+
+    chain_manager.flush_buffered_blocks()
+    assert chain_manager.coinstate.head() == block_5
+    assert disk_interface.saved_blocks == []  # not before they're validated either
+    assert chain_manager.unsaved_blocks == [block_4, block_5]
+
+    # validating the head validates its ancestors
+    chain_manager.set_coinstate(chain_manager.coinstate)
+    assert disk_interface.saved_blocks == [block_4, block_5]
+    assert chain_manager.unsaved_blocks == []
+
+
+def test_fall_back_to_last_known_valid_coinstate():
+    class BlockRecordingDiskInterface(FakeDiskInterface):
+        def __init__(self):
+            self.saved_blocks = []
+
+        def save_block(self, block):
+            self.saved_blocks.append(block)
+
+    disk_interface = BlockRecordingDiskInterface()
+    coinstate = _read_chain_from_disk(3)
+    chain_manager = NetworkingThread(coinstate, None, disk_interface).local_peer.chain_manager
+
+    blocks = [Block.stream_deserialize(open(file_path, 'rb')) for file_path in sorted(CHAIN_TESTDATA_PATH.iterdir())]
+    block_4, block_5 = blocks[3:5]
+
+    chain_manager.set_coinstate(coinstate.add_block_no_validation(block_4), validated=False, added_blocks=[block_4])
+    chain_manager.buffer_block(block_5)
+
+    # e.g. a descendant of block_4 turned out to be invalid: block_4 itself is never saved
+    chain_manager.fall_back_to_last_known_valid_coinstate()
+    assert chain_manager.coinstate is coinstate
+    assert chain_manager.buffered_blocks == []
+    assert chain_manager.unsaved_blocks == []
+    assert disk_interface.saved_blocks == []
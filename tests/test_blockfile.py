@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+
+from skepticoin import blockfile
+from skepticoin.blockfile import BlockFile
+from skepticoin.datatypes import Block
+
+CHAIN_TESTDATA_PATH = Path(__file__).parent.joinpath("testdata/chain")
+
+
+def test_append_and_get(tmp_path):
+    f = BlockFile(str(tmp_path))
+
+    f.append(b'a' * 32, 0, b'block a')
+    f.append(b'b' * 32, 1, b'block b')
+    f.append(b'c' * 32, 1, b'block c')
+    f.append(b'a' * 32, 0, b'block a')  # already there: not written again
+
+    assert len(f) == 3
+    assert b'b' * 32 in f
+    assert b'd' * 32 not in f
+
+    assert bytes(f[b'b' * 32]) == b'block b'
+    assert isinstance(f[b'b' * 32], memoryview)
+    assert f.get(b'd' * 32) is None
+    assert f.get_block_hashes_at_height(1) == [b'b' * 32, b'c' * 32]
+    assert f.get_block_hashes_at_height(2) == []
+
+    # appending after a read (i.e. growing a mapped segment)
+    f.append(b'd' * 32, 2, b'block d')
+    assert bytes(f[b'd' * 32]) == b'block d'
+
+    f.close()
+
+
+def test_reopen(tmp_path):
+    f = BlockFile(str(tmp_path))
+    f.append(b'a' * 32, 0, b'block a')
+    f.append(b'b' * 32, 1, b'block b')
+    f.close()
+
+    # simulate a crash halfway through writing a record
+    with open(os.path.join(str(tmp_path), "blk00000.dat"), "ab") as segment:
+        segment.write(blockfile.BLOCKFILE_MAGIC + b'c' * 10)
+
+    f = BlockFile(str(tmp_path))
+    assert len(f) == 2
+    assert bytes(f[b'a' * 32]) == b'block a'
+    assert f.get_block_hashes_at_height(1) == [b'b' * 32]
+
+    f.append(b'c' * 32, 2, b'block c')
+    f.close()
+
+    f = BlockFile(str(tmp_path))
+    assert bytes(f[b'c' * 32]) == b'block c'
+    f.close()
+
+
+def test_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(blockfile, 'BLOCKFILE_SEGMENT_SIZE', 100)
+
+    f = BlockFile(str(tmp_path))
+    for i in range(10):
+        f.append(bytes([i]) * 32, i, b'block %d' % i * 10)
+    f.close()
+
+    assert len(os.listdir(str(tmp_path))) > 1
+
+    f = BlockFile(str(tmp_path))
+    assert [bytes(f[bytes([i]) * 32]) for i in range(10)] == [b'block %d' % i * 10 for i in range(10)]
+    f.close()
+
+
+def test_get_verified(tmp_path):
+    block = Block.stream_deserialize(open(sorted(CHAIN_TESTDATA_PATH.iterdir())[0], 'rb'))
+
+    f = BlockFile(str(tmp_path))
+    f.append(block.hash(), block.height, block.serialize())
+    f.append(b'a' * 32, block.height, block.serialize())
+    f.append(b'b' * 32, 0, b'block b')
+
+    # the right header, but other transactions
+    other_block = Block.stream_deserialize(open(sorted(CHAIN_TESTDATA_PATH.iterdir())[1], 'rb'))
+    other_data = other_block.serialize()
+    f.append(other_block.hash(), other_block.height, other_data[:-1] + bytes([other_data[-1] ^ 1]))
+
+    assert bytes(f.get_verified(block.hash())) == block.serialize()
+    assert f.get_verified(b'a' * 32) is None  # the header doesn't hash to b'a' * 32
+    assert f.get_verified(b'b' * 32) is None  # no header at all
+    assert f.get_verified(other_block.hash()) is None  # the transactions don't match the merkle root
+    assert f.get_verified(b'c' * 32) is None
+
+    f.close()
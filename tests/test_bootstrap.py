@@ -0,0 +1,86 @@
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from skepticoin import bootstrap
+from skepticoin.blockstore import BlockStore
+from skepticoin.bootstrap import BootstrapError, export_bootstrap, import_bootstrap, read_block_at_height
+from skepticoin.coinstate import CoinState
+from skepticoin.datatypes import Block
+
+CHAIN_TESTDATA_PATH = Path(__file__).parent.joinpath("testdata/chain")
+
+
+def _exported_chain():
+    coinstate = CoinState.zero()
+    for file_path in sorted(CHAIN_TESTDATA_PATH.iterdir()):
+        coinstate = coinstate.add_block_no_validation(Block.stream_deserialize(open(file_path, 'rb')))
+
+    f = BytesIO()
+    assert export_bootstrap(coinstate, f) == 6
+    return coinstate, f
+
+
+def test_export_and_import():
+    coinstate, f = _exported_chain()
+
+    assert read_block_at_height(f, 3).hash() == coinstate.at_head.block_by_height[3].hash()
+
+    db = BlockStore(path=':memory:')
+    imported = import_bootstrap(f, CoinState.empty(), db)
+
+    assert imported.current_chain_hash == coinstate.current_chain_hash
+    assert set(imported.block_by_hash.keys()) == set(coinstate.block_by_hash.keys())
+    assert [block.hash() for block in db.read_blocks_from_disk()] == [
+        coinstate.at_head.block_by_height[height].hash() for height in range(6)]
+
+    # importing into a coinstate that has (some of) the blocks already
+    assert import_bootstrap(f, imported).current_chain_hash == coinstate.current_chain_hash
+
+    db.close()
+
+
+def test_import_checks():
+    _, f = _exported_chain()
+    data = f.getvalue()
+
+    with pytest.raises(BootstrapError):
+        import_bootstrap(BytesIO(b'not a bootstrap file' * 10), CoinState.empty())
+
+    corrupted = bytearray(data)
+    corrupted[100] ^= 0xFF
+    with pytest.raises(BootstrapError):
+        import_bootstrap(BytesIO(bytes(corrupted)), CoinState.empty())
+
+
+def test_import_checkpoints(monkeypatch):
+    _, f = _exported_chain()
+
+    monkeypatch.setattr(bootstrap, 'KNOWN_HASHES', {0: bootstrap.KNOWN_HASHES[0], 3: '00' * 32})
+    with pytest.raises(BootstrapError):
+        import_bootstrap(f, CoinState.empty())
+
+
+def test_import_stores_verified_blocks_only(monkeypatch):
+    coinstate, f = _exported_chain()
+    hashes = [coinstate.at_head.block_by_height[height].hash() for height in range(6)]
+
+    # a corrupted index: only the checksum tells
+    corrupted = bytearray(f.getvalue())
+    corrupted[-bootstrap.FOOTER.size - 1] ^= 0xFF
+
+    db = BlockStore(path=':memory:')
+    with pytest.raises(BootstrapError):
+        import_bootstrap(BytesIO(bytes(corrupted)), CoinState.empty(), db)
+    db.flush_blocks_to_disk(wait=True)
+    assert [block.hash() for block in db.read_blocks_from_disk()] == hashes[:1]  # i.e. just the genesis block
+
+    # with a checkpoint at height 3, the blocks below it are good
+    monkeypatch.setattr(bootstrap, 'KNOWN_HASHES', {0: bootstrap.KNOWN_HASHES[0], 3: hashes[3].hex()})
+    with pytest.raises(BootstrapError):
+        import_bootstrap(BytesIO(bytes(corrupted)), CoinState.empty(), db)
+    db.flush_blocks_to_disk(wait=True)
+    assert [block.hash() for block in db.read_blocks_from_disk()] == hashes[:3]
+
+    db.close()
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+from skepticoin.chainindex import HeightIndex, MAX_OVERLAY_DEPTH, get_skip_height
+
+
+def _block(height, name):
+    # HeightIndex only cares about the height; name lets us tell forks apart
+    return SimpleNamespace(height=height, name=name)
+
+
+def _chain(index, name, start_height, end_height):
+    for height in range(start_height, end_height):
+        index = index.append(_block(height, name))
+    return index
+
+
+def test_height_index_append():
+    index_3 = _chain(HeightIndex.empty(), "main", 0, 3)
+    index_5 = _chain(index_3, "main", 3, 5)
+
+    assert len(index_3) == 3
+    assert len(index_5) == 5
+    assert [index_5[h].height for h in range(5)] == [0, 1, 2, 3, 4]
+
+    # the views share a single list
+    assert index_3.blocks is index_5.blocks
+
+    # but an earlier view does not see the later blocks
+    assert 3 not in index_3
+    assert 3 in index_5
+    with pytest.raises(KeyError):
+        index_3[3]
+    with pytest.raises(KeyError):
+        index_5[-1]
+
+
+def test_height_index_fork():
+    index_3 = _chain(HeightIndex.empty(), "main", 0, 3)
+    main = _chain(index_3, "main", 3, 6)
+    fork = _chain(index_3, "fork", 3, 5)
+
+    assert [main[h].name for h in range(6)] == ["main"] * 6
+    assert [fork[h].name for h in range(5)] == ["main"] * 3 + ["fork"] * 2
+
+    # the fork holds only its own blocks
+    assert fork.blocks == [fork[3], fork[4]]
+    assert fork.base is index_3
+
+    # a fork of a fork
+    fork_of_fork = _chain(fork.base.append(fork[3]), "fork-of-fork", 4, 6)
+    assert [fork_of_fork[h].name for h in range(6)] == ["main"] * 3 + ["fork", "fork-of-fork", "fork-of-fork"]
+    assert [fork[h].name for h in range(5)] == ["main"] * 3 + ["fork"] * 2
+
+
+def test_height_index_max_overlay_depth():
+    index = _chain(HeightIndex.empty(), "main", 0, 1)
+
+    # each fork is built on top of an earlier fork, which leads to ever deeper overlays...
+    for i in range(MAX_OVERLAY_DEPTH * 2):
+        _chain(index, "abandoned", len(index), len(index) + 1)
+        index = _chain(index, "fork-%d" % i, len(index), len(index) + 1)
+
+    # ...up to a maximum
+    assert index.depth <= MAX_OVERLAY_DEPTH
+    expected = ["main"] + ["fork-%d" % i for i in range(MAX_OVERLAY_DEPTH * 2)]
+    assert [index[h].name for h in range(len(index))] == expected
+
+
+def test_get_skip_height():
+    assert [get_skip_height(height) for height in range(8)] == [0, 0, 0, 1, 0, 1, 4, 1]
+
+    for height in range(2, 10000):
+        assert 0 <= get_skip_height(height) < height
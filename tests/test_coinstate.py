@@ -1,9 +1,38 @@
+from io import BytesIO
+from pathlib import Path
+
 import immutables
+import pytest
 
 from skepticoin.signing import CoinbaseData, SECP256k1PublicKey, SECP256k1Signature
-from skepticoin.datatypes import Transaction, OutputReference, Input, Output
-from skepticoin.balances import uto_apply_transaction, pkb_apply_transaction, PKBalance
-from skepticoin.consensus import construct_reference_to_thin_air
+from skepticoin.datatypes import (
+    Block, BlockHeader, BlockSummary, PowEvidence, Transaction, OutputReference, Input, Output,
+)
+from skepticoin.balances import uto_apply_transaction, pkb_apply_transaction, PKBalance, PublicKeyBalances
+from skepticoin.coinstate import CoinState
+from skepticoin.consensus import (
+    construct_coinbase_transaction,
+    construct_reference_to_thin_air,
+    validate_block_summary_in_coinstate,
+    ValidateBlockHeaderError,
+)
+from skepticoin.genesis import genesis_block_data
+from skepticoin.serialization import DeserializationError
+
+from test_consensus import _read_chain_from_disk
+
+
+CHAIN_TESTDATA_PATH = Path(__file__).parent.joinpath("testdata/chain")
+
+
+def _unvalidated_block(previous_block, public_key, transactions=(), nonce=0):
+    # a block that's good enough for add_block_no_validation, i.e. w/o proof of work
+    height = previous_block.height + 1
+    coinbase_transaction = construct_coinbase_transaction(height, [], immutables.Map(), b'', public_key)
+    summary = BlockSummary(
+        height, previous_block.hash(), b'\x00' * 32, previous_block.timestamp + 1, previous_block.target, nonce)
+    return Block(BlockHeader(summary, PowEvidence(b'\x00' * 32, b'\x00' * 32, b'\x00' * 32)),
+                 [coinbase_transaction] + list(transactions))
 
 
 def test_uto_apply_transaction_on_coinbase():
@@ -134,3 +163,242 @@ def test_pkb_apply_transaction_on_non_coinbase_transaction():
 
     assert result[public_key_2].value == 30  # the value of the transaction output
     assert result[public_key_2].output_references == [OutputReference(transaction.hash(), 0)]
+
+
+def test_dump_and_load():
+    coinstate = _read_chain_from_disk(5)
+
+    f = BytesIO()
+    coinstate.dump(f)
+    f.seek(0)
+    loaded = CoinState.load(f)
+
+    assert loaded.current_chain_hash == coinstate.current_chain_hash
+    assert loaded.head() == coinstate.head()
+    assert dict(loaded.at_head.unspent_transaction_outs) == dict(coinstate.at_head.unspent_transaction_outs)
+    for height in range(6):
+        assert loaded.at_head.block_by_height[height] == coinstate.at_head.block_by_height[height]
+
+
+def test_dump_and_load_below_head():
+    coinstate = _read_chain_from_disk(5)
+    block_3 = coinstate.at_head.block_by_height[3]
+
+    f = BytesIO()
+    coinstate.dump(f, block_3.hash())
+    f.seek(0)
+    loaded = CoinState.load(f)
+
+    assert loaded.head().height == 3
+
+    for height in [4, 5]:
+        loaded = loaded.add_block_no_validation(coinstate.at_head.block_by_height[height])
+
+    assert loaded.current_chain_hash == coinstate.current_chain_hash
+    assert dict(loaded.at_head.unspent_transaction_outs) == dict(coinstate.at_head.unspent_transaction_outs)
+
+
+def test_load_corrupted_snapshot():
+    coinstate = _read_chain_from_disk(5)
+
+    f = BytesIO()
+    coinstate.dump(f)
+    data = bytearray(f.getvalue())
+    data[100] ^= 0xff
+
+    with pytest.raises(DeserializationError, match=".*checksum.*"):
+        CoinState.load(BytesIO(bytes(data)))
+
+
+def test_load_snapshot_checks_store_id():
+    coinstate = _read_chain_from_disk(5)
+
+    f = BytesIO()
+    coinstate.dump(f, store_id=b'store a')
+
+    f.seek(0)
+    assert CoinState.load(f, store_id=b'store a').current_chain_hash == coinstate.current_chain_hash
+
+    f.seek(0)
+    with pytest.raises(DeserializationError, match=".*different block store.*"):
+        CoinState.load(f, store_id=b'store b')
+
+
+def test_public_key_balances_incremental():
+    coinstate = _read_chain_from_disk(5)
+    public_key = SECP256k1PublicKey(b'x' * 64)
+
+    balances_at_5 = coinstate.public_key_balances_by_hash[coinstate.current_chain_hash]
+
+    block_6 = _unvalidated_block(coinstate.head(), public_key)
+    coinstate_6 = coinstate.add_block_no_validation(block_6)
+
+    # the cache is shared between CoinState versions
+    assert coinstate_6.public_key_balances_by_hash.cache is coinstate.public_key_balances_by_hash.cache
+
+    balances_at_6 = coinstate_6.at_head.public_key_balances
+    assert balances_at_6[public_key].value == block_6.transactions[0].outputs[0].value
+    assert dict(balances_at_6) == dict(coinstate_6.public_key_balances_by_hash.replay_public_key_balances(
+        coinstate_6.current_chain_hash))
+
+    # rolling back: a fork at height 5 is computed from the balances at a cached common ancestor
+    block_5b = _unvalidated_block(coinstate.at_head.block_by_height[4], public_key)
+    coinstate_5b = coinstate_6.add_block_no_validation(block_5b)
+    balances_at_5b = coinstate_5b.public_key_balances_by_hash[block_5b.hash()]
+
+    assert dict(balances_at_5b) == dict(coinstate_5b.public_key_balances_by_hash.replay_public_key_balances(
+        block_5b.hash()))
+    assert public_key not in balances_at_5
+    assert balances_at_5b[public_key].value == block_5b.transactions[0].outputs[0].value
+
+
+def test_replay_public_key_balances_caches_checkpoints(monkeypatch):
+    monkeypatch.setattr("skepticoin.balances.PUBLIC_KEY_BALANCES_CHECKPOINT_INTERVAL", 2)
+    coinstate = _read_chain_from_disk(5)
+    public_key_balances_by_hash = PublicKeyBalances(
+        coinstate.block_by_hash, coinstate.unspent_transaction_outs_by_hash)
+
+    balances = public_key_balances_by_hash.replay_public_key_balances(coinstate.current_chain_hash)
+
+    # a reorg below the head then starts from one of these rather than from genesis
+    assert list(public_key_balances_by_hash.cache) == [
+        coinstate.at_head.block_by_height[height].hash() for height in [0, 2, 4]]
+    assert dict(public_key_balances_by_hash.cache[coinstate.at_head.block_by_height[4].hash()]) == dict(
+        public_key_balances_by_hash.replay_public_key_balances(coinstate.at_head.block_by_height[4].hash()))
+    assert dict(balances) == dict(coinstate.at_head.public_key_balances)
+
+
+def test_prune_below_finality_depth():
+    coinstate = CoinState.empty(finality_depth=2).add_block_no_validation(Block.deserialize(genesis_block_data))
+    public_key = SECP256k1PublicKey(b'x' * 64)
+
+    blocks = [Block.stream_deserialize(open(file_path, 'rb')) for file_path in sorted(CHAIN_TESTDATA_PATH.iterdir())]
+
+    # a fork at height 2, which is left behind by the main chain
+    coinstate = coinstate.add_block_no_validation(blocks[0])
+    fork_block = _unvalidated_block(coinstate.head(), public_key)
+    coinstate = coinstate.add_block_no_validation(fork_block)
+    assert coinstate.is_extendable(fork_block.hash())
+
+    for block in blocks[1:5]:
+        coinstate = coinstate.add_block_no_validation(block)
+
+    assert coinstate.head().height == 5
+    assert len(coinstate.heads) == 2  # the fork is still known as such...
+    assert not coinstate.is_extendable(fork_block.hash())  # ... but can no longer be built upon
+
+    for height in range(6):
+        block_hash = coinstate.at_head.block_by_height[height].hash()
+        assert coinstate.is_extendable(block_hash) == (height >= 3)
+        assert (block_hash in coinstate.block_by_height_by_hash) == (height >= 3)
+
+    with pytest.raises(ValidateBlockHeaderError, match=".*finality depth.*"):
+        validate_block_summary_in_coinstate(_unvalidated_block(fork_block, public_key).header.summary, coinstate)
+
+    # the fork is still reported as such, even though its per-block state is gone
+    assert sorted((head.height, lca.height) for (head, lca) in coinstate.forks()) == [(2, 1), (5, 5)]
+
+
+def test_prune_after_reorg(monkeypatch):
+    # get_total_work is a placeholder (the height); here, blocks with a nonce of 1 count as much heavier
+    monkeypatch.setattr(Block, "get_total_work", lambda self: self.height + 100 * self.header.summary.nonce)
+
+    coinstate = CoinState.empty(finality_depth=2).add_block_no_validation(Block.deserialize(genesis_block_data))
+    public_key = SECP256k1PublicKey(b'x' * 64)
+
+    for nonce in [0, 0, 0, 0, 0, 1, 1]:
+        coinstate = coinstate.add_block_no_validation(_unvalidated_block(coinstate.head(), public_key, nonce=nonce))
+    assert coinstate.head().height == 7
+
+    # a fork at height 5 that only takes over at height 13: the head moves up 6 blocks at once
+    block = coinstate.at_head.block_by_height[5]
+    fork_blocks = []
+    for nonce in [0, 0, 0, 0, 0, 0, 0, 1]:
+        block = _unvalidated_block(block, public_key, nonce=nonce)
+        fork_blocks.append(block)
+    coinstate = coinstate.add_blocks(fork_blocks)
+
+    assert coinstate.current_chain_hash == fork_blocks[-1].hash()
+    for height in range(14):
+        block_hash = coinstate.at_head.block_by_height[height].hash()
+        assert coinstate.is_extendable(block_hash) == (height >= 11)
+        assert (block_hash in coinstate.block_by_height_by_hash) == (height >= 11)
+
+
+def test_get_ancestor_and_forks():
+    coinstate = CoinState.zero()
+    public_key = SECP256k1PublicKey(b'x' * 64)
+
+    for i in range(300):
+        coinstate = coinstate.add_block_no_validation(_unvalidated_block(coinstate.head(), public_key))
+
+    main_hash = coinstate.current_chain_hash
+
+    # a fork off the main chain at height 100
+    fork = coinstate.at_head.block_by_height[100]
+    for i in range(50):
+        fork = _unvalidated_block(fork, public_key, nonce=1)
+        coinstate = coinstate.add_block_no_validation(fork)
+
+    assert coinstate.current_chain_hash == main_hash
+
+    for height in range(301):
+        assert coinstate.get_ancestor(main_hash, height) == coinstate.at_head.block_by_height[height]
+
+    for height in range(151):
+        assert coinstate.get_ancestor(fork.hash(), height) == coinstate.block_by_height_by_hash[fork.hash()][height]
+
+    assert coinstate.lowest_common_ancestor(fork.hash(), main_hash) == coinstate.at_head.block_by_height[100]
+    assert coinstate.lowest_common_ancestor(main_hash, fork.hash()) == coinstate.at_head.block_by_height[100]
+    assert coinstate.lowest_common_ancestor(main_hash, main_hash) == coinstate.head()
+
+    assert sorted((head.height, lca.height) for (head, lca) in coinstate.forks()) == [(150, 100), (300, 300)]
+
+
+def test_add_blocks():
+    public_key = SECP256k1PublicKey(b'x' * 64)
+
+    blocks = []
+    previous_block = Block.deserialize(genesis_block_data)
+    for i in range(10):
+        previous_block = _unvalidated_block(previous_block, public_key)
+        blocks.append(previous_block)
+
+    # a fork at height 4, which doesn't become the main chain
+    blocks.append(_unvalidated_block(blocks[2], public_key, nonce=1))
+
+    one_by_one = CoinState.zero()
+    for block in blocks:
+        one_by_one = one_by_one.add_block_no_validation(block)
+
+    batched = CoinState.zero().add_blocks(blocks)
+
+    assert batched.current_chain_hash == one_by_one.current_chain_hash
+    assert dict(batched.heads) == dict(one_by_one.heads)
+    assert dict(batched.block_by_hash) == dict(one_by_one.block_by_hash)
+    assert batched.unspent_transaction_outs_by_hash == one_by_one.unspent_transaction_outs_by_hash
+    for block_hash, block in batched.block_by_hash.items():
+        for height in range(block.height + 1):
+            assert batched.block_by_height_by_hash[block_hash][height] == \
+                one_by_one.block_by_height_by_hash[block_hash][height]
+
+
+def test_add_blocks_failure_leaves_shared_state_alone():
+    public_key = SECP256k1PublicKey(b'x' * 64)
+    coinstate = CoinState.zero()
+
+    block_1 = _unvalidated_block(coinstate.head(), public_key)
+    block_2 = _unvalidated_block(block_1, public_key)
+    unknown_parent = _unvalidated_block(_unvalidated_block(block_2, public_key), public_key)
+
+    shared_blocks = coinstate.at_head.block_by_height.blocks
+    with pytest.raises(KeyError):
+        coinstate.add_blocks([block_1, block_2, unknown_parent])
+
+    assert coinstate.skip_by_hash == {}
+    assert len(shared_blocks) == 1
+
+    # and the state we started from can still be extended in place
+    coinstate = coinstate.add_blocks([block_1, block_2])
+    assert coinstate.at_head.block_by_height.blocks is shared_blocks
+    assert set(coinstate.skip_by_hash) == {block_1.hash(), block_2.hash()}
@@ -10,6 +10,7 @@ from skepticoin.params import (
     MAX_COINBASE_RANDOM_DATA_SIZE,
     SASHIMI_PER_COIN,
 )
+from skepticoin.blockfile import BlockFile
 from skepticoin.coinstate import CoinState
 from skepticoin.consensus import (
     calculate_new_target,
@@ -25,6 +26,7 @@ from skepticoin.consensus import (
     validate_coinbase_transaction_by_itself,
     validate_block_header_by_itself,
     validate_block_by_itself,
+    validate_signatures,
     # validate_non_coinbase_transaction_in_coinstate,
     ValidationError,
     ValidateBlockError,
@@ -32,9 +34,13 @@ from skepticoin.consensus import (
     ValidateTransactionError,
     ValidatePOWError,
 )
-from skepticoin.signing import SECP256k1PublicKey, SECP256k1Signature, SignableEquivalent
+from skepticoin.signing import (
+    CoinbaseData, SECP256k1PublicKey, SECP256k1Signature, SignableEquivalent, verified_signature_cache,
+)
 from skepticoin.datatypes import Transaction, OutputReference, Input, Output, Block, BlockHeader
 
+from test_verification import make_signature_checks, with_bad_signature
+
 
 CHAIN_TESTDATA_PATH = Path(__file__).parent.joinpath("testdata/chain")
 
@@ -112,6 +118,30 @@ def test_construct_pow_evidence_non_genesis_block():
     # no assertions here, just checking that this doesn't crash :-)
 
 
+def test_construct_pow_evidence_from_block_file(tmp_path):
+    coinstate = _read_chain_from_disk(5)
+
+    block_file = BlockFile(str(tmp_path))
+    for block in coinstate.block_by_hash.values():
+        block_file.append(block.hash(), block.height, block.serialize())
+
+    coinstate_with_block_file = CoinState(
+        coinstate.block_by_hash, coinstate.unspent_transaction_outs_by_hash, coinstate.block_by_height_by_hash,
+        coinstate.heads, coinstate.current_chain_hash, block_file=block_file)
+
+    transactions = [
+        construct_coinbase_transaction(0, [], immutables.Map(), b"Political statement goes here", example_public_key),
+    ]
+
+    summary = construct_minable_summary(coinstate, transactions, 1231006505, 0)
+
+    # chain samples taken from the BlockFile are the same as those taken from (re-serialized) Block objects
+    assert construct_pow_evidence(coinstate_with_block_file, summary, 6, transactions) == \
+        construct_pow_evidence(coinstate, summary, 6, transactions)
+
+    block_file.close()
+
+
 def test_construct_block_for_mining_no_non_coinbase_transactions():
     coinstate = _read_chain_from_disk(5)
 
@@ -237,9 +267,17 @@ def test_validate_non_coinbase_transaction_by_itself():
         validate_non_coinbase_transaction_by_itself(transaction)
 
 
-def test_validate_signature_for_spend():
-    # before anything: create sign_for_spend
-    pass  # TODO
+def test_validate_signatures():
+    signature_checks = make_signature_checks(2)
+
+    verified_signature_cache.clear()
+    try:
+        validate_signatures(signature_checks)
+
+        with pytest.raises(ValidateTransactionError, match=".*Wrong signature.*"):
+            validate_signatures(with_bad_signature(signature_checks, 0))
+    finally:
+        verified_signature_cache.clear()
 
 
 def test_get_transaction_fee():
@@ -391,8 +429,14 @@ def test_validate_block_by_itself_invalid_coinbase_transaction():
 
 
 def test_validate_block_by_itself_for_mismatched_heights():
-    block = get_example_genesis_block()
-    block.height = 1
+    genesis = get_example_genesis_block()
+    coinbase = genesis.transactions[0]
+
+    # the genesis block's header (height 0), with a coinbase transaction for height 1
+    block = Block(genesis.header, [Transaction(
+        inputs=[Input(coinbase.inputs[0].output_reference, CoinbaseData(1, coinbase.inputs[0].signature.signature))],
+        outputs=coinbase.outputs,
+    )])
 
     with pytest.raises(ValidateBlockError, match=".*height.*"):
         validate_block_by_itself(block, 1615209942)
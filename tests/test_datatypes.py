@@ -1,3 +1,7 @@
+import pytest
+
+from skepticoin.hash import sha256d
+from skepticoin.serialization import DeserializationError
 from skepticoin.signing import SECP256k1Signature, SECP256k1PublicKey
 from skepticoin.datatypes import (
     Block,
@@ -101,3 +105,139 @@ def test_block_serialization():
     )
 
     serialize_and_deserialize(block)
+
+
+def test_block_serialization_is_cached_when_deserialized():
+    block = Block(
+        header=BlockHeader(
+            summary=example_block_summary,
+            pow_evidence=example_pow_evidence,
+        ),
+        transactions=[Transaction(
+            inputs=[Input(output_reference=OutputReference(b"b" * 32, 1234), signature=SECP256k1Signature(b"b" * 64))],
+            outputs=[Output(value=1582, public_key=SECP256k1PublicKey(b"g" * 64))],
+        )] * 2,
+    )
+    assert block.cached_serialized is None
+
+    serialized = block.serialize()
+    other_block = Block.deserialize(serialized)
+
+    assert other_block.cached_serialized == serialized
+    assert other_block.serialize() is other_block.cached_serialized
+    assert other_block.hash() == block.hash()
+
+    for transaction, other_transaction in zip(block.transactions, other_block.transactions):
+        assert other_transaction.serialize() == transaction.serialize()
+        assert other_transaction.hash() == transaction.hash()
+
+
+def test_block_cache_is_dropped_when_header_is_assigned():
+    block = Block(
+        header=BlockHeader(
+            summary=example_block_summary,
+            pow_evidence=example_pow_evidence,
+        ),
+        transactions=[Transaction(
+            inputs=[Input(output_reference=OutputReference(b"b" * 32, 1234), signature=SECP256k1Signature(b"b" * 64))],
+            outputs=[Output(value=1582, public_key=SECP256k1PublicKey(b"g" * 64))],
+        )],
+    )
+    other_block = Block.deserialize(block.serialize())
+    other_header = BlockHeader(
+        summary=BlockSummary(
+            height=example_block_summary.height + 1,
+            previous_block_hash=example_block_summary.previous_block_hash,
+            merkle_root_hash=example_block_summary.merkle_root_hash,
+            timestamp=example_block_summary.timestamp,
+            target=example_block_summary.target,
+            nonce=example_block_summary.nonce,
+        ),
+        pow_evidence=example_pow_evidence,
+    )
+
+    other_block.header = other_header
+
+    assert other_block.cached_serialized is None
+    assert other_block.hash() == other_header.hash()
+    assert other_block.transactions == block.transactions
+    assert other_block.serialize() == Block(other_header, block.transactions).serialize()
+
+
+def test_block_transactions_are_decoded_lazily():
+    block = Block(
+        header=BlockHeader(
+            summary=example_block_summary,
+            pow_evidence=example_pow_evidence,
+        ),
+        transactions=[Transaction(
+            inputs=[Input(output_reference=OutputReference(b"b" * 32, 1234), signature=SECP256k1Signature(b"b" * 64))],
+            outputs=[Output(value=1582, public_key=SECP256k1PublicKey(b"g" * 64))],
+        )] * 2,
+    )
+
+    other_block = Block.deserialize(block.serialize())
+    assert other_block._transactions is None
+
+    assert other_block.height == block.height
+    assert other_block.hash() == block.hash()
+    assert other_block._transactions is None  # the header suffices for the above
+
+    assert other_block.transactions == block.transactions
+    assert other_block._transactions is not None
+
+    other_block.transactions = []
+    assert other_block.transactions == []
+    assert other_block.serialize() == Block(block.header, []).serialize()
+    assert Block.deserialize(other_block.serialize()).transactions == []
+
+
+def test_block_deserialize_checks_lazy_transactions():
+    transaction = Transaction(
+        inputs=[Input(output_reference=OutputReference(b"b" * 32, 1234), signature=SECP256k1Signature(b"b" * 64))],
+        outputs=[Output(value=1582, public_key=SECP256k1PublicKey(b"g" * 64))],
+    )
+    block = Block(
+        header=BlockHeader(
+            summary=example_block_summary,
+            pow_evidence=example_pow_evidence,
+        ),
+        transactions=[transaction],
+    )
+
+    serialized = block.serialize()
+    signature_type_offset = len(serialized) - len(transaction.serialize()) + 1 + 1 + 36
+    assert serialized[signature_type_offset:signature_type_offset + 1] == b'\x02'
+
+    with pytest.raises(DeserializationError):
+        Block.deserialize(serialized[:signature_type_offset] + b'\x07' + serialized[signature_type_offset + 1:])
+
+
+def test_transaction_signable_message():
+    trans = Transaction(
+        inputs=[
+            Input(output_reference=OutputReference(b"b" * 32, 1234), signature=SECP256k1Signature(b"b" * 64)),
+            Input(output_reference=OutputReference(b"c" * 32, 0), signature=SECP256k1Signature(b"c" * 64)),
+        ],
+        outputs=[Output(value=1582, public_key=SECP256k1PublicKey(b"g" * 64))],
+    )
+
+    message = trans.signable_message()
+    assert message == trans.signable_equivalent().serialize()
+    assert trans.signable_message() is message  # computed once
+
+    # signatures are not part of what is signed
+    other_trans = Transaction.deserialize(trans.serialize())
+    other_trans.inputs[0].signature = SECP256k1Signature(b"x" * 64)
+    assert other_trans.signable_message() == message
+
+
+def test_transaction_sighash():
+    trans = Transaction(
+        inputs=[Input(output_reference=OutputReference(b"b" * 32, 1234), signature=SECP256k1Signature(b"b" * 64))],
+        outputs=[Output(value=1582, public_key=SECP256k1PublicKey(b"g" * 64))],
+    )
+
+    sighash = trans.sighash()
+    assert sighash == sha256d(trans.signable_message())
+    assert trans.sighash() is sighash  # computed once
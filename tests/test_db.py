@@ -1,9 +1,33 @@
-from skepticoin.blockstore import BlockStore
+from pathlib import Path
+import sqlite3
+
+import pytest
+
+from skepticoin import blockstore
+from skepticoin.blockfile import BlockFile
+from skepticoin.blockstore import BlockStore, DefaultBlockStore
 from skepticoin.coinstate import CoinState
+from skepticoin.datatypes import Block, Input, Output, OutputReference, Transaction
 from skepticoin.humans import human
 import os
+import shutil
+
+from skepticoin.networking import disk_interface
+from skepticoin.scripts.utils import (
+    configure_block_store_from_args, DefaultArgumentParser, open_or_init_wallet, read_chain_from_disk,
+)
+from skepticoin.signing import PublicKey, SECP256k1PublicKey, SECP256k1Signature
+from test_coinstate import _unvalidated_block
 
-from skepticoin.scripts.utils import open_or_init_wallet
+CHAIN_TESTDATA_PATH = Path(__file__).parent.joinpath("testdata/chain")
+
+
+def _testdata_blocks():
+    blocks = []
+    for file_path in sorted(CHAIN_TESTDATA_PATH.iterdir()):
+        with open(file_path, 'rb') as f:
+            blocks.append(Block.stream_deserialize(f))
+    return blocks
 
 
 def test_db():
@@ -38,3 +62,499 @@ def test_db():
     assert wallet.get_balance(coinstate) == 0
 
     db.close()
+
+
+def test_read_blocks_from_disk_in_chunks(monkeypatch):
+    blocks = _testdata_blocks()
+
+    db = BlockStore(path=':memory:')  # includes the genesis block
+    db.write_blocks_to_disk(blocks)
+
+    monkeypatch.setattr(blockstore, 'READ_BLOCKS_CHUNK_SIZE', 2)
+
+    read_blocks = list(db.read_blocks_from_disk())
+    assert [block.height for block in read_blocks] == [0, 1, 2, 3, 4, 5]
+    assert [block.serialize() for block in read_blocks[1:]] == [block.serialize() for block in blocks]
+
+    assert [block.height for block in db.read_blocks_from_disk(start_height=3)] == [3, 4, 5]
+    assert [block.height for block in db.read_blocks_from_disk(start_height=1, end_height=4)] == [1, 2, 3]
+    assert list(db.read_blocks_from_disk(start_height=6)) == []
+
+    db.close()
+
+
+def test_block_file(tmp_path):
+    blocks = _testdata_blocks()
+
+    db = BlockStore(path=':memory:')
+    db.write_blocks_to_disk(blocks[:3])
+
+    # blocks that were written before the BlockFile was in use are added to it when they're read
+    db.block_file = BlockFile(str(tmp_path))
+    assert [block.height for block in db.read_blocks_from_disk()] == [0, 1, 2, 3]
+    db.flush_blocks_to_disk(wait=True)  # (by the writer thread)
+    assert len(db.block_file) == 4
+
+    db.write_blocks_to_disk(blocks[3:])
+    assert len(db.block_file) == 6
+    assert bytes(db.get_raw_block(blocks[4].hash())) == blocks[4].serialize()
+
+    assert [block.serialize() for block in db.read_blocks_from_disk()][1:] == [block.serialize() for block in blocks]
+
+    db.close()
+
+
+def test_block_file_is_checked(tmp_path):
+    blocks = _testdata_blocks()
+
+    db = BlockStore(path=':memory:', block_file_path=str(tmp_path))
+    db.write_blocks_to_disk(blocks[:1])
+    # bytes that are not the block they're stored as
+    db.block_file.append(blocks[1].hash(), blocks[1].height, blocks[2].serialize())
+    db.write_blocks_to_disk(blocks[1:3])
+
+    assert db.get_raw_block(blocks[1].hash()) is None
+    assert [block.hash() for block in db.read_blocks_from_disk(1)] == [block.hash() for block in blocks[:3]]
+    assert [block.serialize() for block in db.read_blocks_from_disk(1)] == [block.serialize() for block in blocks[:3]]
+
+    coinstate = CoinState.empty(block_file=db.block_file)
+    assert coinstate.serialized_block(blocks[1]) == blocks[1].serialize()
+    assert isinstance(coinstate.serialized_block(blocks[2]), memoryview)
+
+    db.close()
+
+
+def test_background_writer():
+    blocks = _testdata_blocks()
+
+    db = BlockStore(path=':memory:')
+
+    for block in blocks:
+        db.add_block_to_buffer(block)
+        db.flush_blocks_to_disk(wait=False)
+
+    db.flush_blocks_to_disk(wait=True)
+    assert db.write_queue.empty()
+    assert db.connection.execute("select count(*) from chain").fetchone()[0] == 6
+
+    writer_thread = db.writer_thread
+    db.close()
+    assert not writer_thread.is_alive()
+
+    # nothing to write: no writer thread
+    db = BlockStore(path=':memory:')
+    db.flush_blocks_to_disk(wait=True)
+    assert db.writer_thread is None
+    db.close()
+
+
+def test_background_writer_error(monkeypatch):
+    blocks = _testdata_blocks()
+
+    db = BlockStore(path=':memory:')
+
+    def write_blocks_to_disk(blocks):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(db, 'write_blocks_to_disk', write_blocks_to_disk)
+
+    db.add_block_to_buffer(blocks[0])
+    with pytest.raises(sqlite3.OperationalError):
+        db.flush_blocks_to_disk(wait=True)
+
+    # once writing has failed, nothing more is written, and the error is raised again
+    monkeypatch.undo()
+    db.add_block_to_buffer(blocks[0])
+    with pytest.raises(sqlite3.OperationalError):
+        db.flush_blocks_to_disk(wait=False)
+    with pytest.raises(sqlite3.OperationalError):
+        db.close()
+
+    assert db.connection is None
+
+
+def test_background_writer_utxo_set_error(monkeypatch):
+    blocks = _testdata_blocks()
+
+    db = BlockStore(path=':memory:')
+
+    def connect_block(cur, block):
+        raise Exception("Output spent in block %s is not in the UTXO set" % block.hash().hex())
+
+    monkeypatch.setattr(db, 'connect_block', connect_block)
+
+    for block in blocks[:3]:
+        db.add_block_to_buffer(block)
+    db.set_utxo_head(blocks[2].hash())
+    db.flush_blocks_to_disk(wait=True)
+
+    # the blocks are written nonetheless; the UTXO set is left as it was, and known to be stale
+    assert db.connection.execute("select count(*) from chain").fetchone()[0] == 4
+    assert db.get_utxo_head() is None
+    assert db.utxo_set_error is not None
+
+    # later blocks are written too, and the UTXO set is brought along again once that works
+    monkeypatch.undo()
+    for block in blocks[3:]:
+        db.add_block_to_buffer(block)
+    db.set_utxo_head(blocks[-1].hash())
+    db.flush_blocks_to_disk(wait=True)
+
+    assert db.connection.execute("select count(*) from chain").fetchone()[0] == 6
+    assert db.get_utxo_head() == blocks[-1].hash()
+    assert db.utxo_set_error is None
+
+    db.close()
+
+
+def test_wal_read_pool(tmp_path):
+    blocks = _testdata_blocks()
+
+    db = BlockStore(path=str(tmp_path / 'wal.db'), wal=True)
+    assert db.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    for block in blocks:
+        db.add_block_to_buffer(block)
+    db.flush_blocks_to_disk(wait=True)
+
+    # queries run on (pooled) read-only connections, which see what the writer has committed
+    with db.read_connection() as connection:
+        assert connection is not db.connection
+        assert connection.execute("select count(*) from chain").fetchone()[0] == 6
+
+        with pytest.raises(sqlite3.OperationalError):
+            connection.execute("delete from chain")
+
+    assert [block.height for block in db.read_blocks_from_disk()] == [0, 1, 2, 3, 4, 5]
+    assert db.n_read_connections <= blockstore.READ_POOL_SIZE
+
+    db.close()
+
+
+def _utxos(db):
+    return {
+        OutputReference(transaction_hash, seq): Output(value, PublicKey.deserialize(public_key))
+        for (transaction_hash, seq, value, public_key) in db.connection.execute(
+            "select transaction_hash, seq, value, public_key from utxos")
+    }
+
+
+def _chain_with_fork(public_key):
+    blocks = _testdata_blocks()
+
+    # a fork off block 3, which spends block 1's coinbase output (both in the first block, and within that block)
+    spend = Transaction([Input(OutputReference(blocks[0].transactions[0].hash(), 0), SECP256k1Signature(b'y' * 64))],
+                        [Output(blocks[0].transactions[0].outputs[0].value, public_key)])
+    spend_again = Transaction([Input(OutputReference(spend.hash(), 0), SECP256k1Signature(b'y' * 64))],
+                              [Output(spend.outputs[0].value, public_key)])
+    fork_4 = _unvalidated_block(blocks[2], public_key, [spend, spend_again], nonce=1)
+    fork_5 = _unvalidated_block(fork_4, public_key, nonce=1)
+    fork_6 = _unvalidated_block(fork_5, public_key, nonce=1)
+
+    return blocks, [fork_4, fork_5, fork_6], spend, spend_again
+
+
+def test_utxo_set():
+    public_key = SECP256k1PublicKey(b'x' * 64)
+    blocks, [fork_4, fork_5, fork_6], spend, spend_again = _chain_with_fork(public_key)
+
+    coinstate = CoinState.zero()
+    for block in blocks + [fork_4, fork_5, fork_6]:
+        coinstate = coinstate.add_block_no_validation(block)
+
+    db = BlockStore(path=':memory:')
+    assert db.get_utxo_head() is None
+
+    for block in blocks + [fork_4, fork_5]:
+        db.add_block_to_buffer(block)
+
+    db.set_utxo_head(blocks[4].hash())
+    db.flush_blocks_to_disk(wait=True)
+    assert db.get_utxo_head() == blocks[4].hash()
+    assert _utxos(db) == dict(coinstate.unspent_transaction_outs_by_hash[blocks[4].hash()])
+
+    # a reorg, to a block that's not written yet
+    db.set_utxo_head(fork_6.hash())
+    db.flush_blocks_to_disk(wait=True)
+    assert db.get_utxo_head() == blocks[4].hash()
+
+    db.add_block_to_buffer(fork_6)
+    db.flush_blocks_to_disk(wait=True)
+    assert db.get_utxo_head() == fork_6.hash()
+    assert _utxos(db) == dict(coinstate.unspent_transaction_outs_by_hash[fork_6.hash()])
+
+    assert not db.is_unspent(spend.inputs[0].output_reference)
+    assert db.get_unspent_output(OutputReference(spend_again.hash(), 0)) == spend_again.outputs[0]
+
+    # ... and back
+    db.set_utxo_head(blocks[4].hash())
+    db.flush_blocks_to_disk(wait=True)
+    assert _utxos(db) == dict(coinstate.unspent_transaction_outs_by_hash[blocks[4].hash()])
+    assert db.connection.execute("select count(*) from utxo_undo").fetchone()[0] == 0
+
+    db.close()
+
+
+def test_catch_up_utxo_set(monkeypatch):
+    public_key = SECP256k1PublicKey(b'x' * 64)
+    blocks, fork, spend, spend_again = _chain_with_fork(public_key)
+
+    coinstate = CoinState.zero()
+    for block in blocks + fork:
+        coinstate = coinstate.add_block_no_validation(block)
+
+    monkeypatch.setattr(blockstore, 'UTXO_UPDATE_MAX_BLOCKS', 3)
+    monkeypatch.setattr(blockstore, 'UTXO_CATCH_UP_CHUNK_SIZE', 2)
+
+    db = BlockStore(path=':memory:')
+    for block in blocks + fork:
+        db.add_block_to_buffer(block)
+
+    # too far for the writer thread
+    db.set_utxo_head(fork[-1].hash())
+    db.flush_blocks_to_disk(wait=True)
+    assert db.get_utxo_head() is None
+
+    db.catch_up_utxo_set(fork[0].hash())
+    assert db.get_utxo_head() == fork[0].hash()
+    assert _utxos(db) == dict(coinstate.unspent_transaction_outs_by_hash[fork[0].hash()])
+
+    # only forward, i.e. not across a fork; that's up to the writer thread (which is close enough now)
+    db.catch_up_utxo_set(blocks[-1].hash())
+    assert db.get_utxo_head() == fork[0].hash()
+
+    db.set_utxo_head(blocks[-1].hash())
+    db.flush_blocks_to_disk(wait=True)
+    assert db.get_utxo_head() == blocks[-1].hash()
+    assert _utxos(db) == dict(coinstate.unspent_transaction_outs_by_hash[blocks[-1].hash()])
+
+    db.close()
+
+
+def test_address_index():
+    public_key = SECP256k1PublicKey(b'x' * 64)
+    blocks, fork, spend, spend_again = _chain_with_fork(public_key)
+    miner_public_key = blocks[0].transactions[0].outputs[0].public_key
+
+    db = BlockStore(path=':memory:')
+    for block in blocks + fork:
+        db.add_block_to_buffer(block)
+    db.set_utxo_head(fork[-1].hash())
+    db.flush_blocks_to_disk(wait=True)
+
+    history = db.get_address_history(public_key)
+    assert [output.height for output in history] == [4, 4, 4, 5, 6]
+    assert history[1] == (OutputReference(spend.hash(), 0), spend.outputs[0].value, 4, spend_again.hash())
+
+    unspent = db.get_address_unspent_outputs(public_key)
+    assert [output.output_reference for output in unspent] == [
+        OutputReference(fork[0].transactions[0].hash(), 0),
+        OutputReference(spend_again.hash(), 0),
+        OutputReference(fork[1].transactions[0].hash(), 0),
+        OutputReference(fork[2].transactions[0].hash(), 0),
+    ]
+    assert db.get_address_balance(public_key) == sum(output.value for output in unspent)
+
+    miner_history = db.get_address_history(miner_public_key)
+    assert miner_history[0].spent_in == spend.hash()
+
+    # on a reorg, the spent outputs are unspent again
+    db.set_utxo_head(blocks[-1].hash())
+    db.flush_blocks_to_disk(wait=True)
+    assert db.get_address_balances([public_key, miner_public_key]) == {
+        public_key: 0,
+        miner_public_key: sum(block.transactions[0].outputs[0].value for block in blocks
+                              if block.transactions[0].outputs[0].public_key == miner_public_key),
+    }
+    assert db.get_address_history(miner_public_key)[0].spent_in is None
+
+    db.close()
+
+
+def test_get_address_balances_at(tmp_path):
+    public_key = SECP256k1PublicKey(b'x' * 64)
+    blocks, fork, spend, spend_again = _chain_with_fork(public_key)
+
+    db = BlockStore(path=str(tmp_path / 'chain.db'), wal=True)
+    for block in blocks + fork:
+        db.add_block_to_buffer(block)
+    db.set_utxo_head(fork[-1].hash())
+    db.flush_blocks_to_disk(wait=True)
+
+    balances = db.get_address_balances([public_key])
+    assert balances[public_key] > 0
+    assert db.get_address_balances_at([public_key], fork[-1].hash()) == balances
+
+    # the address index isn't at the requested block
+    assert db.get_address_balances_at([public_key], blocks[-1].hash()) is None
+
+    db.close()
+
+
+def test_get_block_and_transaction(monkeypatch, tmp_path):
+    public_key = SECP256k1PublicKey(b'x' * 64)
+    blocks, fork, spend, spend_again = _chain_with_fork(public_key)
+
+    for block_file_path in [None, str(tmp_path / 'blocks')]:
+        db = BlockStore(path=':memory:', block_file_path=block_file_path)
+        db.write_blocks_to_disk(blocks + fork[:1])
+
+        assert db.get_block(blocks[1].hash()).serialize() == blocks[1].serialize()
+        assert db.get_block(b'\x01' * 32) is None
+
+        # at height 4, the block that was built on is preferred over the fork
+        assert db.get_block_at_height(4).hash() == blocks[3].hash()
+        assert db.get_block_at_height(0).height == 0
+        assert db.get_block_at_height(9) is None
+
+        assert db.get_transaction_block_hash(spend.hash()) == fork[0].hash()
+        assert db.get_transaction(spend.hash()).serialize() == spend.serialize()
+        assert db.get_transaction(blocks[0].transactions[0].hash()) == blocks[0].transactions[0]
+        assert db.get_transaction(b'\x01' * 32) is None
+
+        # decoded objects are cached, up to OBJECT_CACHE_SIZE of them
+        assert db.get_transaction(spend.hash()) is db.get_transaction(spend.hash())
+        monkeypatch.setattr(blockstore, 'OBJECT_CACHE_SIZE', 2)
+        db.get_block(blocks[2].hash())
+        db.get_block(blocks[4].hash())
+        assert list(db.object_cache) == [blocks[2].hash(), blocks[4].hash()]
+        monkeypatch.undo()
+
+        db.close()
+
+
+def test_pruned(tmp_path):
+    blocks = _testdata_blocks()
+
+    with pytest.raises(ValueError):
+        BlockStore(path=':memory:', prune_depth=2)
+
+    # a full store, written without a BlockFile
+    db = BlockStore(path=str(tmp_path / 'chain.db'))
+    db.write_blocks_to_disk(blocks[:-1])
+    db.close()
+
+    # ... which is pruned once it's opened in pruned mode and a block is written
+    db = BlockStore(path=str(tmp_path / 'chain.db'), block_file_path=str(tmp_path / 'blocks'), prune_depth=2)
+    db.add_block_to_buffer(blocks[-1])
+    db.set_utxo_head(blocks[-1].hash())
+    db.flush_blocks_to_disk(wait=True)
+
+    assert db.get_pruned_height() == 3
+    assert [height for (height,) in db.connection.execute(
+        "select c.height from transaction_locator t join chain c on t.block_hash = c.block_hash order by c.height")] \
+        == [3, 4, 5]
+
+    # headers, serialized blocks and the UTXO set are all still there
+    assert [block.hash() for block in db.read_blocks_from_disk(1)] == [block.hash() for block in blocks]
+    assert db.get_block(blocks[0].hash()).serialize() == blocks[0].serialize()
+    assert db.get_transaction(blocks[0].transactions[0].hash()) is None  # pruned
+    assert db.is_unspent(OutputReference(blocks[0].transactions[0].hash(), 0))
+
+    db.close()
+
+
+def test_default_block_store(monkeypatch):
+    monkeypatch.setattr(DefaultBlockStore, '_instance', None)
+    monkeypatch.setattr(DefaultBlockStore, 'path', DefaultBlockStore.path)
+    monkeypatch.setattr(DefaultBlockStore, 'block_file_path', DefaultBlockStore.block_file_path)
+
+    DefaultBlockStore.configure(path=':memory:')
+    assert not DefaultBlockStore.is_open()
+
+    db = DefaultBlockStore.get()
+    assert DefaultBlockStore.get() is db
+    assert db.block_file is None
+    assert [block.height for block in db.read_blocks_from_disk()] == [0]
+
+    with pytest.raises(Exception):
+        DefaultBlockStore.configure(path='other.db')
+
+    DefaultBlockStore.close()
+    assert not DefaultBlockStore.is_open()
+
+
+def test_block_store_arguments(monkeypatch):
+    monkeypatch.setattr(DefaultBlockStore, '_instance', None)
+    monkeypatch.setattr(DefaultBlockStore, 'path', DefaultBlockStore.path)
+    monkeypatch.setattr(DefaultBlockStore, 'block_file_path', DefaultBlockStore.block_file_path)
+    monkeypatch.setattr(DefaultBlockStore, 'read_only', DefaultBlockStore.read_only)
+    monkeypatch.setattr(DefaultBlockStore, 'prune_depth', DefaultBlockStore.prune_depth)
+
+    configure_block_store_from_args(DefaultArgumentParser().parse_args(
+        ['--chain-db', 'other.db', '--read-only', '--prune-depth', '10']))
+    assert (DefaultBlockStore.path, DefaultBlockStore.read_only, DefaultBlockStore.prune_depth) == \
+        ('other.db', True, 10)
+
+    configure_block_store_from_args(DefaultArgumentParser().parse_args([]))
+    assert (DefaultBlockStore.path, DefaultBlockStore.read_only, DefaultBlockStore.prune_depth) == \
+        ('chain.db', False, None)
+
+
+def test_snapshot_is_tied_to_block_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(DefaultBlockStore, '_instance', None)
+    monkeypatch.setattr(DefaultBlockStore, 'path', DefaultBlockStore.path)
+    monkeypatch.setattr(DefaultBlockStore, 'block_file_path', DefaultBlockStore.block_file_path)
+    monkeypatch.setattr(disk_interface, 'SNAPSHOT_DEPTH', 2)
+
+    blocks = _testdata_blocks()
+
+    DefaultBlockStore.configure(path='a.db')
+    DefaultBlockStore.get().write_blocks_to_disk(blocks)
+    coinstate = read_chain_from_disk()
+    disk_interface.DiskInterface().save_snapshot(coinstate)
+
+    # the snapshot (at height 3), which is kept next to the database, is used; the blocks above it are replayed
+    assert os.path.isfile('a.db.snapshot')
+    assert read_chain_from_disk().current_chain_hash == coinstate.current_chain_hash
+    DefaultBlockStore.close()
+
+    # another block store (with just the genesis block), with a copy of the snapshot: the snapshot is ignored
+    shutil.copy('a.db.snapshot', 'b.db.snapshot')
+    DefaultBlockStore.configure(path='b.db')
+    assert read_chain_from_disk().head().height == 0
+    DefaultBlockStore.close()
+
+
+def test_read_only(tmp_path):
+    blocks = _testdata_blocks()
+
+    db = BlockStore(path=str(tmp_path / 'chain.db'))
+    db.write_blocks_to_disk(blocks)
+    db.close()
+
+    with pytest.raises(sqlite3.OperationalError):
+        BlockStore(path=str(tmp_path / 'other.db'), read_only=True)
+    assert not os.path.exists(str(tmp_path / 'other.db'))
+
+    db = BlockStore(path=str(tmp_path / 'chain.db'), read_only=True)
+    assert [block.height for block in db.read_blocks_from_disk()] == [0, 1, 2, 3, 4, 5]
+
+    with pytest.raises(Exception):
+        db.add_block_to_buffer(blocks[0])
+    with pytest.raises(sqlite3.OperationalError):
+        db.connection.execute("delete from chain")
+
+    db.close()
+
+
+def test_decoding(monkeypatch):
+    blocks = _testdata_blocks()
+
+    signature = SECP256k1Signature(b'y' * 64)
+    assert blockstore.decode_signature(signature.serialize()) == signature
+    coinbase_signature = blocks[0].transactions[0].inputs[0].signature
+    assert blockstore.decode_signature(coinbase_signature.serialize()) == coinbase_signature
+
+    interned = {}
+    public_key = blockstore.decode_public_key(SECP256k1PublicKey(b'x' * 64).serialize(), interned)
+    assert public_key == SECP256k1PublicKey(b'x' * 64)
+    assert blockstore.decode_public_key(SECP256k1PublicKey(b'x' * 64).serialize(), interned) is public_key
+
+    # reading from the relational tables, fetching rows in (very) small batches
+    monkeypatch.setattr(blockstore, 'FETCH_BATCH_SIZE', 2)
+    db = BlockStore(path=':memory:')
+    db.write_blocks_to_disk(blocks)
+    assert [block.serialize() for block in db.read_blocks_from_disk(1)] == [block.serialize() for block in blocks]
+    db.close()
@@ -1,5 +1,25 @@
 from io import BytesIO
-from skepticoin.serialization import stream_deserialize_vlq, stream_serialize_vlq
+from pathlib import Path
+
+import pytest
+
+from skepticoin.datatypes import Block, Input, Output, OutputReference, Transaction
+from skepticoin.networking.messages import DATA_BLOCK, DataMessage, GetDataMessage, Message, MessageHeader
+from skepticoin.serialization import (
+    DESERIALIZE_STREAM,
+    DESERIALIZE_VIEW,
+    DeserializationError,
+    Serializable,
+    SerializationTruncationError,
+    serialize_list,
+    stream_deserialize_vlq,
+    stream_serialize_vlq,
+    view_deserialize_list,
+    view_deserialize_vlq,
+)
+from skepticoin.signing import CoinbaseData, SECP256k1PublicKey, SECP256k1Signature, SignableEquivalent
+
+CHAIN_TESTDATA_PATH = Path(__file__).parent.joinpath("testdata/chain")
 
 
 def test_vlq():
@@ -10,3 +30,93 @@ def test_vlq():
 
         f.seek(0)
         assert stream_deserialize_vlq(f) == i
+
+        assert view_deserialize_vlq(memoryview(b'x' + f.getvalue()), 1) == (i, 1 + len(f.getvalue()))
+
+
+def test_vlq_non_canonical():
+    # each of these decodes to a number that stream_serialize_vlq encodes differently
+    for non_canonical in [b'\x80\x00', b'\x80\x01', b'\x7f', b'\x80\x80\x7f', b'\x80\x81\x00']:
+        with pytest.raises(DeserializationError):
+            stream_deserialize_vlq(BytesIO(non_canonical))
+
+        with pytest.raises(DeserializationError):
+            view_deserialize_vlq(memoryview(non_canonical), 0)
+
+    # a list whose length is encoded non-canonically
+    serialized = serialize_list([OutputReference(b'x' * 32, 0)])
+    with pytest.raises(DeserializationError):
+        view_deserialize_list(memoryview(b'\x80' + serialized), 0, OutputReference)
+
+
+def test_deserializers_are_equivalent(monkeypatch):
+    serialized_blocks = [open(file_path, 'rb').read() for file_path in sorted(CHAIN_TESTDATA_PATH.iterdir())]
+
+    monkeypatch.setattr(Serializable, "deserializer", DESERIALIZE_STREAM)
+    stream_blocks = [Block.deserialize(data) for data in serialized_blocks]
+
+    monkeypatch.setattr(Serializable, "deserializer", DESERIALIZE_VIEW)
+    view_blocks = [Block.deserialize(data) for data in serialized_blocks]
+
+    for data, stream_block, view_block in zip(serialized_blocks, stream_blocks, view_blocks):
+        assert view_block == stream_block
+        assert view_block.hash() == stream_block.hash()
+        assert view_block.serialize() == stream_block.serialize() == data
+        assert view_block.serialize() is data  # not copied
+
+        for stream_transaction, view_transaction in zip(stream_block.transactions, view_block.transactions):
+            assert view_transaction.hash() == stream_transaction.hash()
+            assert view_transaction.serialize() == stream_transaction.serialize()
+            assert Transaction.deserialize(view_transaction.serialize()) == stream_transaction
+
+        # in the middle of a larger buffer
+        assert Block.view_deserialize(memoryview(b'xx' + data + b'yy'), 2) == (stream_block, 2 + len(data))
+
+
+def test_deserializers_are_equivalent_for_all_signature_types(monkeypatch):
+    transaction = Transaction(
+        inputs=[
+            Input(OutputReference(b"a" * 32, 0), SECP256k1Signature(b"b" * 64)),
+            Input(OutputReference(b"c" * 32, 1), CoinbaseData(2, b"random data")),
+            Input(OutputReference(b"d" * 32, 0xffffffff), SignableEquivalent()),
+        ],
+        outputs=[Output(i, SECP256k1PublicKey(bytes([i]) * 64)) for i in range(200)],  # a multi-byte VLQ
+    )
+    data = transaction.serialize()
+
+    monkeypatch.setattr(Serializable, "deserializer", DESERIALIZE_STREAM)
+    stream_transaction = Transaction.deserialize(data)
+
+    monkeypatch.setattr(Serializable, "deserializer", DESERIALIZE_VIEW)
+    view_transaction = Transaction.deserialize(data)
+
+    assert view_transaction == stream_transaction == transaction
+    assert view_transaction.hash() == stream_transaction.hash() == transaction.hash()
+    assert view_transaction.serialize() == data
+
+
+@pytest.mark.parametrize("deserializer", [DESERIALIZE_STREAM, DESERIALIZE_VIEW])
+def test_deserializers_truncated(monkeypatch, deserializer):
+    monkeypatch.setattr(Serializable, "deserializer", deserializer)
+    data = open(sorted(CHAIN_TESTDATA_PATH.iterdir())[0], 'rb').read()
+
+    for length in range(len(data)):
+        with pytest.raises(SerializationTruncationError):
+            Block.deserialize(data[:length])
+
+
+def test_view_deserialize_messages():
+    block = Block.deserialize(open(sorted(CHAIN_TESTDATA_PATH.iterdir())[0], 'rb').read())
+    header = MessageHeader(1615209942, 1, 2, 3)
+
+    for message in [DataMessage(DATA_BLOCK, block), GetDataMessage(DATA_BLOCK, block.hash())]:
+        view = memoryview(header.serialize() + message.serialize())
+
+        view_header, offset = MessageHeader.view_deserialize(view, 0)
+        view_message, end = Message.view_deserialize(view, offset)
+
+        assert end == len(view)
+        assert (view_header.timestamp, view_header.id, view_header.in_response_to, view_header.context) == (
+            1615209942, 1, 2, 3)
+        assert type(view_message) is type(message)
+        assert view_message.serialize() == message.serialize()
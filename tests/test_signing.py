@@ -1,5 +1,10 @@
+import ecdsa
+import pytest
+
+from skepticoin.hash import sha256d
 from skepticoin.signing import (
-    PublicKey, SignableEquivalent, CoinbaseData, Signature, SECP256k1Signature, SECP256k1PublicKey)
+    PublicKey, SignableEquivalent, CoinbaseData, Signature, SECP256k1Signature, SECP256k1PublicKey,
+    VerifiedSignatureCache, verified_signature_cache)
 
 
 def serialize_and_deserialize(thing, clz):
@@ -31,3 +36,50 @@ def test_signature_serialization():
 def test_publickey_serialization():
     pk = SECP256k1PublicKey(b"5" * 64)
     serialize_and_deserialize(pk, PublicKey)
+
+
+def test_verified_signature_cache():
+    verified_signature_cache.clear()
+
+    sk = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
+    public_key = SECP256k1PublicKey(sk.get_verifying_key().to_string())
+    signature = SECP256k1Signature(sk.sign(b"message"))
+
+    assert public_key.validate(signature, b"message")
+    assert (verified_signature_cache.hits, verified_signature_cache.misses) == (0, 1)
+
+    assert public_key.validate(signature, b"message")
+    assert (verified_signature_cache.hits, verified_signature_cache.misses) == (1, 1)
+
+    # failed verifications are not cached (and don't match the cached successful one)
+    assert not public_key.validate(signature, b"other message")
+    assert not public_key.validate(signature, b"other message")
+    assert (verified_signature_cache.hits, verified_signature_cache.misses) == (1, 3)
+
+    verified_signature_cache.clear()
+
+
+def test_validate_asserts_sighash():
+    sk = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
+    public_key = SECP256k1PublicKey(sk.get_verifying_key().to_string())
+    signature = SECP256k1Signature(sk.sign(b"message"))
+
+    assert public_key.validate(signature, b"message", sha256d(b"message"))
+
+    # a sighash of another message could otherwise hit the cache entry for this one
+    with pytest.raises(AssertionError):
+        public_key.validate(signature, b"other message", sha256d(b"message"))
+
+    verified_signature_cache.clear()
+
+
+def test_verified_signature_cache_is_bounded():
+    cache = VerifiedSignatureCache(2)
+    cache.add((b"k", b"1", b"s"))
+    cache.add((b"k", b"2", b"s"))
+    assert (b"k", b"1", b"s") in cache  # now the most recently used
+
+    cache.add((b"k", b"3", b"s"))
+    assert (b"k", b"1", b"s") in cache
+    assert (b"k", b"2", b"s") not in cache
+    assert (b"k", b"3", b"s") in cache
@@ -0,0 +1,86 @@
+import ecdsa
+
+from skepticoin.hash import sha256d
+from skepticoin.signing import SECP256k1PublicKey, SECP256k1Signature, verified_signature_cache
+from skepticoin.verification import PARALLEL_VERIFICATION_THRESHOLD, SignatureVerifier
+
+
+def make_signature_checks(n):
+    """n checks of distinct valid signatures, each by its own freshly generated key (also used by performance/)."""
+    result = []
+    for i in range(n):
+        sk = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
+        message = i.to_bytes(32, 'big')
+        result.append((
+            SECP256k1Signature(sk.sign(message)), SECP256k1PublicKey(sk.get_verifying_key().to_string()), message,
+            sha256d(message)))
+    return result
+
+
+def _verify(signature_verifier, signature_checks):
+    verified_signature_cache.clear()
+    try:
+        return signature_verifier.verify(signature_checks)
+    finally:
+        verified_signature_cache.clear()
+
+
+def with_bad_signature(signature_checks, index):
+    signature, public_key, message, sighash = signature_checks[index]
+    bad_check = (signature, public_key, b"other message", sha256d(b"other message"))
+    return signature_checks[:index] + [bad_check] + signature_checks[index + 1:]
+
+
+def test_signature_verifier_serial():
+    signature_verifier = SignatureVerifier(max_workers=1)
+    signature_checks = make_signature_checks(3)
+
+    assert _verify(signature_verifier, signature_checks)
+    assert not _verify(signature_verifier, with_bad_signature(signature_checks, 1))
+
+    assert signature_verifier.executor is None
+
+
+def test_signature_verifier_populates_cache():
+    signature_verifier = SignatureVerifier(max_workers=1)
+    signature_checks = make_signature_checks(2)
+
+    verified_signature_cache.clear()
+    try:
+        assert signature_verifier.verify(signature_checks)
+        assert verified_signature_cache.misses == 2
+
+        assert signature_verifier.verify(signature_checks)
+        assert verified_signature_cache.hits == 2
+    finally:
+        verified_signature_cache.clear()
+
+
+def test_signature_verifier_parallel():
+    signature_verifier = SignatureVerifier(max_workers=2)
+    signature_checks = make_signature_checks(PARALLEL_VERIFICATION_THRESHOLD)
+
+    # the pool isn't created until it's started
+    assert _verify(signature_verifier, signature_checks)
+    assert signature_verifier.executor is None
+
+    signature_verifier.start()
+    try:
+        assert _verify(signature_verifier, signature_checks)
+        assert not _verify(signature_verifier, with_bad_signature(signature_checks, len(signature_checks) - 1))
+        assert signature_verifier.executor is not None
+    finally:
+        signature_verifier.shutdown()
+
+
+def test_signature_verifier_shut_down():
+    signature_verifier = SignatureVerifier(max_workers=2)
+    signature_checks = make_signature_checks(PARALLEL_VERIFICATION_THRESHOLD)
+
+    signature_verifier.start()
+    signature_verifier.shutdown()
+
+    # serially, after the pool is gone
+    assert signature_verifier.executor is None
+    assert _verify(signature_verifier, signature_checks)
+    assert not _verify(signature_verifier, with_bad_signature(signature_checks, 0))